@@ -1,11 +1,59 @@
 from picamera2 import Picamera2
 import cv2
+import collections
 import threading
 import time
+from config import (
+    CAMERA_DEFAULT_PROFILE,
+    CAMERA_ENCODE_WORKERS,
+    CAMERA_IDLE_FPS,
+    CAMERA_MOTION_CHECK_FPS,
+    CAMERA_MOTION_THRESHOLD,
+    CAMERA_PROFILES,
+    CAMERA_RAW_QUEUE,
+    CAMERA_RESOLUTION,
+    CAMERA_STATIC_AFTER,
+    CAMERA_STATIC_FPS,
+)
+from frame_broadcaster import FrameBroadcaster
+
+STATS_WINDOW = 120  # Samples kept for the rolling pipeline stats
+PROFILE_KEEPALIVE = 5.0  # Seconds a profile stays encoded after a snapshot asks for it
+MOTION_SIZE = (32, 24)  # Downsampled frame used for the frame-difference motion metric
+
+
+class FrameProfile:
+    """One encoded output of the camera (resolution, JPEG quality, colour) and its published buffer."""
+
+    def __init__(self, name, lock, wait_for_frame, size=None, quality=90, grayscale=False):
+        self.name = name
+        self.size = tuple(size) if size else None
+        self.quality = int(quality)
+        self.grayscale = grayscale
+        self.frame_buffer = None
+        self.frame_seq = 0
+        self.published_at = 0.0
+        self.wanted_until = 0.0
+        self.frame_ready = threading.Condition(lock)
+        self.broadcaster = FrameBroadcaster(lambda last_seq, timeout: wait_for_frame(last_seq, timeout, profile=name))
+        self.frames_encoded = 0
+        self.bytes_encoded = 0
+
+    def encode(self, frame_bgr, resized):
+        """JPEG-encode a BGR frame for this profile. `resized` caches resizes shared between profiles."""
+        if self.size:
+            if self.size not in resized:
+                resized[self.size] = cv2.resize(frame_bgr, self.size, interpolation=cv2.INTER_AREA)
+            frame_bgr = resized[self.size]
+        if self.grayscale:
+            frame_bgr = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
+        _, buffer = cv2.imencode('.jpg', frame_bgr, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return buffer.tobytes()
+
 
 class CameraManager:
     """Singleton class to manage Picamera2 instance and provide a thread-safe frame buffer."""
-    
+
     _instance = None  # Static variable to hold the singleton instance
     _lock = threading.Lock()  # Thread lock for safety
 
@@ -19,32 +67,200 @@ class CameraManager:
         return cls._instance
 
     def _init_camera(self):
-        """Initializes the camera and starts frame capture in a separate thread."""
+        """Initializes the camera and starts the capture and encoder threads."""
         self.camera = Picamera2()
-        self.camera.configure(self.camera.create_video_configuration(main={"size": (640, 480)}))
+        self.camera.configure(self.camera.create_video_configuration(main={"size": CAMERA_RESOLUTION}))
         self.camera.start()
-        
-        self.frame_buffer = None
-        self.lock = threading.Lock()
-        
-        # Start the frame capture thread
-        self.thread = threading.Thread(target=self._update_frame, daemon=True)
+
+        self.lock = threading.Lock()  # Guards only the published buffer swaps
+        self.default_profile = CAMERA_DEFAULT_PROFILE
+        self.profiles = {
+            name: FrameProfile(name, self.lock, self.wait_for_frame, **settings)
+            for name, settings in CAMERA_PROFILES.items()
+        }
+        if self.default_profile not in self.profiles:
+            raise ValueError(f"Default camera profile '{self.default_profile}' is not configured")
+
+        # Bounded ring of raw frames between the capture and encode stages
+        self.raw_frames = collections.deque(maxlen=CAMERA_RAW_QUEUE)
+        self.raw_ready = threading.Condition()
+        self.raw_dropped = 0
+
+        # Adaptive rate control: capture pauses with no viewers and throttles on a static scene
+        self._wake = threading.Event()
+        self.capture_mode = "idle"
+        self.motion_score = 0.0
+        self.frames_skipped = 0
+
+        self._capture_times = collections.deque(maxlen=STATS_WINDOW)
+        self._encode_latencies = collections.deque(maxlen=STATS_WINDOW)
+        self._lock_holds = collections.deque(maxlen=STATS_WINDOW)
+
+        # Start the frame capture thread and the encoder pool
+        self.thread = threading.Thread(target=self._capture_frames, daemon=True)
         self.thread.start()
+        self.encoders = [
+            threading.Thread(target=self._encode_frames, daemon=True)
+            for _ in range(max(1, CAMERA_ENCODE_WORKERS))
+        ]
+        for encoder in self.encoders:
+            encoder.start()
+
+    def _capture_frames(self):
+        """Continuously capture raw frames into the ring, dropping the oldest if encoders fall behind.
 
-    def _update_frame(self):
-        """Continuously capture frames and update the shared buffer."""
+        With no viewers capture drops to CAMERA_IDLE_FPS (or pauses). While the scene is static,
+        frames are only checked for motion at CAMERA_MOTION_CHECK_FPS and passed to the encoders
+        at CAMERA_STATIC_FPS; the first frame that differs goes straight back to full rate.
+        CAMERA_MOTION_CHECK_FPS <= 0 turns this motion gating off.
+        """
+        seq = 0
+        reference = None
+        last_motion = 0.0
+        last_enqueued = 0.0
+        static_interval = 1.0 / CAMERA_STATIC_FPS if CAMERA_STATIC_FPS > 0 else float("inf")
         while True:
-            with self.lock:
-                frame = self.camera.capture_array()
-                frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-                _, buffer = cv2.imencode('.jpg', frame)
-                self.frame_buffer = buffer.tobytes()
-            #time.sleep(0.05) 
-
-    def get_frame(self):
+            if not self._has_demand():
+                self.capture_mode = "idle"
+                self._wake.clear()
+                if not self._has_demand():
+                    self._wake.wait(1.0 / CAMERA_IDLE_FPS if CAMERA_IDLE_FPS > 0 else None)
+
+            frame = self.camera.capture_array()
+            now = time.monotonic()
+            self._capture_times.append(now)
+
+            thumb = cv2.cvtColor(cv2.resize(frame, MOTION_SIZE, interpolation=cv2.INTER_AREA), cv2.COLOR_RGB2GRAY)
+            self.motion_score = float(cv2.absdiff(thumb, reference).mean()) if reference is not None else 255.0
+            if self.motion_score >= CAMERA_MOTION_THRESHOLD:
+                last_motion = now
+            static = CAMERA_MOTION_CHECK_FPS > 0 and now - last_motion > CAMERA_STATIC_AFTER
+            if self._has_demand():
+                self.capture_mode = "static" if static else "motion"
+                if static and now - last_enqueued < static_interval:
+                    self.frames_skipped += 1
+                    time.sleep(1.0 / CAMERA_MOTION_CHECK_FPS)
+                    continue
+
+            reference = thumb
+            last_enqueued = now
+            seq += 1
+            with self.raw_ready:
+                if len(self.raw_frames) == self.raw_frames.maxlen:
+                    self.raw_dropped += 1
+                self.raw_frames.append((seq, frame))
+                self.raw_ready.notify()
+
+    def _has_demand(self):
+        """True while any profile has a stream subscriber or a recent snapshot request."""
+        now = time.monotonic()
+        return any(
+            profile.broadcaster.subscriber_count or profile.wanted_until > now
+            for profile in self.profiles.values()
+        )
+
+    def _active_profiles(self):
+        """Profiles worth encoding right now: the default one, any with subscribers, and any recently snapshotted."""
+        now = time.monotonic()
+        return [
+            profile for name, profile in self.profiles.items()
+            if name == self.default_profile or profile.broadcaster.subscriber_count or profile.wanted_until > now
+        ]
+
+    def _encode_frames(self):
+        """Encoder worker: encode raw frames for every active profile outside the buffer lock, then publish."""
+        while True:
+            with self.raw_ready:
+                self.raw_ready.wait_for(lambda: self.raw_frames)
+                seq, frame = self.raw_frames.popleft()
+            started = time.perf_counter()
+            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+            resized = {}
+            encoded = [(profile, profile.encode(frame, resized)) for profile in self._active_profiles()]
+            self._encode_latencies.append(time.perf_counter() - started)
+            self._publish(seq, encoded)
+
+    def _publish(self, seq, encoded):
+        """Swap in newly encoded frames. Out-of-order results from the pool are discarded."""
+        with self.lock:
+            acquired = time.perf_counter()
+            for profile, jpeg in encoded:
+                if seq > profile.frame_seq:
+                    profile.frame_buffer = jpeg
+                    profile.frame_seq = seq
+                    profile.published_at = time.monotonic()
+                    profile.frames_encoded += 1
+                    profile.bytes_encoded += len(jpeg)
+                    profile.frame_ready.notify_all()
+            self._lock_holds.append(time.perf_counter() - acquired)
+
+    def _profile(self, name=None):
+        """Looks up a profile by name, falling back to the default. Raises KeyError for unknown names."""
+        name = name or self.default_profile
+        if name not in self.profiles:
+            raise KeyError(f"Unknown camera profile '{name}'")
+        return self.profiles[name]
+
+    def get_stats(self):
+        """Returns rolling capture FPS, encode latency, buffer lock hold time and per-profile output."""
+        capture_times = list(self._capture_times)
+        encode = list(self._encode_latencies)
+        holds = list(self._lock_holds)
+        capture_fps = 0.0
+        if len(capture_times) > 1 and capture_times[-1] > capture_times[0]:
+            capture_fps = (len(capture_times) - 1) / (capture_times[-1] - capture_times[0])
+        return {
+            "capture_fps": round(capture_fps, 2),
+            "encode_ms_avg": round(sum(encode) / len(encode) * 1000, 2) if encode else 0.0,
+            "encode_ms_max": round(max(encode) * 1000, 2) if encode else 0.0,
+            "lock_hold_us_avg": round(sum(holds) / len(holds) * 1e6, 2) if holds else 0.0,
+            "lock_hold_us_max": round(max(holds) * 1e6, 2) if holds else 0.0,
+            "encode_workers": len(self.encoders),
+            "raw_dropped": self.raw_dropped,
+            "capture_mode": self.capture_mode,
+            "motion_score": round(self.motion_score, 2),
+            "frames_skipped": self.frames_skipped,
+            "profiles": {
+                name: {
+                    "frame_seq": profile.frame_seq,
+                    "subscribers": profile.broadcaster.subscriber_count,
+                    "frames_encoded": profile.frames_encoded,
+                    "avg_frame_bytes": profile.bytes_encoded // profile.frames_encoded if profile.frames_encoded else 0,
+                }
+                for name, profile in self.profiles.items()
+            },
+        }
+
+    def get_frame(self, profile=None):
         """Returns the latest frame safely from the buffer."""
+        profile = self._profile(profile)
         with self.lock:
-            return self.frame_buffer
+            return profile.frame_buffer
+
+    def wait_for_frame(self, last_seq=0, timeout=None, profile=None):
+        """Blocks until a frame newer than `last_seq` is available. Returns (seq, frame) or None on timeout."""
+        profile = self._profile(profile)
+        with profile.frame_ready:
+            if not profile.frame_ready.wait_for(lambda: profile.frame_seq > last_seq, timeout):
+                return None
+            return profile.frame_seq, profile.frame_buffer
+
+    def get_latest(self, profile=None, max_age=1.0, timeout=1.0):
+        """Returns the latest (seq, frame) for a profile, waiting for a fresh one if the profile has gone idle."""
+        profile = self._profile(profile)
+        profile.wanted_until = time.monotonic() + PROFILE_KEEPALIVE
+        self._wake.set()
+        with profile.frame_ready:
+            if profile.frame_seq and time.monotonic() - profile.published_at <= max_age:
+                return profile.frame_seq, profile.frame_buffer
+            last_seq = profile.frame_seq
+        return self.wait_for_frame(last_seq, timeout, profile.name)
+
+    def subscribe(self, profile=None, loop=None):
+        """Returns a FrameSubscriber that receives each new frame of `profile` once (awaitable if `loop` is given)."""
+        subscriber = self._profile(profile).broadcaster.subscribe(loop)
+        self._wake.set()
+        return subscriber
 
 # ✅ Ensure only one CameraManager instance
 camera_manager = CameraManager()
@@ -1,22 +1,19 @@
-from openai import OpenAI
-import chromadb
+import asyncio
+import contextlib
 import os
 import json
 from ai_util import get_developer_message
 from ai_util import get_system_message
 from datetime import datetime
+from config import CONTEXT_RECALL_MATCHES, SUMMARIZE_IN_CELERY
+from context_builder import context_builder
+from generations import generations
+from llm_cache import close_stream, llm_cache
+from memory import get_history_store, recall, replace_with_summary, store_messages
+from resources import get_async_llm_client, get_llm_client
+from summarizer import BackgroundSummarizer
 
 from dotenv import load_dotenv
-from openai_harmony import (
-    load_harmony_encoding,
-    HarmonyEncodingName,
-    Conversation,
-    Message,
-    Role,
-    DeveloperContent,
-    Author,
-    StreamableParser
-)
 
 load_dotenv()
 
@@ -24,32 +21,13 @@ load_dotenv()
 # last known working model qwen3-8b-64k-josiefied-uncensored-neo-max
 DEFAULT_AGENT_NAME = "Miss Minutes"
 MAX_RECENT_TURNS = 8          # How many turns to include after the summary
-SUMMARIZE_AFTER = 30          # How many messages before we summarize
+SUMMARIZE_AFTER_TOKENS = 2000  # Unsummarized history size that triggers a background fold
+SUMMARIZE_MAX_MESSAGES = 60   # Most messages folded into the summary per LLM call
 MODEL_ID = "openai/gpt-oss-20b"  # Model to use for chat completions
 
 
 #harmony_encoding = load_harmony_encoding(HarmonyEncodingName.HARMONY_GPT_OSS)
 
-client = OpenAI(base_url=os.getenv("LLM_API_BASE"), api_key="lm-studio")
-
-chroma_client = chromadb.PersistentClient(path=os.getenv("CHROMA_DB_PATH"))
-chat_collection = chroma_client.get_or_create_collection(os.getenv("CHROMA_COLLECTION"))
-
-
-def get_embedding(text, model="nomic-ai/nomic-embed-text-v1.5-GGUF"):
-    text = text.replace("\n", " ")
-    return client.embeddings.create(input=[text], model=model).data[0].embedding
-
-
-def store_message(user_id, role, content):
-    embedding = get_embedding(content)
-    chat_collection.add(
-        documents=[content],
-        metadatas=[{"user_id": user_id, "role": role}],
-        embeddings=[embedding],
-        ids=[f"{user_id}_{datetime.datetime.now().timestamp()}"]
-    )
-
 
 def build_system_prompt(agent_name, user_id, system_prompt=None):
     name_intro = f"You are {agent_name}."
@@ -71,71 +49,61 @@ def build_system_prompt(agent_name, user_id, system_prompt=None):
 
 
 def retrieve_memory_with_summary(user_id, num_recent=MAX_RECENT_TURNS):
-    results = chat_collection.get(
-        where={"user_id": user_id},
-        include=["documents", "metadatas"]
-    )
-    history = []
-    for doc, meta, _id in zip(results['documents'], results['metadatas'], results['ids']):
-        try:
-            timestamp = float(_id.split("_")[-1])
-        except Exception:
-            timestamp = 0
-        role = meta.get("role", "user")
-        msg = doc[0] if isinstance(doc, list) and doc else doc
-        history.append((timestamp, role, msg, _id))
-    history = sorted(history, key=lambda x: x[0])
-
-    summary = None
-    recent = []
-    for (timestamp, role, msg, _id) in history:
-        if role == "summary":
-            summary = msg
-            recent = []  # Only messages *after* the latest summary count as "recent"
-        else:
-            recent.append((role, msg))
-    # Only keep the last N recent messages
-    return summary, recent[-num_recent:]
+    history_store = get_history_store()
+    latest = history_store.latest_summary(user_id)
+    summary_seq, summary, _ = latest if latest else (0, None, None)
+    # Only messages *after* the latest summary count as "recent"; keep the last N
+    recent = history_store.tail(user_id, num_recent, after_seq=summary_seq)
+    return summary, [(role, msg) for _, role, msg in recent]
+
+
+def retrieve_unsummarized_history(user_id):
+    """The latest summary and every turn since it, oldest first.
+
+    Unlike retrieve_memory_with_summary this doesn't slide a fixed window, so the
+    prompt only grows between folds and its prefix stays cacheable.
+    """
+    history_store = get_history_store()
+    latest = history_store.latest_summary(user_id)
+    summary_seq, summary, _ = latest if latest else (0, None, None)
+    return summary, [(role, msg) for _, role, msg, _ in history_store.unsummarized(user_id, summary_seq)]
 
 
 def count_user_messages(user_id):
-    results = chat_collection.get(
-        where={"user_id": user_id},
-        include=["metadatas"]
-    )
-    return sum(1 for meta in results['metadatas'] if meta.get("role") != "summary")
+    return get_history_store().count(user_id)
 
 
 
-def summarize_chat_history(user_id, agent_name=DEFAULT_AGENT_NAME, num_to_summarize=SUMMARIZE_AFTER):
-    # Get all messages for this user
-    results = chat_collection.get(
-        where={"user_id": user_id},
-        include=["documents", "metadatas"]
-    )
-    history = []
-    for doc, meta, _id in zip(results['documents'], results['metadatas'], results['ids']):
-        try:
-            timestamp = float(_id.split("_")[-1])
-        except Exception:
-            timestamp = 0
-        role = meta.get("role", "user")
-        msg = doc[0] if isinstance(doc, list) and doc else doc
-        history.append((timestamp, role, msg, _id))
-    history = sorted(history, key=lambda x: x[0])
-    to_summarize = history[:num_to_summarize]
-    if not to_summarize:
+def summarize_chat_history(user_id, agent_name=DEFAULT_AGENT_NAME, max_tokens=SUMMARIZE_AFTER_TOKENS):
+    """Fold older turns into the rolling summary once unsummarized history exceeds `max_tokens`.
+
+    Only the new messages and the current summary go to the model; the newest
+    MAX_RECENT_TURNS are left as-is. Runs in the background via `summarizer`.
+    """
+    history_store = get_history_store()
+    latest = history_store.latest_summary(user_id)
+    summary_seq, summary, summary_chroma_id = latest if latest else (0, None, None)
+    if history_store.unsummarized_chars(user_id, summary_seq) // 4 <= max_tokens:  # ~4 characters per token
+        return None
+
+    recent = history_store.tail(user_id, MAX_RECENT_TURNS, after_seq=summary_seq)
+    keep_from = recent[0][0] if recent else float("inf")
+    to_fold = [row for row in history_store.unsummarized(user_id, summary_seq, limit=SUMMARIZE_MAX_MESSAGES)
+               if row[0] < keep_from]
+    if not to_fold:
         return None
 
     summary_prompt = (
-        f"You are {agent_name}, an advanced assistant. Summarize the following conversation "
+        f"You are {agent_name}, an advanced assistant. Update your notes on this conversation "
         "so that you remember the important facts, topics, preferences, and any emotional tone. "
         "Summarize for yourself, as notes to help future responses. Be concise.\n\n"
     )
-    for _, role, msg, _ in to_summarize:
+    if summary:
+        summary_prompt += f"Your notes so far:\n{summary}\n\nNew messages:\n"
+    for _, role, msg, _ in to_fold:
         summary_prompt += f"{role.title()}: {msg}\n"
 
-    summary_response = client.chat.completions.create(
+    summary_response = get_llm_client().chat.completions.create(
         model=MODEL_ID,
         messages=[
             {"role": "system", "content": summary_prompt}
@@ -143,40 +111,37 @@ def summarize_chat_history(user_id, agent_name=DEFAULT_AGENT_NAME, num_to_summar
         temperature=0.2,
         max_tokens=300
     )
-    summary = summary_response.choices[0].message.content.strip()
+    new_summary = summary_response.choices[0].message.content.strip()
 
-    store_message(user_id, "summary", summary)
+    # Swap in the new summary and drop the old one and the folded messages together
+    rows = [(seq, chroma_id) for (seq, _, _, chroma_id) in to_fold]
+    if latest:
+        rows.append((summary_seq, summary_chroma_id))
+    replace_with_summary(user_id, rows, new_summary)
+    return new_summary
 
-    # Delete the old, summarized messages
-    ids_to_delete = [_id for (_, _, _, _id) in to_summarize]
-    if ids_to_delete:
-        chat_collection.delete(ids=ids_to_delete)
-    return summary
 
+def _enqueue_summary(user_id, **kwargs):
+    """Hand the fold to a Celery worker on the low-priority background queue."""
+    from tasks import summarize_history_task  # Imported here so the chat path doesn't need Celery unless asked
+    summarize_history_task.apply_async(args=(user_id,), kwargs=kwargs)
 
-def ask_ai(user_id, question, agent_name=DEFAULT_AGENT_NAME, system_prompt_override=None):
-    #store_message(user_id, "user", question) 
-    total = count_user_messages(user_id)
-    print(total)
-    """ if total >= SUMMARIZE_AFTER:
-        summarize_chat_history(user_id, agent_name) """
 
-    #summary, conversation_history = retrieve_memory_with_summary(user_id)
-    system_prompt = build_system_prompt(agent_name, user_id, system_prompt_override)
+summarizer = BackgroundSummarizer(_enqueue_summary if SUMMARIZE_IN_CELERY else summarize_chat_history)
 
-    messages = [{"role": "system", "content": system_prompt}]
-    """ if summary:
-        messages.append({"role": "system", "content": f"Summary of earlier conversation: {summary}"})
-    for role, content in conversation_history:
-        messages.append({"role": role, "content": content}) """
-    messages.append({"role": "user", "content": question})
 
-    response_iter = client.chat.completions.create(
+def ask_ai(user_id, question, agent_name=DEFAULT_AGENT_NAME, system_prompt_override=None):
+    summary, conversation_history = retrieve_unsummarized_history(user_id)
+    system_prompt = build_system_prompt(agent_name, user_id, system_prompt_override)
+    messages, _ = context_builder.build(user_id, system_prompt, question, summary=summary, recent=conversation_history)
+
+    response_iter = get_llm_client().chat.completions.create(
         model=MODEL_ID,
         messages=messages,
         temperature=0.7,
         max_tokens=2500,
-        stream=True
+        stream=True,
+        user=user_id
     )
 
     buffer = ""
@@ -198,11 +163,13 @@ def ask_ai(user_id, question, agent_name=DEFAULT_AGENT_NAME, system_prompt_overr
                 buffer = ""
             elif found_think:
                 yield {"type": "response", "content": delta.content}
-    #store_message(user_id, "assistant", full_response.strip())
+    store_messages(user_id, [("user", question), ("assistant", full_response.strip())])
+    summarizer.schedule(user_id, agent_name=agent_name)
 
 
 
-def ask_open_gpt(user_id, question, agent_name=DEFAULT_AGENT_NAME, system_prompt_override=None, fromVoice=False):
+def open_gpt_params(user_id, question, agent_name=DEFAULT_AGENT_NAME, system_prompt_override=None, fromVoice=False):
+    """Chat completion arguments for one ask_open_gpt turn, prompt included."""
     system_instruction = system_prompt_override or (
         "You are a helpful assistant. Respond with concise and polite answers."
     )
@@ -224,61 +191,167 @@ def ask_open_gpt(user_id, question, agent_name=DEFAULT_AGENT_NAME, system_prompt
         }
     }
 
-    params = {
-    "model": MODEL_ID,
-    "messages": build_open_gpt_messages(
+    messages, report = build_open_gpt_messages(
         question,
         system_identity=system_instruction,
         user_id=user_id,
         agent_name=agent_name,
         fromVoice=fromVoice
-    ),
+    )
+    params = {
+    "model": MODEL_ID,
+    "messages": messages,
     "stream": True,
     "temperature": 0.9,
     "max_tokens": 2500,
-    "stream_options": {"include_usage": True}
+    "stream_options": {"include_usage": True},
+    "user": user_id,  # Keeps the user's turns on one LLM backend (see llm_router)
     }
+    return params
 
 
-    
+def open_gpt_events(chunk):
+    """Turn one streamed completion chunk into thinking/response events."""
+    if getattr(chunk, "usage", None):
+        context_builder.record_usage(chunk.usage)
+    if not getattr(chunk, "choices", None):
+        return []
+    events = []
+    delta = chunk.choices[0].delta
+    if getattr(delta, "reasoning", None):
+        events.append({"type": "thinking", "content": delta.reasoning})
+    if getattr(delta, "content", None):
+        events.append({"type": "response", "content": delta.content})
+    return events
+
+
+def finish_open_gpt_turn(user_id, question, full_response, agent_name=DEFAULT_AGENT_NAME):
+    """Store the turn and let the summarizer fold history if it has grown too long.
+
+    A cancelled turn keeps whatever part of the answer was generated, if any.
+    """
+    messages = [("user", question)]
+    if full_response.strip():
+        messages.append(("assistant", full_response.strip()))
+    store_messages(user_id, messages)
+    summarizer.schedule(user_id, agent_name=agent_name)
+
+
+def ask_open_gpt(user_id, question, agent_name=DEFAULT_AGENT_NAME, system_prompt_override=None, fromVoice=False,
+                 generation=None, supersede=False):
+    """Stream a reply as thinking/response events.
+
+    `generation` (from generations.start) lets the caller cancel the reply, e.g. when
+    the client disconnects; cancelling closes the upstream stream right away. With
+    `supersede`, this message cancels the user's other in-flight replies.
+    """
+    generation = generation or generations.start(user_id, supersede)
+    params = open_gpt_params(user_id, question, agent_name, system_prompt_override, fromVoice)
+
     # Send tokens directly using OpenAI-compatible `messages` API
-    response = client.chat.completions.create(**params)
+    # Identical concurrent requests can share one upstream stream (LLM_COALESCE_STREAMS)
+    response = llm_cache.stream(params, lambda: get_llm_client().chat.completions.create(**params))
+    generation.on_cancel(lambda: close_stream(response))
 
-    
-    
-    for chunk in response:
-        if not getattr(chunk, "choices", None):
-            continue
-        if not chunk.choices:
-            continue
-        delta = chunk.choices[0].delta
-        if getattr(delta, "reasoning", None):
-            yield {"type": "thinking", "content": delta.reasoning}
-        if getattr(delta, "content", None):
-            yield {"type": "response", "content": delta.content}
+    full_response = ""
+    completed = False
+    try:
+        for chunk in response:
+            for event in open_gpt_events(chunk):
+                generation.tokens += 1
+                if event["type"] == "response":
+                    full_response += event["content"]
+                yield event
+        completed = not generation.cancelled
+    except Exception:
+        if not generation.cancelled:
+            raise  # Closing the stream under the reader makes it raise; anything else is a real error
+    finally:
+        close_stream(response)
+        generation.finish(completed)
+        finish_open_gpt_turn(user_id, question, full_response, agent_name)
+    if generation.reason == "superseded":
+        yield {"type": "cancelled", "reason": generation.reason}
+
+
+async def ask_open_gpt_async(user_id, question, agent_name=DEFAULT_AGENT_NAME, system_prompt_override=None, fromVoice=False,
+                             supersede=False):
+    """ask_open_gpt for the ASGI server: awaits the LLM stream instead of holding a thread for it.
+
+    The server cancels the task on client disconnect, which closes the upstream stream.
+    A supersede doesn't cancel the task; it stops the read and the reply ends normally.
+    """
+    generation = generations.start(user_id, supersede)
+    # Prompt assembly and storage touch SQLite/Chroma, so they run off the event loop
+    params = await asyncio.to_thread(open_gpt_params, user_id, question, agent_name, system_prompt_override, fromVoice)
+    response = llm_cache.astream(params, lambda: get_async_llm_client().chat.completions.create(**params))
+    loop = asyncio.get_running_loop()
+    cancelled = asyncio.Event()
+    # Called from whichever thread handles the superseding request
+    generation.on_cancel(lambda: loop.call_soon_threadsafe(cancelled.set))
+    stop = loop.create_task(cancelled.wait())
+    chunks = response.__aiter__()
+    next_chunk = None
+
+    full_response = ""
+    completed = False
+    try:
+        while True:
+            next_chunk = asyncio.ensure_future(chunks.__anext__())
+            await asyncio.wait({next_chunk, stop}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_chunk.done():
+                break  # Cancelled; the finally below stops the read, which closes the upstream stream
+            try:
+                chunk = next_chunk.result()
+            except StopAsyncIteration:
+                completed = not generation.cancelled
+                break
+            for event in open_gpt_events(chunk):
+                generation.tokens += 1
+                if event["type"] == "response":
+                    full_response += event["content"]
+                yield event
+    finally:
+        stop.cancel()
+        if next_chunk is not None and not next_chunk.done():
+            next_chunk.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await next_chunk
+        await response.aclose()
+        generation.finish(completed)
+        await asyncio.to_thread(finish_open_gpt_turn, user_id, question, full_response, agent_name)
+    if generation.reason == "superseded":
+        yield {"type": "cancelled", "reason": generation.reason}
 
 
 def build_open_gpt_messages(user_message, system_identity=None, user_id=None, agent_name=DEFAULT_AGENT_NAME, date=None, fromVoice=False):
     """
-    Build a list of messages for OpenGPT with system and user, reasoning set to HIGH.
-    Returns a list of dicts suitable for OpenAI/chat API.
+    Build the messages for OpenGPT: system prompt, rolling summary, recent turns,
+    recalled memories, today's date and the user message, within CONTEXT_TOKEN_BUDGET.
+    Returns (messages, report) where report has the prompt tokens per section.
     """
     if not system_identity:
         system_identity = "You are ChatGPT, a large language model trained by OpenAI."
     if not date:
         date = datetime.now().strftime("%Y-%m-%d")
-    system_msg = get_system_message(system_identity, date, user_id=user_id, agent_name=agent_name, fromVoice=fromVoice)
-    messages = [
-        {"role": "system", "content": str(system_msg)},
-        {"role": "user", "content": user_message}
-    ]
-    return messages
+    # No date in the system prompt, so it stays byte-identical and the server's prefix cache keeps hitting
+    system_msg = get_system_message(system_identity, None, user_id=user_id, agent_name=agent_name, fromVoice=fromVoice)
+    summary, recent = retrieve_unsummarized_history(user_id) if user_id is not None else (None, [])
+    memories = []
+    if CONTEXT_RECALL_MATCHES and user_id is not None:
+        try:
+            memories = recall(user_id, user_message, CONTEXT_RECALL_MATCHES)
+        except Exception as e:
+            print(f"[WARN] Memory recall failed, continuing without it: {e}")
+    return context_builder.build(
+        user_id, system_msg["content"], user_message,
+        summary=summary, recent=recent, memories=memories, context=f"Current date: {date}"
+    )
 
 # Example usage for CLI/debug
 if __name__ == "__main__":
     user_id = "default_user"
     agent_name = "Miss Minutes"
     user_input = input(f"Ask {agent_name}: ")
-    store_message(user_id, "user", user_input)
     for chunk in ask_ai(user_id, user_input, agent_name):
         print(chunk)
@@ -1,195 +1,146 @@
-from openai import OpenAI
-from config import LLM_CONFIG
-import chromadb
-import autogen
-import os
+from config import CONFIG_LIST, LLM_CONFIG, T800_PIPELINE, T800_PIPELINE_WORKERS
+from llm_cache import llm_cache
+from memory import recall, store_messages
+from resources import get_llm_client, registry
+from search import web_search
+import collections
+import concurrent.futures
+import re
+import threading
 import time
-import requests
-import sys
 import json
 import datetime
 from dotenv import load_dotenv
 
 load_dotenv()
 
-chroma_client = chromadb.PersistentClient(path=os.getenv("CHROMA_DB_PATH"))
-chat_collection = chroma_client.get_or_create_collection(os.getenv("CHROMA_COLLECTION"))
-
-client = OpenAI(base_url=os.getenv("LLM_API_BASE"), api_key="lm-studio")
-
-def get_embedding(text, model="nomic-ai/nomic-embed-text-v1.5-GGUF"):
-    """Generate an embedding for the given text using local model."""
-    text = text.replace("\n", " ")  # Ensure clean input
-    return client.embeddings.create(input=[text], model=model).data[0].embedding
-
-# Create the T-800 AI Agent
-terminator_agent = autogen.AssistantAgent(
-    name="T800",
-    llm_config=LLM_CONFIG,
-    system_message=(
-        "You are a Terminator AI. Speak in plain text. "
-        "Do NOT return JSON, lists, or structured objects. "
-        "Only respond in full sentences, staying in character."
+def _create_terminator_agent():
+    """Create the T-800 AI Agent"""
+    import autogen
+    return autogen.AssistantAgent(
+        name="T800",
+        llm_config=LLM_CONFIG,
+        system_message=(
+            "You are a Terminator AI. Speak in plain text. "
+            "Do NOT return JSON, lists, or structured objects. "
+            "Only respond in full sentences, staying in character."
+        )
     )
-)
-
-def web_search(query):
-    """Perform a web search using Brave Search API and return structured results."""
-    url = f"https://api.search.brave.com/res/v1/web/search?q={query}&count=5"
-    headers = {"Accept": "application/json", "X-Subscription-Token": os.getenv("BRAVE_API_KEY")}
-
-    response = requests.get(url, headers=headers)
-
-    if response.status_code != 200:
-        return f"Error: Unable to fetch results ({response.status_code})"
-
-    data = response.json()
-
-    # ✅ Debugging: Print the raw JSON response
-    #print("[DEBUG] Brave API Raw Response:")
-    #print(json.dumps(data, indent=2))
-
-    # ✅ Ensure the "web" field exists and contains valid search results
-    if "web" not in data or "results" not in data["web"]:
-        return "No relevant search results found."
 
-    # ✅ Extract and format search results
-    search_results = data["web"]["results"]
-
-    parsed_results = []
-    for result in search_results[:5]:  # Limit to top 5 results
-        title = result.get("title", "No Title")
-        url = result.get("url", "No URL")
-        description = result.get("description", "No Description")
-
-        parsed_results.append(f"Title: {title}\nURL: {url}\nSummary: {description}\n")
-
-    return "\n".join(parsed_results) if parsed_results else "No relevant search results found."
-
-def store_message(user_id, role, content):
-    """Store a message in ChromaDB along with its embedding."""
-    embedding = get_embedding(content)  # Generate embedding
-
-    chat_collection.add(
-        documents=[content],  # Store message content
-        metadatas=[{"user_id": user_id, "role": role}],  # Store metadata
-        embeddings=[embedding],  # Store embedding for vector search
-        ids=[f"{user_id}_{datetime.datetime.now().timestamp()}"],  # Unique ID
-    )
 
+registry.register("t800_agent", _create_terminator_agent)
 
 def retrieve_memory(user_id, question, num_matches=3):
     """Retrieve relevant past messages from ChromaDB using embeddings similarity search."""
-    question_embedding = get_embedding(question)  # Get embedding for the new question
+    return "\n".join(recall(user_id, question, num_matches))
+
+ROUTE_SCHEMA = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "t800_route",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "needs_search": {
+                    "type": "boolean",
+                    "description": "True if answering needs current information from the web (news, scores, prices, latest data)."
+                },
+                "query": {
+                    "type": "string",
+                    "description": "A short web search query (max 8 words) when needs_search is true, otherwise empty."
+                },
+                "use_memory": {
+                    "type": "boolean",
+                    "description": "True if earlier conversation with this user could help answer."
+                }
+            },
+            "required": ["needs_search", "query", "use_memory"],
+            "additionalProperties": False
+        }
+    }
+}
+
+GREETING = re.compile(
+    r"^(hi|hello|hey|yo|howdy|greetings|good (morning|afternoon|evening|night)|thanks|thank you|bye|goodbye|ok(ay)?|cool)"
+    r"\b[\s,]*(there|t-?800|terminator)?[\s!.?]*$", re.IGNORECASE
+)
+ARITHMETIC = re.compile(r"^\s*(what('?s| is)\s+)?[\d\s.()]*\d\s*[-+*/x×÷^%]\s*[\d\s.()+\-*/x×÷^%]*[=?\s]*$", re.IGNORECASE)
+CHIT_CHAT = {"how are you", "how are you doing", "what's up", "whats up", "who are you", "what are you",
+             "tell me a joke", "nice", "great", "lol", "i'm bored", "im bored", "good job", "well done"}
 
-    # ✅ Query for similar past messages
-    results = chat_collection.query(
-        query_embeddings=[question_embedding],
-        n_results=num_matches,
-        where={"user_id": user_id}
-    )
+router_stats = {"heuristic": 0, "llm": 0, "fallback": 0}
+_router_stats_lock = threading.Lock()
 
-    # ✅ Ensure "documents" exists and is not None
-    past_messages = results.get("documents", [])
 
-    # ✅ Flatten list (if empty, return an empty string)
-    past_messages = [msg[0] if isinstance(msg, list) and msg else "" for msg in past_messages]
+def _count_route(source):
+    with _router_stats_lock:
+        router_stats[source] += 1
 
-    return "\n".join(past_messages).strip() if past_messages else ""  # Return empty string if no history
 
-def should_perform_web_search(question):
-    """Determine if a web search is required based on the question."""
-    search_decision_prompt = f"""
-    You are a highly intelligent AI with access to both memory and web searches.
+def heuristic_route(question):
+    """Route obvious turns (greetings, arithmetic, a few stock small-talk phrases) without asking the LLM; None if unsure."""
+    text = question.strip()
+    if GREETING.match(text) or ARITHMETIC.match(text):
+        return {"needs_search": False, "query": "", "use_memory": False, "source": "heuristic"}
+    if " ".join(text.lower().strip(" !.?").split()) in CHIT_CHAT:
+        return {"needs_search": False, "query": "", "use_memory": True, "source": "heuristic"}
+    return None
 
-    A user has asked the following question:
-    "{question}"
 
-    Your task:
-    - Determine if a web search is required.
-    - If the question is about recent events (e.g., news, sports results, latest data), answer "YES".
-    - If the question is about general knowledge or historical facts, answer "NO".
-    - Do NOT answer the question itself.
-    - Your response must be exactly "YES" or "NO".
+def route_question(question):
+    """Decide whether the turn needs a web search (and with what query) and whether to recall memory.
 
-    **Output Format (strictly follow this)** 
-    ```
-    [DECISION] YES or NO
-    ```
+    Obvious cases are settled by heuristic_route; everything else is one schema-constrained
+    LLM call. If that call fails or returns something unusable, search with the raw question.
     """
+    route = heuristic_route(question)
+    if route is not None:
+        _count_route("heuristic")
+        return route
 
-    decision_response = terminator_agent.generate_reply(
-        messages=[{"role": "user", "content": search_decision_prompt}],
-        config_list=[{"max_tokens": 5, "temperature": 0}]  # ✅ Forces "YES" or "NO"
-    )
-
-    if isinstance(decision_response, str):
-        decision_result = decision_response.strip().upper()
-    elif isinstance(decision_response, autogen.ChatResult):
-        decision_messages = [
-            msg["content"].strip().upper() for msg in decision_response.chat_history if msg["role"] == "assistant"
-        ]
-        decision_result = decision_messages[-1] if decision_messages else "YES"  # Default to "YES" if AI doesn't answer correctly
-    else:
-        decision_result = "YES"
-
-    print(f"[DEBUG] AI Search Decision: {decision_result}")
-    
-    # Ensure valid output (if AI gives a malformed response, default to "YES")
-    return "YES" if decision_result not in ["YES", "NO"] else decision_result
-
-
+    route_prompt = f"""
+    You are routing a question for an AI with access to both memory and web searches.
 
-def refine_search_query(question):
-    """Generate an optimized search query for web search."""
-    search_query_prompt = f"""
-    You are an AI that specializes in refining search queries.
-    Your ONLY task is to rewrite the given user query into a better, short, web search query.
-
-    A user has asked the following:
+    A user has asked the following question:
     "{question}"
 
-    - Do **NOT** answer the question.
-    - Do **NOT** return explanations.
-    - Do **NOT** add unrelated information.
-    - Your response **must be EXACTLY ONE search query** (max 8 words).
-    - Your query should be focused and concise.
-
-    Example:
-    User: "What's the latest news in the US?"
-    Response: "latest US news today"
-
-    **Output Format:**
-    ```
-    [SEARCH_QUERY] optimized query here
-    ```
+    - needs_search: true if the question is about recent events (news, sports results, latest data),
+      false for general knowledge, historical facts or conversation.
+    - query: when needs_search is true, rewrite the question as ONE short web search query (max 8 words).
+    - use_memory: true if earlier conversation with this user could help answer.
+    - Do NOT answer the question itself.
     """
-
-    refined_search_query = terminator_agent.generate_reply(
-        messages=[{"role": "user", "content": search_query_prompt}],
-        config_list=[{"max_tokens": 10, "temperature": 0}]  # ✅ Forces short output
-    )
-
-    # ✅ Extract the refined search query
-    if isinstance(refined_search_query, autogen.ChatResult):
-        refined_queries = [
-            msg["content"] for msg in refined_search_query.chat_history if msg["role"] == "assistant"
-        ]
-        refined_search_query = refined_queries[-1] if refined_queries else question  # Default to original question
-
-    # ✅ Ensure the AI-generated search query is valid
-    if "[SEARCH_QUERY]" in refined_search_query:
-        refined_search_query = refined_search_query.replace("[SEARCH_QUERY]", "").strip()
-    else:
-        refined_search_query = question  # Fallback to original if format fails
-
-    print(f"[DEBUG] AI-Generated Search Query: {refined_search_query}")
-    return refined_search_query
-
-
-
-def generate_response(user_id, question, refined_search_query, search_results, conversation_context):
-    """Generate a response using AI memory and web search results, separating thinking and actual response."""
+    params = {
+        "model": CONFIG_LIST[0]["model"],
+        "messages": [{"role": "user", "content": route_prompt}],
+        "response_format": ROUTE_SCHEMA,
+        "max_tokens": 60,
+        "temperature": 0,
+    }
+    try:
+        # Deterministic, so repeats of the same question are served from the cache
+        content = llm_cache.call(params, lambda: get_llm_client().chat.completions.create(**params).choices[0].message.content)
+        decided = json.loads(content)
+        route = {
+            "needs_search": bool(decided["needs_search"]),
+            "query": str(decided.get("query") or "").strip() or question,
+            "use_memory": bool(decided["use_memory"]),
+            "source": "llm",
+        }
+        _count_route("llm")
+    except Exception as e:
+        print(f"[WARN] Routing call failed, searching with the raw question: {e}")
+        route = {"needs_search": True, "query": question, "use_memory": False, "source": "fallback"}
+        _count_route("fallback")
+
+    print(f"[DEBUG] AI Route: {route}")
+    return route
+
+
+
+def _response_prompt(question, refined_search_query, search_results, conversation_context):
+    """The T-800 answer prompt: persona, memory, search results (if any) and the question."""
     current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     context = (
@@ -208,8 +159,15 @@ def generate_response(user_id, question, refined_search_query, search_results, c
 
     context += f"User's Question: {question}\n\n"
     context += "Use the available memory and search results (if any) to provide an answer."
+    return context
 
-    response = terminator_agent.generate_reply(
+
+def generate_response(user_id, question, refined_search_query, search_results, conversation_context):
+    """Generate a response using AI memory and web search results, separating thinking and actual response."""
+    context = _response_prompt(question, refined_search_query, search_results, conversation_context)
+
+    import autogen
+    response = registry.get("t800_agent").generate_reply(
         messages=[{"role": "user", "content": context}],
         config_list=[{"max_tokens": 250, "temperature": 0.7}]
     )
@@ -252,40 +210,198 @@ def generate_response(user_id, question, refined_search_query, search_results, c
 
 
 
+class _StageTimer:
+    """Records how long each stage of a turn took, in milliseconds."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = {}
+
+    def run(self, stage, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.timings[stage] = round((time.perf_counter() - started) * 1000, 1)
+
+    def finish(self):
+        self.timings["total"] = round((time.perf_counter() - self.started) * 1000, 1)
+        with _turn_timings_lock:
+            _turn_timings.append(self.timings)
+        return self.timings
+
+
+_pipeline_executor = concurrent.futures.ThreadPoolExecutor(max_workers=T800_PIPELINE_WORKERS, thread_name_prefix="t800")
+_turn_timings = collections.deque(maxlen=100)
+_turn_timings_lock = threading.Lock()
+
+
+def _gather_context_serial(user_id, question, timer):
+    """Route, then search and/or recall memory, one step after another."""
+    route = timer.run("route", route_question, question)
+    search_results = timer.run("search", web_search, route["query"]) if route["needs_search"] else ""
+    conversation_context = timer.run("recall", retrieve_memory, user_id, question, num_matches=3) if route["use_memory"] else ""
+    return route, search_results, conversation_context
+
+
+def _gather_context_parallel(user_id, question, timer):
+    """Start the routing call and memory recall together.
+
+    Recall is speculative: if the route says memory isn't needed it is cancelled
+    (or, if already running, its result is dropped). A web search overlaps with
+    recall when the route asks for both. The pool threads only use the OpenAI
+    client, Chroma and the search session; the shared autogen agent isn't
+    thread-safe, so it stays on the caller's thread in generate_response.
+    """
+    if heuristic_route(question) is not None:
+        return _gather_context_serial(user_id, question, timer)  # No LLM call to overlap with
+
+    routed = _pipeline_executor.submit(timer.run, "route", route_question, question)
+    recalled = _pipeline_executor.submit(timer.run, "recall", retrieve_memory, user_id, question, num_matches=3)
+
+    route = routed.result()
+    if not route["use_memory"] and recalled.cancel():
+        timer.timings["recall"] = "cancelled"
+    search_results = timer.run("search", web_search, route["query"]) if route["needs_search"] else ""
+    conversation_context = recalled.result() if route["use_memory"] else ""
+    return route, search_results, conversation_context
+
+
+def _route_counts():
+    with _router_stats_lock:
+        return dict(router_stats)
+
+
+def get_pipeline_stats():
+    """Average milliseconds per stage over recent ask_t800 turns."""
+    with _turn_timings_lock:
+        turns = list(_turn_timings)
+    stages = {}
+    for timings in turns:
+        for stage, ms in timings.items():
+            if isinstance(ms, (int, float)):
+                stages.setdefault(stage, []).append(ms)
+    return {"mode": T800_PIPELINE, "turns": len(turns), "routes": _route_counts(),
+            **{f"{stage}_ms_avg": round(sum(values) / len(values), 1) for stage, values in stages.items()}}
+
+
 def ask_t800(user_id, question):
-    """Main function to handle AI responses and determine whether to perform a web search."""
+    """Main function to handle AI responses and determine whether to perform a web search.
+
+    With T800_PIPELINE=parallel (the default) the routing call and memory recall run
+    concurrently; "serial" runs them one after another. The returned dict carries the
+    route under "route" and per-stage timings for the turn under "timings".
+    """
     if not question.strip():
-        return "Error: No input provided."
+        return {"thinking": "", "response": "Error: No input provided.", "route": None, "timings": {}}
 
-    # ✅ Step 1: Decide if a web search is needed
-    search_needed = should_perform_web_search(question)
-    print(f"[DEBUG] AI Search Decision: {search_needed}")
+    timer = _StageTimer()
+    gather_context = _gather_context_parallel if T800_PIPELINE == "parallel" else _gather_context_serial
+    route, search_results, conversation_context = gather_context(user_id, question, timer)
+    refined_search_query = route["query"] if route["needs_search"] else ""
+    if refined_search_query:
+        print(f"[DEBUG] Web Search Results: {search_results}")
 
-    search_results = ""
-    refined_search_query = ""
-    conversation_context = ""
+    # ✅ Generate AI response
+    response = timer.run("generate", generate_response, user_id, question, refined_search_query, search_results, conversation_context)
 
-    # ✅ Step 2: Perform a web search if needed
-    if "YES" in search_needed:
-        refined_search_query = refine_search_query(question)
-        print(f"[DEBUG] AI-Generated Search Query: {refined_search_query}")
+    # ✅ Store conversation in memory (written behind the request)
+    timer.run("store", store_messages, user_id, [("user", question), ("assistant", response["response"])])
 
-        search_results = web_search(refined_search_query)
-        time.sleep(1)
-        print(f"[DEBUG] Web Search Results: {search_results}")
+    response["route"] = route
+    response["timings"] = timer.finish()
+    print(f"[DEBUG] Returning from ask_t800: {response['timings']}")
+    return response
 
-        # 🛑 Important: DO NOT use old memory if we did a search!
-        conversation_context = ""
-    else:
-        # ✅ Retrieve past conversation memory if NO web search was done
-        conversation_context = retrieve_memory(user_id, question, num_matches=3)
 
-    # ✅ Step 3: Generate AI response
-    response = generate_response(user_id, question, refined_search_query, search_results, conversation_context)
+class _ThinkSplitter:
+    """Splits streamed text into thinking and response events on <think>...</think> tags.
 
-    # ✅ Step 4: Store conversation in memory
-    store_message(user_id, "user", question)
-    store_message(user_id, "assistant", response)
+    A tag can arrive split across chunks, so text that could be the start of one is
+    held back until the next chunk shows whether it is.
+    """
 
-    print("[DEBUG] Returning from ask_t800")
-    return response.strip()
\ No newline at end of file
+    def __init__(self):
+        self.thinking = False
+        self.pending = ""
+
+    def feed(self, text):
+        self.pending += text
+        events = []
+        while self.pending:
+            tag = "</think>" if self.thinking else "<think>"
+            index = self.pending.find(tag)
+            if index >= 0:
+                self._emit(events, self.pending[:index])
+                self.pending = self.pending[index + len(tag):]
+                self.thinking = not self.thinking
+                continue
+            keep = next((n for n in range(len(tag) - 1, 0, -1) if self.pending.endswith(tag[:n])), 0)
+            self._emit(events, self.pending[:len(self.pending) - keep])
+            self.pending = self.pending[len(self.pending) - keep:]
+            break
+        return events
+
+    def flush(self):
+        events = []
+        self._emit(events, self.pending)
+        self.pending = ""
+        return events
+
+    def _emit(self, events, text):
+        if text:
+            events.append({"type": "thinking" if self.thinking else "response", "content": text})
+
+
+def stream_t800(user_id, question):
+    """ask_t800 as a stream of events: thinking/response deltas as the answer is generated,
+    then {"type": "done"} with the route and per-stage timings."""
+    if not question.strip():
+        yield {"type": "error", "message": "No input provided."}
+        yield {"type": "done"}
+        return
+
+    timer = _StageTimer()
+    gather_context = _gather_context_parallel if T800_PIPELINE == "parallel" else _gather_context_serial
+    route, search_results, conversation_context = gather_context(user_id, question, timer)
+    refined_search_query = route["query"] if route["needs_search"] else ""
+    context = _response_prompt(question, refined_search_query, search_results, conversation_context)
+
+    started = time.perf_counter()
+    stream = get_llm_client().chat.completions.create(
+        model=CONFIG_LIST[0]["model"],
+        messages=[{"role": "user", "content": context}],
+        max_tokens=250,
+        temperature=0.7,
+        stream=True,
+        user=user_id,
+    )
+    splitter = _ThinkSplitter()
+    response_parts = []
+    try:
+        for chunk in stream:
+            if not getattr(chunk, "choices", None):
+                continue
+            delta = chunk.choices[0].delta
+            events = []
+            if getattr(delta, "reasoning", None):
+                events.append({"type": "thinking", "content": delta.reasoning})
+            if getattr(delta, "content", None):
+                events.extend(splitter.feed(delta.content))
+            for event in events:
+                if "first_token" not in timer.timings:
+                    timer.timings["first_token"] = round((time.perf_counter() - timer.started) * 1000, 1)
+                if event["type"] == "response":
+                    response_parts.append(event["content"])
+                yield event
+        for event in splitter.flush():
+            if event["type"] == "response":
+                response_parts.append(event["content"])
+            yield event
+    finally:
+        stream.close()
+        timer.timings["generate"] = round((time.perf_counter() - started) * 1000, 1)
+
+    response = "".join(response_parts).strip() or "Error: No valid response from AI."
+    timer.run("store", store_messages, user_id, [("user", question), ("assistant", response)])
+    yield {"type": "done", "route": route, "timings": timer.finish()}
@@ -16,7 +16,9 @@ def get_system_message(identity, date, reasoning_effort="high", knowledge_cutoff
     Returns a dict for the system role message for OpenAI/chat API, with a fully constructed prompt.
     """
     
-    prompt = f"You are {agent_name}. {identity} Reasoning effort: {reasoning_effort}. date: {date}. Knowledge cutoff: {knowledge_cutoff}. Conversation With: {user_id}"
+    # Leave the date out (date=None) to keep the prompt identical across days; send it separately instead
+    date_info = f" date: {date}." if date else ""
+    prompt = f"You are {agent_name}. {identity} Reasoning effort: {reasoning_effort}.{date_info} Knowledge cutoff: {knowledge_cutoff}. Conversation With: {user_id}"
     if fromVoice:
         prompt += " When responding, keep responses very short and with no formatting"
     return {
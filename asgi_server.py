@@ -0,0 +1,92 @@
+"""ASGI serving mode: `python asgi_server.py` (or `uvicorn asgi_server:app`).
+
+The long-lived streaming routes (/chat, /speak, /stream) run as coroutines, so an
+open stream costs a task rather than a thread. Every other route is served by
+the Flask app from server.py through WSGIMiddleware.
+"""
+import asyncio
+import contextlib
+import tts
+from ai import DEFAULT_AGENT_NAME, ask_open_gpt_async
+from config import CHAT_SUPERSEDE
+from resources import registry
+from server import app as flask_app, chat_batcher
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+
+async def chat(request):
+    data = await request.json()
+    user_id = data.get("userId", "default_user")
+    message = data.get("message", "")
+    fromVoice = data.get("isFromVoice", False)
+
+    agent_data = data.get("agent", {})
+    agent_name = agent_data.get("name", DEFAULT_AGENT_NAME)
+    system_prompt = agent_data.get("systemPrompt", None)
+
+    batcher = chat_batcher(request.query_params.get("framing"))
+    # Starlette cancels the response task when the client disconnects, which closes the upstream stream
+    events = ask_open_gpt_async(user_id, message, agent_name, system_prompt, fromVoice=fromVoice,
+                                supersede=data.get("supersede", CHAT_SUPERSEDE))
+    return StreamingResponse(batcher.abatch(events), media_type=batcher.mimetype)
+
+
+async def speak(request):
+    data = await request.json()
+    text = data.get("text", "")
+    if not text:
+        return JSONResponse({"error": "No text provided"}, status_code=400)
+
+    try:
+        chunks, cache_status = await tts.speak_async(text, data.get("voice"))
+    except tts.TTSError as e:
+        return JSONResponse({"error": str(e)}, status_code=502)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+    return StreamingResponse(chunks, media_type="audio/wav", headers={"X-Cache": cache_status})
+
+
+async def stream(request):
+    """MJPEG camera stream; each viewer awaits frames from the broadcaster instead of blocking a thread."""
+    camera_manager = await asyncio.to_thread(registry.get, "camera")
+    try:
+        subscriber = camera_manager.subscribe(request.query_params.get("profile"), loop=asyncio.get_running_loop())
+    except KeyError as e:
+        return JSONResponse({"error": str(e), "profiles": list(camera_manager.profiles)}, status_code=400)
+
+    async def generate():
+        try:
+            async for frame in subscriber:
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+        finally:
+            subscriber.close()
+    # The background task releases the profile even if streaming never starts
+    return StreamingResponse(generate(), media_type="multipart/x-mixed-replace; boundary=frame",
+                             background=BackgroundTask(subscriber.close))
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    registry.warm_up()
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route("/chat", chat, methods=["POST"]),
+        Route("/speak", speak, methods=["POST"]),
+        Route("/stream", stream),
+        Mount("/", WSGIMiddleware(flask_app)),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=5000)
@@ -0,0 +1,359 @@
+import collections
+import concurrent.futures
+import concurrent.futures.process
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import struct
+import threading
+import time
+import wave
+from multiprocessing import shared_memory
+from config import ASR_CHUNK_SECONDS, ASR_MAX_CONCURRENT, ASR_WORKERS, VOSK_MODEL_PATH
+from resources import registry
+
+
+def _load_asr_model():
+    from vosk import Model
+    return Model(VOSK_MODEL_PATH)
+
+
+# Loaded once, on first use or during warm-up
+registry.register("asr_model", _load_asr_model)
+
+STREAM_READ_SIZE = 8000  # Bytes read from the upload per recognizer step (~0.25s of 16 kHz mono PCM)
+STATS_WINDOW = 100  # Requests kept for the rolling ASR stats
+
+
+class RecognizerPool:
+    """Reusable KaldiRecognizers keyed by sample rate, with bounded decode concurrency.
+
+    Recognizers are Reset() when returned, so the next request starts clean without
+    paying for a new decoder graph. Decoding beyond `max_concurrent` at once waits
+    for a slot instead of competing for the CPU.
+    """
+
+    def __init__(self, max_concurrent=ASR_MAX_CONCURRENT):
+        self.max_concurrent = max_concurrent
+        self._idle = collections.defaultdict(list)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self.hits = 0
+        self.misses = 0
+        self.in_use = 0
+        self._recent = collections.deque(maxlen=STATS_WINDOW)
+
+    @contextlib.contextmanager
+    def decode_slot(self):
+        """Hold one of the `max_concurrent` decode slots. Yields the seconds spent waiting for it."""
+        started = time.perf_counter()
+        self._slots.acquire()
+        try:
+            yield time.perf_counter() - started
+        finally:
+            self._slots.release()
+
+    @contextlib.contextmanager
+    def recognizer(self, rate, hold_slot=True):
+        """Borrow a recognizer for `rate`. Yields (recognizer, queue_wait_seconds, pool_hit).
+
+        With hold_slot=False the caller takes decode_slot() itself around each decode, so
+        time spent waiting on something else (e.g. a slow upload) doesn't occupy a slot.
+        """
+        slot = self.decode_slot() if hold_slot else contextlib.nullcontext(0.0)
+        with slot as waited:
+            with self._lock:
+                idle = self._idle[rate]
+                hit = bool(idle)
+                rec = idle.pop() if hit else None
+                if hit:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                self.in_use += 1
+            try:
+                if rec is None:
+                    from vosk import KaldiRecognizer
+                    rec = KaldiRecognizer(registry.get("asr_model"), rate)
+                yield rec, waited, hit
+            finally:
+                # If loading the model or building the recognizer failed, there is nothing to return
+                if rec is not None:
+                    rec.Reset()
+                with self._lock:
+                    if rec is not None:
+                        self._idle[rate].append(rec)
+                    self.in_use -= 1
+
+    def record(self, stats):
+        """Keep a finished request's stats for the rolling averages."""
+        self._recent.append(stats)
+
+    def get_stats(self):
+        recent = list(self._recent)
+        lookups = self.hits + self.misses
+        with self._lock:
+            idle = {rate: len(recs) for rate, recs in self._idle.items()}
+        return {
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "in_use": self.in_use,
+            "idle": idle,
+            "max_concurrent": self.max_concurrent,
+            "workers": ASR_WORKERS,
+            "queue_wait_ms_avg": round(sum(r["queue_wait_ms"] for r in recent) / len(recent), 2) if recent else 0.0,
+            "rtf_avg": round(sum(r["rtf"] for r in recent) / len(recent), 3) if recent else 0.0,
+        }
+
+
+recognizer_pool = RecognizerPool()
+
+
+def _open_wav(buffer):
+    """Open a WAV upload, rejecting anything but 16-bit mono PCM (what the recognizers expect)."""
+    wf = wave.open(buffer, "rb")
+    if wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+        raise wave.Error("Audio must be 16-bit mono PCM")
+    return wf
+
+
+def transcribe_wav(audio_data):
+    """Transcribe a complete WAV upload. Returns (text, stats); raises wave.Error/EOFError on bad input."""
+    wf = _open_wav(io.BytesIO(audio_data))
+    rate = wf.getframerate()
+    chunk_frames = max(int(rate * ASR_CHUNK_SECONDS), 4000)
+    segments = []
+    size = 0
+    with recognizer_pool.recognizer(rate) as (rec, waited, hit):
+        started = time.perf_counter()
+        while True:
+            data = wf.readframes(chunk_frames)
+            if len(data) == 0:
+                break
+            size += len(data)
+            if rec.AcceptWaveform(data):
+                segments.append(json.loads(rec.Result()).get("text", ""))
+        segments.append(json.loads(rec.FinalResult()).get("text", ""))
+        decode = time.perf_counter() - started
+    audio_seconds = size / 2 / rate if rate else 0.0  # The header's frame count may be a streaming placeholder
+    stats = {
+        "pool_hit": hit,
+        "queue_wait_ms": round(waited * 1000, 2),
+        "decode_ms": round(decode * 1000, 2),
+        "audio_s": round(audio_seconds, 3),
+        "rtf": round(decode / audio_seconds, 3) if audio_seconds else 0.0,
+    }
+    recognizer_pool.record(stats)
+    return " ".join(segment for segment in segments if segment), stats
+
+
+# ------ Process pool ------
+# Decoding in worker processes keeps long utterances from holding the GIL that the
+# camera encoders and streaming responses need. Each worker loads its own model once
+# at start; PCM is copied once into shared memory rather than pickled through a pipe.
+
+_worker_model = None
+_worker_recognizers = {}
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def _init_worker(model_path):
+    """Worker initializer: load the Vosk model once for the life of the process."""
+    global _worker_model
+    from vosk import Model
+    _worker_model = Model(model_path)
+
+
+def _warm_worker():
+    return os.getpid()
+
+
+def _decode_shared(shm_name, size, rate, chunk_frames):
+    """Decode 16-bit mono PCM from a shared memory block. Runs in a worker process."""
+    started = time.monotonic()
+    rec = _worker_recognizers.get(rate)
+    hit = rec is not None
+    if not hit:
+        from vosk import KaldiRecognizer
+        rec = _worker_recognizers[rate] = KaldiRecognizer(_worker_model, rate)
+    segments = []
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        pcm = shm.buf[:size]
+        step = chunk_frames * 2
+        for offset in range(0, size, step):
+            # Vosk's cffi binding only takes bytes, so each chunk is copied out of the segment
+            if rec.AcceptWaveform(bytes(pcm[offset:offset + step])):
+                segments.append(json.loads(rec.Result()).get("text", ""))
+        segments.append(json.loads(rec.FinalResult()).get("text", ""))
+        pcm.release()
+    finally:
+        shm.close()
+        rec.Reset()
+    return segments, started, time.monotonic() - started, hit, os.getpid()
+
+
+def start_worker_pool(workers=ASR_WORKERS):
+    """Start and pre-warm the decoder processes. Returns None when running in-process."""
+    global _process_pool
+    if workers <= 0:
+        return None
+    with _process_pool_lock:
+        if _process_pool is None:
+            # Not fork: by now the server has camera, broadcaster and warm-up threads, and a child
+            # forked mid-lock can deadlock. Workers load their own model in _init_worker.
+            _process_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("forkserver"),
+                initializer=_init_worker,
+                initargs=(VOSK_MODEL_PATH,),
+            )
+            for future in [_process_pool.submit(_warm_worker) for _ in range(workers)]:
+                future.result()
+    return _process_pool
+
+
+registry.register("asr_workers", start_worker_pool)
+
+
+def _reset_worker_pool(pool):
+    """Discard a pool whose worker died, so the next request starts a fresh one."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+            registry.reset("asr_workers")
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def transcribe_wav_in_worker(audio_data):
+    """Like transcribe_wav(), but decodes in the process pool. Falls back to in-process with no workers."""
+    pool = registry.get("asr_workers")
+    if pool is None:
+        return transcribe_wav(audio_data)
+
+    buffer = io.BytesIO(audio_data)
+    wf = _open_wav(buffer)
+    rate = wf.getframerate()
+    chunk_frames = max(int(rate * ASR_CHUNK_SECONDS), 4000)
+    # wave.open() stops at the start of the data chunk. Size the segment from the bytes
+    # actually uploaded, not the header, which streaming clients fill with 0xFFFFFFFF.
+    offset = buffer.tell()
+    size = min(wf.getnframes() * 2, len(audio_data) - offset)
+    size = max(size - size % 2, 0)
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        with memoryview(audio_data) as view:
+            shm.buf[:size] = view[offset:offset + size]
+        submitted = time.monotonic()
+        segments, started, decode, hit, pid = pool.submit(_decode_shared, shm.name, size, rate, chunk_frames).result()
+    except concurrent.futures.process.BrokenProcessPool as e:
+        print(f"[WARN] ASR worker died ({e}); restarting the pool and decoding this request in-process")
+        _reset_worker_pool(pool)
+        return transcribe_wav(audio_data)
+    finally:
+        shm.close()
+        shm.unlink()
+
+    audio_seconds = size / 2 / rate if rate else 0.0
+    stats = {
+        "pool_hit": hit,
+        "queue_wait_ms": round(max(started - submitted, 0.0) * 1000, 2),
+        "decode_ms": round(decode * 1000, 2),
+        "audio_s": round(audio_seconds, 3),
+        "rtf": round(decode / audio_seconds, 3) if audio_seconds else 0.0,
+        "worker": pid,
+    }
+    recognizer_pool.record(stats)
+    return " ".join(segment for segment in segments if segment), stats
+
+
+def read_exact(stream, size):
+    """Read exactly `size` bytes from a file-like stream, or raise ValueError on EOF."""
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise ValueError("Unexpected end of audio stream")
+        data += chunk
+    return data
+
+
+def read_wav_header(stream):
+    """Consume a RIFF/WAVE header from a stream and return (rate, channels, sample_width).
+
+    Leaves the stream positioned at the start of the PCM data, so the rest can be fed
+    to a recognizer as it arrives. The data chunk size is ignored, since streaming
+    clients often write 0 or 0xFFFFFFFF there.
+    """
+    riff, _, wave_id = struct.unpack("<4sI4s", read_exact(stream, 12))
+    if riff != b"RIFF" or wave_id != b"WAVE":
+        raise ValueError("Not a WAV stream")
+    fmt = None
+    while True:
+        chunk_id, chunk_size = struct.unpack("<4sI", read_exact(stream, 8))
+        if chunk_id == b"data":
+            break
+        body = read_exact(stream, chunk_size + (chunk_size & 1))
+        if chunk_id == b"fmt ":
+            fmt = struct.unpack("<HHIIHH", body[:16])
+    if fmt is None:
+        raise ValueError("WAV stream has no fmt chunk")
+    audio_format, channels, rate, _, _, bits = fmt
+    if audio_format != 1:
+        raise ValueError("Only PCM WAV is supported")
+    return rate, channels, bits // 8
+
+
+def frame_aligned(chunks, frame_size=2):
+    """Re-cut byte chunks to whole frames, carrying any partial frame over to the next chunk.
+
+    Chunked uploads arrive in whatever sizes the client sent; feeding an odd-length
+    chunk to a recognizer would shift every later 16-bit sample by a byte.
+    """
+    leftover = b""
+    for chunk in chunks:
+        data = leftover + chunk if leftover else chunk
+        usable = len(data) - len(data) % frame_size
+        leftover = data[usable:]
+        if usable:
+            yield data[:usable]
+
+
+def stream_transcribe(chunks, rate):
+    """Feed PCM chunks to a recognizer as they arrive and yield partial/final events.
+
+    Yields {"type": "partial"} while an utterance is in progress, {"type": "final"} each
+    time the recognizer detects an endpoint, and a closing {"type": "done"} with the
+    full transcript once the input is exhausted. Chunks may be any length; they are
+    re-cut to whole 16-bit samples first. The recognizer comes from the shared
+    pool; a decode slot is only held while a chunk is being decoded, not while
+    waiting for the next one to arrive.
+    """
+    segments = []
+    last_partial = ""
+    with recognizer_pool.recognizer(rate, hold_slot=False) as (rec, _, _):
+        for chunk in frame_aligned(chunks):
+            with recognizer_pool.decode_slot():
+                accepted = rec.AcceptWaveform(chunk)
+            if accepted:
+                text = json.loads(rec.Result()).get("text", "")
+                last_partial = ""
+                if text:
+                    segments.append(text)
+                    yield {"type": "final", "text": text}
+            else:
+                partial = json.loads(rec.PartialResult()).get("partial", "")
+                if partial and partial != last_partial:
+                    last_partial = partial
+                    yield {"type": "partial", "text": partial}
+        with recognizer_pool.decode_slot():
+            text = json.loads(rec.FinalResult()).get("text", "")
+    if text:
+        segments.append(text)
+        yield {"type": "final", "text": text}
+    yield {"type": "done", "text": " ".join(segments)}
@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from bench_stubs import start_stub_llm
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else float("nan")
+
+
+async def open_chat_streams(url, clients):
+    """Open `clients` /chat streams at once; return first-token latencies, completed count and peak server threads."""
+    import httpx
+    first_tokens, completed, peak_threads = [], 0, threading.active_count()
+
+    async def one(i):
+        nonlocal completed, peak_threads
+        started = time.perf_counter()
+        payload = {"userId": f"bench_{time.monotonic_ns()}_{i}", "message": "What's the weather?"}
+        async with client.stream("POST", f"{url}/chat", json=payload) as response:
+            first = True
+            async for line in response.aiter_lines():
+                if first and '"response"' in line:
+                    first_tokens.append(time.perf_counter() - started)
+                    first = False
+                peak_threads = max(peak_threads, threading.active_count())
+        completed += 1
+
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=0)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        results = await asyncio.gather(*(one(i) for i in range(clients)), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, Exception)]
+    return first_tokens, completed, len(errors), peak_threads
+
+
+def start_flask(port):
+    from server import app
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{port}"
+
+
+def start_asgi(port):
+    import uvicorn
+    from asgi_server import app
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent /chat streams: Flask threaded mode vs. the ASGI server.")
+    parser.add_argument("--clients", default="10,100,300")
+    parser.add_argument("--token-delay", type=float, default=0.05, help="stub LLM seconds per token")
+    args = parser.parse_args()
+
+    _, llm_url = start_stub_llm(token_delay=args.token_delay, first_token_delay=0.2, embedding_delay=0.01)
+    tmp = tempfile.mkdtemp()
+    # Point the server at the stub, keep memory in a scratch dir, and skip camera/ASR warm-up
+    os.environ.update({
+        "LLM_API_BASE": f"{llm_url}/v1", "WARM_UP_RESOURCES": "", "CONTEXT_RECALL_MATCHES": "0",
+        "HISTORY_DB_PATH": os.path.join(tmp, "history.db"), "CHROMA_DB_PATH": os.path.join(tmp, "chroma"),
+        "CHROMA_COLLECTION": "bench", "EMBEDDING_CACHE_PATH": "",
+    })
+
+    modes = {"flask": start_flask(5101), "asgi": start_asgi(5102)}
+    for clients in map(int, args.clients.split(",")):
+        for mode, url in modes.items():
+            baseline_threads = threading.active_count()
+            first_tokens, completed, errors, peak_threads = asyncio.run(open_chat_streams(url, clients))
+            print(f"{mode:5s} clients={clients:3d} completed={completed:3d} errors={errors:3d} "
+                  f"first_token_p50={percentile(first_tokens, 0.5):.3f}s p99={percentile(first_tokens, 0.99):.3f}s "
+                  f"extra_threads={peak_threads - baseline_threads}")
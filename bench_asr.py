@@ -0,0 +1,152 @@
+import argparse
+import http.client
+import json
+import threading
+import time
+import wave
+from urllib.parse import urlparse
+
+CHUNK_SECONDS = 0.1  # Audio sent per chunk while replaying a fixture at real-time speed
+
+
+def load_fixture(path):
+    """Return (wav_bytes, header_bytes, pcm_bytes, rate, duration) for a WAV fixture."""
+    with open(path, "rb") as f:
+        wav_bytes = f.read()
+    with wave.open(path, "rb") as wf:
+        rate = wf.getframerate()
+        frames = wf.getnframes()
+        pcm = wf.readframes(frames)
+    header = wav_bytes[:len(wav_bytes) - len(pcm)]
+    return wav_bytes, header, pcm, rate, frames / rate
+
+
+def bench_batch(url, path):
+    """Record the whole utterance first, then upload it to /asr: latency counts from end of speech."""
+    wav_bytes, _, _, _, duration = load_fixture(path)
+    time.sleep(duration)  # The client can't upload until recording stops
+    target = urlparse(url)
+    conn = http.client.HTTPConnection(target.hostname, target.port)
+    speech_end = time.perf_counter()
+    conn.request("POST", "/asr", body=wav_bytes, headers={"Content-Type": "audio/wav"})
+    text = json.loads(conn.getresponse().read()).get("text", "")
+    return {"final_latency": time.perf_counter() - speech_end, "first_partial": None, "text": text}
+
+
+def bench_stream(url, path):
+    """Replay the fixture to /asr/stream at real-time speed while reading events as they arrive."""
+    _, header, pcm, rate, duration = load_fixture(path)
+    target = urlparse(url)
+    conn = http.client.HTTPConnection(target.hostname, target.port)
+    conn.putrequest("POST", "/asr/stream")
+    conn.putheader("Content-Type", "audio/wav")
+    conn.putheader("Transfer-Encoding", "chunked")
+    conn.endheaders()
+
+    chunk_bytes = int(rate * CHUNK_SECONDS) * 2
+    marks = {}
+
+    def send_chunk(data):
+        conn.send(b"%x\r\n%s\r\n" % (len(data), data))
+
+    def upload():
+        marks["start"] = time.perf_counter()
+        send_chunk(header)
+        for offset in range(0, len(pcm), chunk_bytes):
+            send_chunk(pcm[offset:offset + chunk_bytes])
+            time.sleep(CHUNK_SECONDS)
+        marks["speech_end"] = time.perf_counter()
+        conn.send(b"0\r\n\r\n")
+
+    uploader = threading.Thread(target=upload)
+    uploader.start()
+    response = conn.getresponse()
+    first_partial = None
+    text = ""
+    for line in response:
+        event = json.loads(line)
+        if event["type"] == "partial" and first_partial is None:
+            first_partial = time.perf_counter() - marks["start"]
+        if event["type"] == "done":
+            text = event["text"]
+            break
+    done = time.perf_counter()
+    uploader.join()
+    return {"final_latency": done - marks["speech_end"], "first_partial": first_partial, "text": text}
+
+
+def count_stream_frames(url, stop, result):
+    """Read /stream while the load runs and count MJPEG parts received."""
+    target = urlparse(url)
+    conn = http.client.HTTPConnection(target.hostname, target.port)
+    conn.request("GET", "/stream")
+    response = conn.getresponse()
+    frames = 0
+    started = time.perf_counter()
+    while not stop.is_set():
+        chunk = response.read1(65536)
+        if not chunk:
+            break
+        frames += chunk.count(b"--frame")
+    result["fps"] = frames / (time.perf_counter() - started)
+    conn.close()
+
+
+def bench_load(url, path, concurrency, duration):
+    """Hammer /asr with `concurrency` clients and report throughput plus /stream frame rate meanwhile.
+
+    Run once against a server started with ASR_WORKERS=0 and once with worker processes
+    to compare in-process and process-pool decoding.
+    """
+    wav_bytes, _, _, _, audio_seconds = load_fixture(path)
+    target = urlparse(url)
+    stop = threading.Event()
+    latencies = []
+    stream_result = {}
+
+    def client():
+        conn = http.client.HTTPConnection(target.hostname, target.port)
+        while not stop.is_set():
+            started = time.perf_counter()
+            conn.request("POST", "/asr", body=wav_bytes, headers={"Content-Type": "audio/wav"})
+            conn.getresponse().read()
+            latencies.append(time.perf_counter() - started)
+
+    streamer = threading.Thread(target=count_stream_frames, args=(url, stop, stream_result))
+    streamer.start()
+    time.sleep(1.0)  # Let the stream settle before the load starts
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in clients:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in clients + [streamer]:
+        t.join()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] if latencies else 0.0
+    print(
+        f"concurrency={concurrency} requests={len(latencies)} req/s={len(latencies) / duration:.2f} "
+        f"audio_s/s={len(latencies) * audio_seconds / duration:.2f} p50={p50:.3f}s "
+        f"stream_fps={stream_result.get('fps', 0.0):.1f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare /asr upload-then-decode with /asr/stream on recorded WAVs.")
+    parser.add_argument("fixtures", nargs="+", help="16-bit mono WAV recordings")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--load", type=int, default=0, help="run a concurrent /asr load test with this many clients")
+    parser.add_argument("--duration", type=float, default=20.0)
+    args = parser.parse_args()
+
+    if args.load:
+        for concurrency in sorted({1, args.load}):
+            bench_load(args.url, args.fixtures[0], concurrency, args.duration)
+        raise SystemExit
+
+    for path in args.fixtures:
+        for name, bench in (("batch", bench_batch), ("stream", bench_stream)):
+            result = bench(args.url, path)
+            first = f"{result['first_partial']:.3f}s" if result["first_partial"] is not None else "-"
+            print(f"{path} {name:6s} final_after_speech={result['final_latency']:.3f}s first_partial={first} text={result['text']!r}")
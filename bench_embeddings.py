@@ -0,0 +1,52 @@
+import argparse
+import os
+import threading
+import time
+from bench_stubs import start_stub_llm
+
+
+def run(label, turn, server, users, turns):
+    """Run `turns` chat turns for each of `users` concurrent users and count embedding round trips."""
+    calls_before = server.embedding_calls
+    run_id = time.monotonic_ns()  # Keeps texts unique across runs so earlier runs don't warm the cache
+    started = time.perf_counter()
+    threads = [threading.Thread(target=lambda u=u: [turn(f"{run_id}-{u}", t) for t in range(turns)]) for u in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    calls = server.embedding_calls - calls_before
+    print(f"{label:8s} users={users:2d} calls/turn={calls / (users * turns):.2f} "
+          f"turn_embed_ms={elapsed / turns * 1000:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embedding round trips per chat turn, before and after the shared service.")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--embedding-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    server, llm_url = start_stub_llm(embedding_delay=args.embedding_delay)
+    os.environ["LLM_API_BASE"] = f"{llm_url}/v1"
+    os.environ["EMBEDDING_CACHE_PATH"] = ""
+
+    from embeddings import embedding_service, get_embedding, get_embeddings
+    from resources import get_llm_client
+
+    def legacy_turn(user, t):
+        """ask_t800 before: retrieve_memory + two store_message calls, one request each."""
+        question, answer = f"user {user} question {t}", f"answer {t} for user {user}"
+        for text in (question, question, answer):
+            get_llm_client().embeddings.create(input=[text], model="stub")
+
+    def service_turn(user, t):
+        """ask_t800 now: the question embedding is reused from retrieval and both stores share one call."""
+        question, answer = f"user {user} question {t}", f"answer {t} for user {user}"
+        get_embedding(question)
+        get_embeddings([question, answer])
+
+    for users in (1, 10):
+        run("legacy", legacy_turn, server, users, args.turns)
+        run("service", service_turn, server, users, args.turns)
+    print(embedding_service.get_stats())
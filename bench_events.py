@@ -0,0 +1,81 @@
+import argparse
+import json
+import socket
+import struct
+import threading
+import time
+from event_stream import EventBatcher
+
+TOKEN = "tok "  # Every simulated delta is this 4-character token
+
+
+def token_events(count, delay, thinking):
+    """A reasoning phase then an answer, one delta per token, like ask_open_gpt."""
+    for i in range(count):
+        yield {"type": "thinking" if i < thinking else "response", "content": TOKEN}
+        time.sleep(delay)
+
+
+def read_tokens(sock, framing, received):
+    """Parse frames off the socket, recording the arrival time of every token."""
+    buffer = b""
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            return
+        now = time.perf_counter()
+        buffer += data
+        while True:
+            if framing == "ndjson":
+                line, sep, rest = buffer.partition(b"\n")
+                if not sep:
+                    break
+                buffer, content = rest, json.loads(line)["content"]
+            else:
+                if len(buffer) < 5:
+                    break
+                _, length = struct.unpack(">BI", buffer[:5])
+                if len(buffer) < 5 + length:
+                    break
+                content, buffer = buffer[5:5 + length].decode("utf-8"), buffer[5 + length:]
+            received.extend([now] * (len(content) // len(TOKEN)))
+
+
+def run(label, flush_ms, framing, count, delay, thinking):
+    batcher = EventBatcher(flush_ms=flush_ms, framing=framing)
+    writer, reader = socket.socketpair()
+    received = []
+    reader_thread = threading.Thread(target=read_tokens, args=(reader, framing, received))
+    reader_thread.start()
+
+    produced = []
+
+    def timed_events():
+        for event in token_events(count, delay, thinking):
+            produced.append(time.perf_counter())
+            yield event
+
+    started = time.perf_counter()
+    for data in batcher.batch(timed_events()):
+        writer.sendall(data)
+    writer.close()
+    reader_thread.join()
+    elapsed = time.perf_counter() - started
+    latencies = sorted(r - p for p, r in zip(produced, received))
+    stats = batcher.stats
+    print(f"{label:18s} writes={stats['writes']:5d} bytes={stats['bytes']:7d} "
+          f"events/s={stats['events_out'] / elapsed:7.1f} token_latency_avg={sum(latencies) / len(latencies) * 1000:5.1f}ms "
+          f"p99={latencies[int(len(latencies) * 0.99)] * 1000:5.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes, bytes on the wire and token latency of /chat event batching.")
+    parser.add_argument("--tokens", type=int, default=2500)
+    parser.add_argument("--token-delay", type=float, default=0.002, help="seconds between generated tokens")
+    parser.add_argument("--thinking", type=int, default=500, help="how many of the tokens are reasoning")
+    args = parser.parse_args()
+
+    run("per-event ndjson", 0, "ndjson", args.tokens, args.token_delay, args.thinking)
+    for flush_ms in (10, 30, 100):
+        run(f"batched {flush_ms}ms ndjson", flush_ms, "ndjson", args.tokens, args.token_delay, args.thinking)
+    run("batched 30ms binary", 30, "binary", args.tokens, args.token_delay, args.thinking)
@@ -0,0 +1,61 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from history import HistoryStore
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def legacy_turn(db, user_id, num_recent=8):
+    """What a turn cost before: every message for the user fetched, parsed and sorted, then fetched again to count.
+    A plain SQLite table stands in for chat_collection.get(where={"user_id": ...})."""
+    rows = db.execute("SELECT id, role, document FROM collection WHERE user_id = ?", (user_id,)).fetchall()
+    history = sorted((float(_id.split("_")[-1]), role, doc, _id) for _id, role, doc in rows)
+    summary, recent = None, []
+    for _, role, msg, _ in history:
+        if role == "summary":
+            summary, recent = msg, []
+        else:
+            recent.append((role, msg))
+    recent = recent[-num_recent:]
+    roles = db.execute("SELECT role FROM collection WHERE user_id = ?", (user_id,)).fetchall()
+    return summary, recent, sum(1 for (role,) in roles if role != "summary")
+
+
+def store_turn(store, user_id, num_recent=8):
+    latest = store.latest_summary(user_id)
+    summary_seq, summary, _ = latest if latest else (0, None, None)
+    return summary, store.tail(user_id, num_recent, after_seq=summary_seq), store.count(user_id)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-turn history read latency as a user's history grows.")
+    parser.add_argument("--sizes", default="100,1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HistoryStore(os.path.join(tmp, "history.db"))
+        db = sqlite3.connect(os.path.join(tmp, "legacy.db"))
+        db.execute("CREATE TABLE collection (id TEXT PRIMARY KEY, user_id TEXT, role TEXT, document TEXT)")
+        db.execute("CREATE INDEX collection_user ON collection (user_id)")
+        base = time.time()
+        for size in map(int, args.sizes.split(",")):
+            user_id = f"user{size}"
+            messages = [("summary" if i == size // 2 else ("user", "assistant")[i % 2], f"message {i} " + "x" * 200)
+                        for i in range(size)]
+            store.append(user_id, [(role, text, None) for role, text in messages])
+            db.executemany("INSERT INTO collection VALUES (?, ?, ?, ?)",
+                           [(f"{user_id}_{base + i * 1e-3}", user_id, role, text) for i, (role, text) in enumerate(messages)])
+            db.commit()
+            assert store_turn(store, user_id)[0] == legacy_turn(db, user_id)[0]
+            legacy_ms = timed(lambda: legacy_turn(db, user_id), args.repeat)
+            store_ms = timed(lambda: store_turn(store, user_id), args.repeat)
+            print(f"messages={size:6d} full_scan_ms={legacy_ms:8.2f} history_store_ms={store_ms:6.3f}")
@@ -0,0 +1,65 @@
+import argparse
+import threading
+import time
+from bench_stubs import start_stub_llm
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else float("nan")
+
+
+def run(label, backends, clients, turns):
+    """`clients` users each send `turns` streamed chats at once through a router over `backends`."""
+    from llm_router import LLMRouter, RoutedClient
+    router = LLMRouter(backends=backends, cooldown=30)
+    client = RoutedClient(router)
+    first_tokens, totals, errors = [], [], []
+
+    def user(i):
+        for turn in range(turns):
+            started = time.perf_counter()
+            try:
+                stream = client.chat.completions.create(
+                    model="stub", messages=[{"role": "user", "content": f"turn {turn} " * 200}],
+                    max_tokens=60, stream=True, user=f"user_{i}",
+                )
+                first = None
+                for _ in stream:
+                    if first is None:
+                        first = time.perf_counter() - started
+                first_tokens.append(first)
+                totals.append(time.perf_counter() - started)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stats = router.get_stats()
+    share = " ".join(f"{b['url'].split(':')[-1].split('/')[0]}={b['requests']}" for b in stats["backends"])
+    print(f"{label:22s} chats={len(totals):3d} errors={len(errors)} wall={elapsed:5.1f}s "
+          f"first_token_p50={percentile(first_tokens, 0.5):.2f}s p99={percentile(first_tokens, 0.99):.2f}s "
+          f"total_p50={percentile(totals, 0.5):.2f}s failovers={stats['failovers']} "
+          f"affinity_hits={stats['affinity_hits']} requests_by_port: {share}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM router: one backend vs. a pool of stubs with differing speed.")
+    parser.add_argument("--clients", type=int, default=12)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=2, help="concurrent requests per backend")
+    args = parser.parse_args()
+
+    # Fast, medium and slow boxes; the stub answers one request per thread, so the limit models GPU slots
+    speeds = [(0.01, 0.1), (0.02, 0.2), (0.05, 0.4)]
+    urls = [f"{start_stub_llm(token_delay=token, first_token_delay=first)[1]}/v1" for token, first in speeds]
+    dead = "http://127.0.0.1:9/v1"  # Nothing listens here: connection refused before the first token
+
+    run("single (fast box)", [(urls[0], args.limit)], args.clients, args.turns)
+    run("pool of 3", [(url, args.limit) for url in urls], args.clients, args.turns)
+    run("pool of 3 + dead", [(dead, args.limit)] + [(url, args.limit) for url in urls], args.clients, args.turns)
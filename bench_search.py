@@ -0,0 +1,41 @@
+import argparse
+import os
+import random
+import time
+from bench_stubs import start_stub_search
+
+QUERIES = ["weather today", "latest news", "Weather  today", "skynet founding date", "latest news!",
+           "cyberdyne systems", "nba scores tonight", "who wrote the terminator"]
+
+
+def run(label, cache, lookups, seed):
+    rng = random.Random(seed)
+    latencies = []
+    for _ in range(lookups):
+        started = time.perf_counter()
+        cache.search(rng.choice(QUERIES))
+        latencies.append(time.perf_counter() - started)
+    stats = cache.get_stats()
+    print(f"{label:14s} lookups={lookups} avg={sum(latencies) / len(latencies) * 1000:6.1f}ms "
+          f"hit_ratio={stats['hit_ratio']:.3f} stale_hits={stats['stale_hits']} saved_ms={stats['saved_ms']:.0f} "
+          f"fetch_ms_avg={stats['fetch_ms_avg']:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Web search latency and hit ratio with and without the result cache.")
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--search-delay", type=float, default=0.25, help="stub search seconds per query")
+    args = parser.parse_args()
+
+    server, search_url = start_stub_search(delay=args.search_delay)
+    os.environ["SEARCH_API_URL"] = search_url
+    from search import SearchCache
+
+    run("no cache", SearchCache(max_entries=0, stale_seconds=0), args.lookups, seed=1)
+    run("cache", SearchCache(), args.lookups, seed=1)
+    # Every entry goes stale at once: answers keep coming from the cache while refreshes run behind them
+    expiring = SearchCache(stale_seconds=3600)
+    run("cache (warm)", expiring, len(QUERIES) * 4, seed=2)
+    expiring._entries = type(expiring._entries)((key, (0.0, results)) for key, (_, results) in expiring._entries.items())
+    run("stale+refresh", expiring, args.lookups, seed=3)
+    print(f"stub search requests: {server.request_count}")
@@ -0,0 +1,65 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def poll(url, deadline):
+    """GET `url` until it answers 200 or the deadline passes. Returns the decoded JSON body or None."""
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return json.loads(response.read())
+        except OSError:
+            pass
+        time.sleep(0.05)
+    return None
+
+
+def bench(script, port, warm_up, timeout):
+    """Start `script`, then time process start -> first /healthz answer -> every resource warm."""
+    env = dict(os.environ)
+    if warm_up is not None:
+        env["WARM_UP_RESOURCES"] = warm_up
+    url = f"http://127.0.0.1:{port}/healthz"
+    started = time.perf_counter()
+    deadline = started + timeout
+    proc = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, script)], cwd=BASE_DIR, env=env)
+    try:
+        status = poll(url, deadline)
+        if status is None:
+            print(f"{script}: no /healthz answer within {timeout:.0f}s")
+            return
+        first_request = time.perf_counter() - started
+        # Wait for the warm-up list to settle (all registered resources when using the default list)
+        expected = [name for name in warm_up.split(",") if name] if warm_up is not None else None
+
+        def settled(resources):
+            return all(r["warm"] or r["error"] for name, r in resources.items() if expected is None or name in expected)
+
+        while time.perf_counter() < deadline and not settled(status["resources"]):
+            time.sleep(0.1)
+            status = poll(url, deadline) or status
+        all_warm = time.perf_counter() - started
+        print(f"{script}: first_request={first_request:.2f}s all_resources_settled={all_warm:.2f}s")
+        for name, resource in status["resources"].items():
+            print(f"  {name:16s} warm={resource['warm']!s:5s} load={resource['load_seconds']}s error={resource['error']}")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure server import-to-first-request time.")
+    parser.add_argument("--script", default="server.py")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--warm-up", default=None, help="override WARM_UP_RESOURCES (empty string = fully lazy)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+    bench(args.script, args.port, args.warm_up, args.timeout)
@@ -0,0 +1,121 @@
+import argparse
+import os
+import threading
+import time
+from frame_broadcaster import FrameBroadcaster
+
+
+class FakeCamera:
+    """Stands in for CameraManager: publishes a fixed-size JPEG-sized blob at a target FPS."""
+
+    def __init__(self, fps=30, frame_size=40_000):
+        self.fps = fps
+        self.frame_size = frame_size
+        self.frame_buffer = None
+        self.frame_seq = 0
+        self.lock = threading.Lock()
+        self.frame_ready = threading.Condition(self.lock)
+        self.broadcaster = FrameBroadcaster(self.wait_for_frame)
+        self._running = True
+        self.thread = threading.Thread(target=self._update_frame, daemon=True)
+        self.thread.start()
+
+    def _update_frame(self):
+        interval = 1.0 / self.fps
+        while self._running:
+            frame = os.urandom(self.frame_size)
+            with self.lock:
+                self.frame_buffer = frame
+                self.frame_seq += 1
+                self.frame_ready.notify_all()
+            time.sleep(interval)
+
+    def stop(self):
+        self._running = False
+
+    def get_frame(self):
+        with self.lock:
+            return self.frame_buffer
+
+    def wait_for_frame(self, last_seq=0, timeout=None):
+        with self.frame_ready:
+            if not self.frame_ready.wait_for(lambda: self.frame_seq > last_seq, timeout):
+                return None
+            return self.frame_seq, self.frame_buffer
+
+
+def poll_client(camera, stop, stats, send_delay):
+    """The original generate_frames(): spin on get_frame() and resend whatever is there."""
+    start_cpu = time.thread_time()
+    frames = 0
+    while not stop.is_set():
+        frame = camera.get_frame()
+        if frame is None:
+            continue
+        frames += 1
+        if send_delay:
+            time.sleep(send_delay)
+    stats.append((frames, time.thread_time() - start_cpu))
+
+
+def broadcast_client(camera, stop, stats, send_delay):
+    """The broadcaster-backed generate_frames(): one delivery per captured frame."""
+    start_cpu = time.thread_time()
+    frames = 0
+    with camera.broadcaster.subscribe() as subscriber:
+        while not stop.is_set():
+            if subscriber.get(timeout=0.1) is None:
+                continue
+            frames += 1
+            if send_delay:
+                time.sleep(send_delay)
+    stats.append((frames, time.thread_time() - start_cpu))
+
+
+def run(mode, clients, duration, fps, slow_clients):
+    camera = FakeCamera(fps=fps)
+    target = poll_client if mode == "poll" else broadcast_client
+    stop = threading.Event()
+    stats = []
+    threads = []
+    for i in range(clients):
+        # Slow clients simulate a phone on a bad link: 4x longer to send a frame than the capture interval.
+        send_delay = 4.0 / fps if i < slow_clients else 0
+        t = threading.Thread(target=target, args=(camera, stop, stats, send_delay), daemon=True)
+        threads.append(t)
+
+    start_seq = camera.frame_seq
+    start_cpu = time.process_time()
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    captured = camera.frame_seq - start_seq
+    process_cpu = time.process_time() - start_cpu
+    camera.stop()
+
+    delivered = sum(frames for frames, _ in stats)
+    client_cpu = sum(cpu for _, cpu in stats)
+    print(
+        f"{mode:9s} clients={clients:3d} captured={captured:5d} "
+        f"delivered/client={delivered / clients:9.1f} "
+        f"ratio={delivered / max(captured * clients, 1):7.2f} "
+        f"cpu/viewer={client_cpu / clients / duration * 100:6.1f}% "
+        f"process_cpu={process_cpu / duration * 100:6.1f}%"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure /stream fan-out cost with a fake camera source.")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--slow-clients", type=int, default=0, help="how many viewers simulate a slow link")
+    parser.add_argument("--mode", choices=["poll", "broadcast", "both"], default="both")
+    args = parser.parse_args()
+
+    modes = ["poll", "broadcast"] if args.mode == "both" else [args.mode]
+    for clients in (1, 5, 20):
+        for mode in modes:
+            run(mode, clients, args.duration, args.fps, min(args.slow_clients, clients))
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import struct
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = (
+    "Well howdy there, sugar! The weather today is looking mighty fine. "
+    "I reckon you could take a nice long walk this afternoon. "
+    "Just don't forget your hat, because that sun can be fierce. "
+    "Is there anything else I can help you with?"
+)
+
+
+def _start(handler, port, **attrs):
+    """Start a threaded HTTP server on 127.0.0.1 in the background. Extra attrs are set on the server."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    for name, value in attrs.items():
+        setattr(server, name, value)
+    server.request_count = 0
+    server.count_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        with self.server.count_lock:
+            self.server.request_count += 1
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, body, status=200):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def fake_embedding(text, dims=64):
+    """Deterministic pseudo-embedding so identical texts map to identical vectors."""
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [(digest[i % len(digest)] - 128) / 128 for i in range(dims)]
+
+
+class StubLLMHandler(_StubHandler):
+    """OpenAI-compatible /v1/chat/completions that streams a canned reply at a fixed token rate,
+    plus /v1/embeddings that answers after a fixed round-trip delay."""
+
+    def do_POST(self):
+        body = self._read_json()
+        if self.path.endswith("/embeddings"):
+            return self._embeddings(body)
+        if not self.path.endswith("/chat/completions"):
+            return self._send_json({"error": "not found"}, 404)
+        reply = self.server.reply(body) if callable(self.server.reply) else self.server.reply
+        model = body.get("model", "stub")
+        time.sleep(self.server.first_token_delay)
+        if not body.get("stream"):
+            return self._send_json({
+                "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(reply.split()), "total_tokens": len(reply.split())},
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        tokens = [word + " " for word in reply.split(" ")]
+        try:
+            for i, token in enumerate(tokens):
+                self._send_event(model, {"content": token}, None)
+                time.sleep(self.server.token_delay)
+            self._send_event(model, {}, "stop")
+            if body.get("stream_options", {}).get("include_usage"):
+                self._write({"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": model, "choices": [],
+                             "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)}})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _embeddings(self, body):
+        texts = body.get("input", [])
+        texts = [texts] if isinstance(texts, str) else texts
+        with self.server.count_lock:
+            self.server.embedding_calls += 1
+            self.server.embedding_texts += len(texts)
+        time.sleep(self.server.embedding_delay)
+        self._send_json({
+            "object": "list", "model": body.get("model", "stub"),
+            "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(text)} for i, text in enumerate(texts)],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    def _send_event(self, model, delta, finish_reason):
+        self._write({"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": model,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]})
+
+    def _write(self, chunk):
+        self.wfile.write(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+        self.wfile.flush()
+
+
+def start_stub_llm(port=0, reply=DEFAULT_REPLY, token_delay=0.03, first_token_delay=0.3, embedding_delay=0.05):
+    """Stub LLM server. `reply` may be a string or a callable taking the request JSON."""
+    return _start(StubLLMHandler, port, reply=reply, token_delay=token_delay, first_token_delay=first_token_delay,
+                  embedding_delay=embedding_delay, embedding_calls=0, embedding_texts=0)
+
+
+def silent_wav(seconds, rate=16000):
+    """A mono 16-bit WAV of silence, used as synthesized audio."""
+    frames = int(seconds * rate)
+    data = b"\0\0" * frames
+    header = struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + len(data), b"WAVE", b"fmt ", 16, 1, 1, rate,
+                         rate * 2, 2, 16, b"data", len(data))
+    return header + data
+
+
+class StubTTSHandler(_StubHandler):
+    """Stand-in TTS server: synthesis time grows with text length; returns silence of matching length."""
+
+    def do_POST(self):
+        body = self._read_json()
+        text = body.get("text", "")
+        time.sleep(self.server.base_delay + self.server.delay_per_char * len(text))
+        audio = silent_wav(len(text) * 0.06)
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/wav")
+        self.send_header("Content-Length", str(len(audio)))
+        self.end_headers()
+        self.wfile.write(audio)
+
+
+def start_stub_tts(port=0, base_delay=0.15, delay_per_char=0.004):
+    return _start(StubTTSHandler, port, base_delay=base_delay, delay_per_char=delay_per_char)
+
+
+class StubSearchHandler(_StubHandler):
+    """Brave-style web search: answers GET ?q=... with canned results after a fixed delay."""
+
+    def do_GET(self):
+        with self.server.count_lock:
+            self.server.request_count += 1
+        time.sleep(self.server.delay)
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query).get("q", [""])[0]
+        self._send_json({"web": {"results": [
+            {"title": f"Result {i} for {query}", "url": f"https://example.com/{i}", "description": f"About {query}."}
+            for i in range(5)
+        ]}})
+
+
+def start_stub_search(port=0, delay=0.3):
+    return _start(StubSearchHandler, port, delay=delay)
@@ -0,0 +1,64 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+from bench_stubs import start_stub_llm, start_stub_search
+
+ANSWER = "Affirmative. The mission parameters are clear and I will proceed as instructed."
+
+
+def stub_reply(body):
+    """Answer the T-800 prompts the way a cooperative model would: the route, then the answer."""
+    prompt = body["messages"][-1]["content"]
+    if "response_format" in body:
+        search = "latest" in prompt
+        return json.dumps({"needs_search": search, "query": "latest skynet news" if search else "", "use_memory": not search})
+    return ANSWER
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(mode, questions, turns):
+    import ai_processor
+    ai_processor.T800_PIPELINE = mode
+    ai_processor.llm_cache.ttl = 0  # Every turn goes to the stub, as with distinct questions
+    totals, stages = [], {}
+    for i in range(turns):
+        question = questions[i % len(questions)]
+        started = time.perf_counter()
+        response = ai_processor.ask_t800(f"bench_{mode}", question)
+        totals.append(time.perf_counter() - started)
+        for stage, ms in response["timings"].items():
+            if isinstance(ms, (int, float)):
+                stages.setdefault(stage, []).append(ms)
+    breakdown = " ".join(f"{stage}={sum(v) / len(v):.0f}ms" for stage, v in stages.items() if stage != "total")
+    print(f"{mode:8s} turns={turns:3d} p50={percentile(totals, 0.5) * 1000:6.0f}ms "
+          f"p99={percentile(totals, 0.99) * 1000:6.0f}ms  {breakdown}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end ask_t800 turn latency: serial vs. parallel pipeline.")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--llm-delay", type=float, default=0.3, help="stub LLM seconds before answering")
+    parser.add_argument("--search-delay", type=float, default=0.3, help="stub search seconds per query")
+    args = parser.parse_args()
+
+    _, llm_url = start_stub_llm(reply=stub_reply, first_token_delay=args.llm_delay, embedding_delay=0.05)
+    _, search_url = start_stub_search(delay=args.search_delay)
+    tmp = tempfile.mkdtemp()
+    os.environ.update({
+        "LLM_API_BASE": f"{llm_url}/v1", "SEARCH_API_URL": search_url,
+        "HISTORY_DB_PATH": os.path.join(tmp, "history.db"), "CHROMA_DB_PATH": os.path.join(tmp, "chroma"),
+        "CHROMA_COLLECTION": "bench", "EMBEDDING_CACHE_PATH": "",
+    })
+
+    for label, questions in (("search", ["What is the latest news on Skynet?"]),
+                             ("memory", ["What is your mission?"]),
+                             ("mixed", ["What is the latest news on Skynet?", "What is your mission?", "hello there"])):
+        print(f"-- {label} questions")
+        for mode in ("serial", "parallel"):
+            run(mode, questions, args.turns)
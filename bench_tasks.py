@@ -0,0 +1,61 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+from bench_stubs import start_stub_llm, start_stub_search
+
+ANSWER = "<think>Target identified. Assessing.</think>" + " ".join(["Affirmative."] * 40)
+
+
+def stub_reply(body):
+    """Route as memory-only, then answer with a short reasoning block and a long reply."""
+    if "response_format" in body:
+        return json.dumps({"needs_search": False, "query": "", "use_memory": True})
+    return ANSWER
+
+
+def run_blob(turns):
+    from tasks import process_chat_task
+    totals = []
+    for i in range(turns):
+        started = time.perf_counter()
+        process_chat_task.apply(args=(f"bench_blob_{i}", "Tell me about your mission parameters please?")).get()
+        totals.append(time.perf_counter() - started)
+    return totals, totals
+
+
+def run_streamed(turns):
+    from tasks import enqueue_chat, read_chat_events
+    firsts, totals = [], []
+    for i in range(turns):
+        started = time.perf_counter()
+        first = None
+        for event in read_chat_events(enqueue_chat(f"bench_stream_{i}", "Tell me about your mission parameters please?")):
+            if first is None and event["type"] in ("thinking", "response"):
+                first = time.perf_counter() - started
+        firsts.append(first)
+        totals.append(time.perf_counter() - started)
+    return firsts, totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offloaded chat: one result blob vs. streamed task events (in-memory broker).")
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--token-delay", type=float, default=0.03, help="stub LLM seconds per token")
+    args = parser.parse_args()
+
+    _, llm_url = start_stub_llm(reply=stub_reply, token_delay=args.token_delay, first_token_delay=0.2, embedding_delay=0.02)
+    _, search_url = start_stub_search()
+    tmp = tempfile.mkdtemp()
+    os.environ.update({
+        "LLM_API_BASE": f"{llm_url}/v1", "SEARCH_API_URL": search_url,
+        "CELERY_BROKER_URL": "memory://", "CELERY_RESULT_BACKEND": "cache+memory://", "TASK_EVENTS_URL": "memory://",
+        "HISTORY_DB_PATH": os.path.join(tmp, "history.db"), "CHROMA_DB_PATH": os.path.join(tmp, "chroma"),
+        "CHROMA_COLLECTION": "bench", "EMBEDDING_CACHE_PATH": "",
+    })
+
+    for label, run in (("blob", run_blob), ("streamed", run_streamed)):
+        firsts, totals = run(args.turns)
+        print(f"{label:9s} turns={args.turns} first_output_avg={sum(firsts) / len(firsts) * 1000:6.0f}ms "
+              f"total_avg={sum(totals) / len(totals) * 1000:6.0f}ms")
@@ -0,0 +1,59 @@
+import argparse
+import os
+import time
+from bench_stubs import start_stub_llm, start_stub_tts
+
+
+def run(label, turn):
+    """Time one voice turn: first text token, first audio, and completion."""
+    started = time.perf_counter()
+    first_text = first_audio = None
+    for kind in turn():
+        now = time.perf_counter() - started
+        if kind == "text" and first_text is None:
+            first_text = now
+        if kind == "audio" and first_audio is None:
+            first_audio = now
+    total = time.perf_counter() - started
+    print(f"{label:10s} first_token={first_text:.3f}s first_audio={first_audio:.3f}s total={total:.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time-to-first-audio: wait-then-speak vs. speak-while-generating.")
+    parser.add_argument("--token-delay", type=float, default=0.03, help="stub LLM seconds per token")
+    parser.add_argument("--tts-delay", type=float, default=0.004, help="stub TTS seconds per character")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    _, llm_url = start_stub_llm(token_delay=args.token_delay)
+    _, tts_url = start_stub_tts(delay_per_char=args.tts_delay)
+    # Point the server modules at the stubs and disable the TTS cache so every run synthesizes
+    os.environ["LLM_API_BASE"] = f"{llm_url}/v1"
+    os.environ["TTS_URL"] = f"{tts_url}/speak"
+    os.environ["TTS_CACHE_MEMORY_BYTES"] = "0"
+    os.environ["TTS_CACHE_DISK_BYTES"] = "0"
+
+    import tts
+    from ai import ask_open_gpt
+    from voice import stream_voice_reply
+
+    def sequential():
+        """What the app does today: wait for the whole /chat answer, then call /speak once."""
+        text = ""
+        for event in ask_open_gpt("bench_user", "What's the weather?", fromVoice=True):
+            if event["type"] == "response":
+                text += event["content"]
+                yield "text"
+        tts.synthesize(text)
+        yield "audio"
+
+    def pipelined():
+        for event in stream_voice_reply("bench_user", "What's the weather?"):
+            if event["type"] == "response":
+                yield "text"
+            elif event["type"] == "audio":
+                yield "audio"
+
+    for _ in range(args.runs):
+        run("sequential", sequential)
+        run("pipelined", pipelined)
@@ -0,0 +1,78 @@
+from flask import Blueprint, Response, jsonify, request
+from resources import registry
+
+camera_bp = Blueprint("camera", __name__)
+
+
+def _load_camera():
+    from CameraManager import camera_manager
+    return camera_manager
+
+
+registry.register("camera", _load_camera)
+
+MAX_SNAPSHOT_WAIT = 30.0  # Upper bound on /snapshot long-polling, in seconds
+
+
+def generate_frames(subscriber):
+    """Yield each new frame from the singleton camera instance once, as MJPEG parts."""
+    with subscriber:
+        for frame in subscriber:
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+
+
+@camera_bp.route('/stream')
+def stream():
+    """Serve the MJPEG camera stream. `?profile=low` picks a lighter output profile."""
+    camera_manager = registry.get("camera")
+    try:
+        subscriber = camera_manager.subscribe(request.args.get("profile"))
+    except KeyError as e:
+        return jsonify({"error": str(e), "profiles": list(camera_manager.profiles)}), 400
+    response = Response(generate_frames(subscriber), mimetype='multipart/x-mixed-replace; boundary=frame')
+    response.call_on_close(subscriber.close)  # Release the profile even if streaming never starts
+    return response
+
+
+def _snapshot_etag(profile, seq):
+    return f"{profile}-{seq}"
+
+
+@camera_bp.route('/snapshot')
+def snapshot():
+    """Serve the latest JPEG with a frame-sequence ETag.
+
+    A matching `If-None-Match` returns 304, unless `?wait=<seconds>` is given, in which
+    case the request long-polls until a newer frame exists (or the wait runs out).
+    """
+    camera_manager = registry.get("camera")
+    profile_name = request.args.get("profile") or camera_manager.default_profile
+    wait = min(max(request.args.get("wait", 0.0, type=float), 0.0), MAX_SNAPSHOT_WAIT)
+    try:
+        latest = camera_manager.get_latest(profile_name, timeout=max(wait, 1.0))
+    except KeyError as e:
+        return jsonify({"error": str(e), "profiles": list(camera_manager.profiles)}), 400
+    if latest is None:
+        return jsonify({"error": "No frame captured yet"}), 503
+
+    seq, frame = latest
+    if request.if_none_match.contains(_snapshot_etag(profile_name, seq)):
+        newer = camera_manager.wait_for_frame(seq, timeout=wait, profile=profile_name) if wait else None
+        if newer is None:
+            response = Response(status=304)
+            response.set_etag(_snapshot_etag(profile_name, seq))
+            return response
+        seq, frame = newer
+
+    response = Response(frame, mimetype="image/jpeg")
+    response.set_etag(_snapshot_etag(profile_name, seq))
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Frame-Seq"] = str(seq)
+    return response
+
+
+@camera_bp.route('/camera/stats')
+def camera_stats():
+    """Report capture/encode pipeline timings."""
+    return jsonify(registry.get("camera").get_stats())
@@ -1,16 +1,33 @@
 import os
+import json
 from dotenv import load_dotenv
 
 # Load environment variables from .env
 load_dotenv()
 
-# Configure the LLM to use your local API
+LLM_API_BASE = os.getenv("LLM_API_BASE", "http://localhost:6666/v1")
+LLM_API_KEY = os.getenv("LLM_API_KEY", "not-needed")
+
+# Pool of OpenAI-compatible backends (llm_router.py): comma-separated base URLs, each optionally "|max_concurrency"
+LLM_BACKEND_CONCURRENCY = int(os.getenv("LLM_BACKEND_CONCURRENCY", "4"))  # Requests at once per backend unless given
+LLM_BACKENDS = [
+    (url.strip(), int(limit or LLM_BACKEND_CONCURRENCY))
+    for url, _, limit in (entry.partition("|") for entry in os.getenv("LLM_BACKENDS", LLM_API_BASE).split(",") if entry.strip())
+]
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "3"))     # Seconds to reach a backend before failing over
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))          # Seconds without a byte (e.g. before the first token)
+LLM_BACKEND_COOLDOWN = float(os.getenv("LLM_BACKEND_COOLDOWN", "15"))  # Seconds a failed backend is skipped
+LLM_AFFINITY_TTL = float(os.getenv("LLM_AFFINITY_TTL", "600"))         # Seconds a user stays pinned to their last backend
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "120"))       # Seconds to wait for a free slot when every backend is full
+
+# Configure the LLM to use your local API (autogen tries these in order)
 CONFIG_LIST = [
     {
         "model": "gpt-4-turbo",
-        "base_url": os.getenv("LLM_API_BASE", "http://localhost:6666/v1"),
-        "api_key": os.getenv("LLM_API_KEY", "not-needed"),
+        "base_url": url,
+        "api_key": LLM_API_KEY,
     }
+    for url, _ in LLM_BACKENDS
 ]
 
 LLM_CONFIG = {
@@ -18,3 +35,104 @@ LLM_CONFIG = {
     "temperature": 0.7,
     "stream": False,
 }
+
+# Chat memory
+CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH")
+CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION")
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_history.db"))  # Ordered per-user history (SQLite)
+
+# Resources built in a background thread at server start instead of on first use
+WARM_UP_RESOURCES = [name for name in os.getenv(
+    "WARM_UP_RESOURCES", "camera,asr_model,asr_workers,llm_client,chat_collection,history_store,embedding_cache"
+).split(",") if name]
+
+# Camera pipeline
+CAMERA_ENCODE_WORKERS = int(os.getenv("CAMERA_ENCODE_WORKERS", "2"))  # JPEG encoder threads
+CAMERA_RAW_QUEUE = int(os.getenv("CAMERA_RAW_QUEUE", "2"))            # Raw frames buffered between capture and encode
+
+# Camera output profiles. Each profile is encoded once per captured frame, and
+# only while someone is subscribed to it (the default profile is always kept warm).
+CAMERA_RESOLUTION = tuple(int(x) for x in os.getenv("CAMERA_RESOLUTION", "640x480").split("x"))
+CAMERA_DEFAULT_PROFILE = os.getenv("CAMERA_DEFAULT_PROFILE", "high")
+CAMERA_PROFILES = json.loads(os.getenv("CAMERA_PROFILES", "null")) or {
+    "high": {"size": None, "quality": 90, "grayscale": False},      # Full capture resolution
+    "low": {"size": [320, 240], "quality": 60, "grayscale": False},  # Low-bandwidth mobile
+    "thumb": {"size": [160, 120], "quality": 50, "grayscale": True},
+}
+
+# Adaptive capture rate
+CAMERA_IDLE_FPS = float(os.getenv("CAMERA_IDLE_FPS", "0"))                  # Capture rate with no viewers (0 = pause)
+CAMERA_STATIC_FPS = float(os.getenv("CAMERA_STATIC_FPS", "2"))              # Encode rate while the scene is static
+CAMERA_MOTION_CHECK_FPS = float(os.getenv("CAMERA_MOTION_CHECK_FPS", "10"))  # Capture rate while static, to spot motion; 0 disables motion gating
+CAMERA_MOTION_THRESHOLD = float(os.getenv("CAMERA_MOTION_THRESHOLD", "4"))  # Mean abs pixel diff (0-255) that counts as motion
+CAMERA_STATIC_AFTER = float(os.getenv("CAMERA_STATIC_AFTER", "2"))          # Seconds without motion before throttling
+
+# Text to speech
+TTS_URL = os.getenv("TTS_URL", "http://10.0.0.145:5004/speak")  # Windows TTS server
+TTS_VOICE = os.getenv("TTS_VOICE")                              # Default voice, passed through when set
+TTS_POOL_SIZE = int(os.getenv("TTS_POOL_SIZE", "4"))             # Keep-alive connections to the TTS server
+TTS_CHUNK_SIZE = int(os.getenv("TTS_CHUNK_SIZE", "65536"))       # Relay chunk size in bytes
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tts_cache"))
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024)))
+TTS_CACHE_DISK_BYTES = int(os.getenv("TTS_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+
+# Speech recognition
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "/home/gh0st/t-800-server/vosk_model/vosk-model-small-en-us-0.15")
+ASR_MAX_CONCURRENT = int(os.getenv("ASR_MAX_CONCURRENT", "2"))       # Decodes running at once; extra requests queue
+ASR_CHUNK_SECONDS = float(os.getenv("ASR_CHUNK_SECONDS", "0.5"))      # Audio fed to the recognizer per step
+ASR_WORKERS = int(os.getenv("ASR_WORKERS", "2"))                      # Decoder processes for /asr (0 = decode in-process)
+
+# Voice replies (speak while generating)
+VOICE_TTS_PARALLEL = int(os.getenv("VOICE_TTS_PARALLEL", "2"))            # Sentences synthesized at once
+VOICE_MIN_SENTENCE_CHARS = int(os.getenv("VOICE_MIN_SENTENCE_CHARS", "12"))  # Shorter sentences are merged with the next
+
+# Embeddings
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-ai/nomic-embed-text-v1.5-GGUF")
+EMBEDDING_BATCH_MS = float(os.getenv("EMBEDDING_BATCH_MS", "5"))          # How long to gather concurrent requests into one call
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "64"))         # Texts per embeddings.create call
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))     # Vectors kept in the LRU
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache.bin"))
+EMBEDDING_CACHE_SAVE_S = float(os.getenv("EMBEDDING_CACHE_SAVE_S", "300"))  # How often a changed cache is written to disk (0 = only at exit)
+
+# Chat memory write-behind
+MEMORY_FLUSH_SIZE = int(os.getenv("MEMORY_FLUSH_SIZE", "16"))       # Flush once this many messages are queued
+MEMORY_FLUSH_MS = float(os.getenv("MEMORY_FLUSH_MS", "500"))        # ...or once the oldest has waited this long
+MEMORY_MAX_ATTEMPTS = int(os.getenv("MEMORY_MAX_ATTEMPTS", "3"))     # Failed writes of a message before it is dead-lettered
+
+# Prompt context
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))   # Prompt tokens for system + summary + turns + memories + message
+CONTEXT_RECALL_MATCHES = int(os.getenv("CONTEXT_RECALL_MATCHES", "3"))  # Similar past messages recalled per turn (0 = off)
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")      # tiktoken encoding used to count prompt tokens
+
+# LLM request coalescing and caching
+LLM_COALESCE_STREAMS = os.getenv("LLM_COALESCE_STREAMS", "false").lower() in ("1", "true", "yes")  # Share one stream among identical concurrent chats
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "300"))    # Seconds to keep temperature-0 results (0 = off)
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "256"))    # Cached temperature-0 results
+
+# /chat event batching
+CHAT_FLUSH_MS = float(os.getenv("CHAT_FLUSH_MS", "30"))         # Longest an event waits to be merged into a write (0 = write each event)
+CHAT_FLUSH_BYTES = int(os.getenv("CHAT_FLUSH_BYTES", "4096"))   # ...or write once this much text is pending
+CHAT_SUPERSEDE = os.getenv("CHAT_SUPERSEDE", "false").lower() in ("1", "true", "yes")  # A user's new message cancels their in-flight reply (per request: "supersede")
+
+# T-800 pipeline (ai_processor.ask_t800)
+T800_PIPELINE = os.getenv("T800_PIPELINE", "parallel")                 # "parallel": route and recall at once; "serial": one by one
+T800_PIPELINE_WORKERS = int(os.getenv("T800_PIPELINE_WORKERS", "6"))   # Threads shared by concurrent turns' speculative stages
+
+# Web search (search.py)
+SEARCH_API_URL = os.getenv("SEARCH_API_URL", "https://api.search.brave.com/res/v1/web/search")
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "5"))                # Seconds before a search request gives up
+SEARCH_POOL_SIZE = int(os.getenv("SEARCH_POOL_SIZE", "4"))             # Keep-alive connections to the search API
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "512"))         # Queries kept in the result cache
+SEARCH_TTL_FRESH = int(os.getenv("SEARCH_TTL_FRESH", "600"))           # Seconds news-like results stay fresh
+SEARCH_TTL_STABLE = int(os.getenv("SEARCH_TTL_STABLE", "86400"))       # Seconds other results stay fresh
+SEARCH_TTL_NEGATIVE = int(os.getenv("SEARCH_TTL_NEGATIVE", "300"))     # Seconds a no-results answer is cached
+SEARCH_STALE_SECONDS = int(os.getenv("SEARCH_STALE_SECONDS", "3600"))  # Past its TTL, served while refreshing for this long
+
+# Celery chat tasks (tasks.py)
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379")       # memory:// runs tasks eagerly in-process
+CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379")
+TASK_EVENTS_URL = os.getenv("TASK_EVENTS_URL", CELERY_BROKER_URL)                  # Redis for task event streams, or memory://
+TASK_EVENTS_TTL = int(os.getenv("TASK_EVENTS_TTL", "600"))                         # Seconds a task's events are kept after the last one
+TASK_EVENTS_MAXLEN = int(os.getenv("TASK_EVENTS_MAXLEN", "10000"))                 # Events kept per task stream
+TASK_EVENTS_TIMEOUT = float(os.getenv("TASK_EVENTS_TIMEOUT", "120"))               # Seconds a relay waits for the next event
+SUMMARIZE_IN_CELERY = os.getenv("SUMMARIZE_IN_CELERY", "false").lower() in ("1", "true", "yes")  # Summaries run on the background queue
@@ -0,0 +1,154 @@
+import collections
+import hashlib
+import threading
+from config import CONTEXT_TOKEN_BUDGET, TOKENIZER_ENCODING
+from resources import registry
+
+STATS_WINDOW = 100  # Prompts kept for the rolling per-section averages
+PREFIX_USERS = 1000  # Users whose last prompt is remembered for the prefix reuse stats
+SECTIONS = ("system", "summary", "recent", "memories", "context", "user")
+MESSAGE_OVERHEAD = 4  # Tokens the chat template adds around each message
+RECALL_HEADER = "Possibly relevant things from earlier conversations:\n"
+
+
+def _create_tokenizer():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception as e:  # Not installed, or the encoding file can't be fetched
+        print(f"[WARN] tiktoken unavailable ({e}); estimating ~4 characters per token")
+        return None
+
+
+registry.register("tokenizer", _create_tokenizer)
+
+
+def count_tokens(text):
+    """Prompt tokens in `text` with the local tokenizer, or an estimate if it isn't available."""
+    tokenizer = registry.get("tokenizer")
+    if tokenizer is None:
+        return (len(text) + 3) // 4
+    return len(tokenizer.encode(text, disallowed_special=()))
+
+
+def message_tokens(message):
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+
+def _message_hash(message):
+    return hashlib.blake2b(f"{message['role']}\0{message['content']}".encode("utf-8"), digest_size=16).digest()
+
+
+class ContextBuilder:
+    """Assembles chat prompts under a token budget, most stable content first.
+
+    Messages are ordered system prompt, summary, recent turns, recalled memories,
+    per-turn context (date), user message. The first three only change when the
+    agent, the rolling summary or the history does, so consecutive turns share a
+    byte-identical prefix and the LLM server can reuse its KV cache for it.
+    When over budget, recalled memories go first, then the oldest recent turns.
+    """
+
+    def __init__(self, budget=CONTEXT_TOKEN_BUDGET):
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._reports = collections.deque(maxlen=STATS_WINDOW)
+        self._prefixes = collections.OrderedDict()  # user_id -> [(message hash, tokens)] of the last prompt, LRU
+        self.stats = {"prompts": 0, "prefix_reused_tokens": 0, "prompt_tokens": 0,
+                      "server_prompt_tokens": 0, "server_cached_tokens": 0}
+
+    def build(self, user_id, system_prompt, user_message, summary=None, recent=(), memories=(), context=None):
+        """Return (messages, report). `recent` is (role, content) oldest first; `memories` best match first."""
+        head = [{"role": "system", "content": system_prompt}]
+        if summary:
+            head.append({"role": "system", "content": f"Summary of earlier conversation: {summary}"})
+        tail = []
+        if context:
+            tail.append({"role": "system", "content": context})
+        tail.append({"role": "user", "content": user_message})
+
+        report = {section: 0 for section in SECTIONS}
+        report["system"] = message_tokens(head[0])
+        report["summary"] = sum(message_tokens(m) for m in head[1:])
+        report["context"] = sum(message_tokens(m) for m in tail[:-1])
+        report["user"] = message_tokens(tail[-1])
+        remaining = self.budget - sum(report.values())
+
+        # Newest turns are kept first; older ones drop off once the budget runs out
+        turns = []
+        for role, content in reversed(list(recent)):
+            message = {"role": role, "content": content}
+            tokens = message_tokens(message)
+            if tokens > remaining:
+                break
+            turns.append(message)
+            remaining -= tokens
+            report["recent"] += tokens
+        turns.reverse()
+        report["dropped_turns"] = len(recent) - len(turns)
+
+        in_prompt = {m["content"] for m in turns} | {summary}
+        recalled = []
+        header_tokens = MESSAGE_OVERHEAD + count_tokens(RECALL_HEADER)
+        for memory in memories:
+            if memory in in_prompt:
+                continue  # Already in the prompt verbatim
+            tokens = count_tokens(f"- {memory}\n") + (0 if recalled else header_tokens)
+            if tokens > remaining:
+                break
+            recalled.append(memory)
+            remaining -= tokens
+            report["memories"] += tokens
+        if recalled:
+            tail.insert(0, {"role": "system", "content": RECALL_HEADER + "\n".join(f"- {memory}" for memory in recalled)})
+
+        messages = head + turns + tail
+        report["total"] = sum(report[section] for section in SECTIONS)
+        report["budget"] = self.budget
+        report["prefix_tokens"] = self._record(user_id, messages, report)
+        return messages, report
+
+    def _record(self, user_id, messages, report):
+        """Track how many leading tokens match the previous prompt for this user."""
+        hashes = [_message_hash(message) for message in messages]
+        with self._lock:
+            previous = self._prefixes.get(user_id, [])
+        # Token counts are only needed for the shared prefix; carry them over so each message is counted once
+        fingerprint = [(digest, None) for digest in hashes]
+        shared = 0
+        for i, ((old_digest, tokens), digest) in enumerate(zip(previous, hashes)):
+            if old_digest != digest:
+                break
+            if tokens is None:
+                tokens = message_tokens(messages[i])
+            fingerprint[i] = (digest, tokens)
+            shared += tokens
+        with self._lock:
+            self._prefixes[user_id] = fingerprint
+            self._prefixes.move_to_end(user_id)
+            while len(self._prefixes) > PREFIX_USERS:
+                self._prefixes.popitem(last=False)
+            self._reports.append(report)
+            self.stats["prompts"] += 1
+            self.stats["prefix_reused_tokens"] += shared
+            self.stats["prompt_tokens"] += report["total"]
+        return shared
+
+    def record_usage(self, usage):
+        """Add the server's own prompt token counts (and cache hits, if it reports them) from a response's usage."""
+        details = getattr(usage, "prompt_tokens_details", None)
+        with self._lock:
+            self.stats["server_prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+            self.stats["server_cached_tokens"] += getattr(details, "cached_tokens", 0) or 0
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            reports = list(self._reports)
+        for section in SECTIONS + ("total",):
+            stats[f"avg_{section}_tokens"] = round(sum(r[section] for r in reports) / len(reports), 1) if reports else 0.0
+        stats["prefix_reuse_ratio"] = round(stats["prefix_reused_tokens"] / stats["prompt_tokens"], 3) if stats["prompt_tokens"] else 0.0
+        return stats
+
+
+context_builder = ContextBuilder()
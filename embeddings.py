@@ -0,0 +1,223 @@
+import array
+import atexit
+import collections
+import concurrent.futures
+import hashlib
+import os
+import struct
+import threading
+import time
+from config import (
+    EMBEDDING_BATCH_MS,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_SAVE_S,
+    EMBEDDING_CACHE_SIZE,
+    EMBEDDING_MAX_BATCH,
+    EMBEDDING_MODEL,
+)
+from resources import get_llm_client, registry
+
+CACHE_MAGIC = b"EMBCACHE1\n"
+CACHE_RECORD = struct.Struct("<HI")  # Key length, vector length; followed by the key and float32 values
+
+
+def normalize_text(text):
+    """Embedding input form: newlines and runs of whitespace collapsed to single spaces."""
+    return " ".join(text.split())
+
+
+def cache_key(model, text):
+    return f"{model}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+
+class EmbeddingService:
+    """Shared embedding layer: LRU-cached vectors and micro-batched upstream calls.
+
+    Concurrent requests that arrive within EMBEDDING_BATCH_MS of each other are sent
+    as one `embeddings.create(input=[...])` call; identical texts in flight share a
+    single result. The cache is persisted as packed float32 vectors: loaded once (during
+    warm-up, or on first use), then saved every `save_interval` seconds if it changed.
+    """
+
+    def __init__(self, cache_size=EMBEDDING_CACHE_SIZE, batch_window=EMBEDDING_BATCH_MS / 1000,
+                 max_batch=EMBEDDING_MAX_BATCH, cache_path=EMBEDDING_CACHE_PATH, save_interval=EMBEDDING_CACHE_SAVE_S):
+        self.cache_size = cache_size
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.cache_path = cache_path
+        self.save_interval = save_interval
+        self._cache = collections.OrderedDict()
+        self._pending = []  # (key, model, text, future) waiting for the batcher
+        self._inflight = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._dirty = False
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.stats = {"requests": 0, "cache_hits": 0, "coalesced": 0, "upstream_calls": 0, "upstream_texts": 0}
+
+    def embed(self, text, model=EMBEDDING_MODEL):
+        return self.embed_many([text], model)[0]
+
+    def embed_many(self, texts, model=EMBEDDING_MODEL):
+        """Return one vector per text, in order. Raises whatever the upstream call raised."""
+        if not self._loaded:
+            self.load()
+        futures = []
+        with self._cond:
+            for text in texts:
+                text = normalize_text(text)
+                key = cache_key(model, text)
+                self.stats["requests"] += 1
+                future = concurrent.futures.Future()
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    self.stats["cache_hits"] += 1
+                    future.set_result(self._cache[key])
+                elif key in self._inflight:
+                    self.stats["coalesced"] += 1
+                    future = self._inflight[key]
+                else:
+                    self._inflight[key] = future
+                    self._pending.append((key, model, text, future))
+                futures.append(future)
+            if self._pending:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run_batches, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+                self._cond.notify()
+        return [future.result() for future in futures]
+
+    def _run_batches(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+            time.sleep(self.batch_window)  # Let concurrent callers join this batch
+            with self._cond:
+                model = self._pending[0][1]
+                batch = [item for item in self._pending if item[1] == model][:self.max_batch]
+                taken = {id(item) for item in batch}
+                self._pending = [item for item in self._pending if id(item) not in taken]
+            self._embed_batch(model, batch)
+
+    def _embed_batch(self, model, batch):
+        with self._cond:
+            self.stats["upstream_calls"] += 1
+            self.stats["upstream_texts"] += len(batch)
+        try:
+            response = get_llm_client().embeddings.create(input=[text for _, _, text, _ in batch], model=model)
+            vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        except Exception as e:
+            with self._cond:
+                for key, _, _, future in batch:
+                    self._inflight.pop(key, None)
+                    future.set_exception(e)
+            return
+        with self._cond:
+            for (key, _, _, future), vector in zip(batch, vectors):
+                self._cache[key] = vector
+                self._inflight.pop(key, None)
+                future.set_result(vector)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            self._dirty = True
+
+    def load(self):
+        """Load a previously saved cache, if there is one, and start the periodic saver. Runs once."""
+        with self._load_lock:
+            if not self._loaded:
+                try:
+                    self._load_file()
+                finally:
+                    self._loaded = True
+                if self.cache_path and self.save_interval > 0:
+                    threading.Thread(target=self._run_saver, name="embedding-cache-saver", daemon=True).start()
+        return self
+
+    def _load_file(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "rb") as f:
+                entries = _unpack_cache(f.read())
+        except (OSError, ValueError, struct.error) as e:
+            print(f"[WARN] Could not load embedding cache: {e}")
+            return
+        with self._cond:
+            for key, vector in entries[-self.cache_size:]:
+                self._cache[key] = vector
+
+    def save(self):
+        """Write the cache to disk (least recently used first) if it changed since the last save."""
+        if not self.cache_path or not self._dirty:
+            return
+        with self._save_lock:
+            with self._cond:
+                entries = list(self._cache.items())
+                self._dirty = False
+            tmp_path = f"{self.cache_path}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(_pack_cache(entries))
+                os.replace(tmp_path, self.cache_path)
+            except OSError as e:
+                self._dirty = True
+                print(f"[WARN] Could not save embedding cache: {e}")
+
+    def _run_saver(self):
+        # atexit doesn't run when the service is stopped with SIGTERM, so don't rely on it alone
+        while True:
+            time.sleep(self.save_interval)
+            self.save()
+
+    def get_stats(self):
+        with self._cond:
+            stats = dict(self.stats)
+        stats["cache_size"] = len(self._cache)
+        stats["hit_ratio"] = round(stats["cache_hits"] / stats["requests"], 3) if stats["requests"] else 0.0
+        stats["avg_batch"] = round(stats["upstream_texts"] / stats["upstream_calls"], 2) if stats["upstream_calls"] else 0.0
+        return stats
+
+
+def _pack_cache(entries):
+    parts = [CACHE_MAGIC]
+    for key, vector in entries:
+        key = key.encode("utf-8")
+        parts.append(CACHE_RECORD.pack(len(key), len(vector)))
+        parts.append(key)
+        parts.append(array.array("f", vector).tobytes())
+    return b"".join(parts)
+
+
+def _unpack_cache(data):
+    if not data.startswith(CACHE_MAGIC):
+        raise ValueError("not an embedding cache file")
+    entries = []
+    offset = len(CACHE_MAGIC)
+    while offset < len(data):
+        key_len, dim = CACHE_RECORD.unpack_from(data, offset)
+        offset += CACHE_RECORD.size
+        key = data[offset:offset + key_len].decode("utf-8")
+        offset += key_len
+        vector = array.array("f")
+        vector.frombytes(data[offset:offset + dim * vector.itemsize])
+        offset += dim * vector.itemsize
+        entries.append((key, vector.tolist()))
+    return entries
+
+
+embedding_service = EmbeddingService()
+atexit.register(embedding_service.save)
+# Listed in WARM_UP_RESOURCES so the file is parsed at start-up rather than inside the first request
+registry.register("embedding_cache", embedding_service.load)
+
+
+def get_embedding(text, model=EMBEDDING_MODEL):
+    """Generate an embedding for the given text using local model."""
+    return embedding_service.embed(text, model)
+
+
+def get_embeddings(texts, model=EMBEDDING_MODEL):
+    """Generate embeddings for several texts with at most one upstream call per batch."""
+    return embedding_service.embed_many(texts, model)
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import queue
+import struct
+import threading
+import time
+
+MERGEABLE_TYPES = ("response", "thinking")  # Text deltas that can be joined into one event
+FRAME_TYPES = {"response": 1, "thinking": 2}  # Binary framing codes; other events go as code 0 + JSON
+_DONE = object()
+
+
+def encode_ndjson(event):
+    return (json.dumps(event) + "\n").encode("utf-8")
+
+
+def encode_binary(event):
+    """Length-prefixed frame: 1-byte type code, 4-byte big-endian length, then the payload.
+
+    Text deltas (codes 1 and 2) carry their UTF-8 content directly; anything else
+    is code 0 with the whole event as JSON.
+    """
+    code = FRAME_TYPES.get(event.get("type")) if set(event) == {"type", "content"} else None
+    payload = event["content"].encode("utf-8") if code else json.dumps(event).encode("utf-8")
+    return struct.pack(">BI", code or 0, len(payload)) + payload
+
+
+FRAMINGS = {
+    "ndjson": (encode_ndjson, "application/x-ndjson"),
+    "binary": (encode_binary, "application/x-t800-frames"),
+}
+
+
+def _mergeable(event):
+    return event.get("type") in MERGEABLE_TYPES and set(event) == {"type", "content"}
+
+
+class EventBatcher:
+    """Turns a stream of chat events into fewer, larger writes.
+
+    Consecutive text deltas of the same type are merged into one event. A batch is
+    written once its oldest event has waited `flush_ms`, once `max_bytes` of text
+    is pending, or when the stream ends. Events are read on a separate thread (or
+    task), so the window holds even while the upstream is stalled, and anything
+    that piles up while the client is slow to read goes out merged in the next write.
+    flush_ms=0 writes every event as it arrives.
+    """
+
+    def __init__(self, flush_ms=30, max_bytes=4096, framing="ndjson"):
+        self.flush_interval = flush_ms / 1000
+        self.max_bytes = max_bytes
+        self.encode, self.mimetype = FRAMINGS[framing]
+        self.stats = {"events_in": 0, "events_out": 0, "writes": 0, "bytes": 0}
+
+    def _add(self, pending, event):
+        """Append or merge `event` into `pending`; returns the number of text bytes added."""
+        self.stats["events_in"] += 1
+        if _mergeable(event) and pending and _mergeable(pending[-1]) and pending[-1]["type"] == event["type"]:
+            pending[-1] = {"type": event["type"], "content": pending[-1]["content"] + event["content"]}
+        else:
+            pending.append(event)
+        return len(event.get("content") or "") if isinstance(event.get("content"), str) else 0
+
+    def _encode(self, pending):
+        data = b"".join(self.encode(event) for event in pending)
+        self.stats["events_out"] += len(pending)
+        self.stats["writes"] += 1
+        self.stats["bytes"] += len(data)
+        pending.clear()
+        return data
+
+    def batch(self, events):
+        """Yield encoded batches of `events` (an iterator of event dicts)."""
+        items = queue.Queue()
+        stop = threading.Event()
+
+        def pump():
+            try:
+                for event in events:
+                    if stop.is_set():
+                        break
+                    items.put(event)
+            except Exception as e:
+                items.put(e)
+            finally:
+                if hasattr(events, "close"):
+                    events.close()
+                items.put(_DONE)
+
+        threading.Thread(target=pump, name="event-batcher", daemon=True).start()
+        pending, pending_bytes, deadline = [], 0, None
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = items.get(timeout=timeout)
+                except queue.Empty:
+                    yield self._encode(pending)
+                    pending_bytes, deadline = 0, None
+                    continue
+                # Take whatever else is already waiting, e.g. what arrived while the client was slow to read
+                while item is not _DONE and not isinstance(item, Exception):
+                    pending_bytes += self._add(pending, item)
+                    if pending_bytes >= self.max_bytes:
+                        break
+                    try:
+                        item = items.get_nowait()
+                    except queue.Empty:
+                        item = None
+                        break
+                if item is _DONE or isinstance(item, Exception):
+                    if pending:
+                        yield self._encode(pending)
+                    if isinstance(item, Exception):
+                        raise item
+                    return
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if pending_bytes >= self.max_bytes or time.monotonic() >= deadline:
+                    yield self._encode(pending)
+                    pending_bytes, deadline = 0, None
+        finally:
+            stop.set()
+
+    async def abatch(self, events):
+        """batch() for an async iterator of events."""
+        items = asyncio.Queue()
+
+        async def pump():
+            try:
+                async for event in events:
+                    items.put_nowait(event)
+            except Exception as e:
+                items.put_nowait(e)
+            finally:
+                items.put_nowait(_DONE)
+
+        task = asyncio.get_running_loop().create_task(pump())
+        pending, pending_bytes, deadline = [], 0, None
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = await asyncio.wait_for(items.get(), timeout)
+                except asyncio.TimeoutError:
+                    yield self._encode(pending)
+                    pending_bytes, deadline = 0, None
+                    continue
+                while item is not _DONE and not isinstance(item, Exception):
+                    pending_bytes += self._add(pending, item)
+                    if pending_bytes >= self.max_bytes or items.empty():
+                        item = None
+                        break
+                    item = items.get_nowait()
+                if item is _DONE or isinstance(item, Exception):
+                    if pending:
+                        yield self._encode(pending)
+                    if isinstance(item, Exception):
+                        raise item
+                    return
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if pending_bytes >= self.max_bytes or time.monotonic() >= deadline:
+                    yield self._encode(pending)
+                    pending_bytes, deadline = 0, None
+        finally:
+            task.cancel()
@@ -0,0 +1,157 @@
+import asyncio
+import collections
+import threading
+
+
+class FrameSubscriber:
+    """Per-client frame queue with drop-oldest backpressure."""
+
+    def __init__(self, broadcaster, max_pending=2):
+        self._broadcaster = broadcaster
+        self._frames = collections.deque(maxlen=max_pending)
+        self._cond = threading.Condition()
+        self.closed = False
+        self.delivered = 0
+        self.dropped = 0
+
+    def push(self, seq, frame):
+        """Queue a frame, discarding the oldest pending one if the client is behind."""
+        with self._cond:
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped += 1
+            self._frames.append((seq, frame))
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Wait for the next pending frame. Returns (seq, frame) or None on timeout/close."""
+        with self._cond:
+            if not self._frames and not self.closed:
+                self._cond.wait(timeout)
+            if not self._frames:
+                return None
+            self.delivered += 1
+            return self._frames.popleft()
+
+    def close(self):
+        """Detach from the broadcaster and wake any waiting reader."""
+        self._broadcaster.unsubscribe(self)
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def __iter__(self):
+        """Yield frame bytes until the subscriber is closed."""
+        while not self.closed:
+            item = self.get(timeout=1.0)
+            if item is not None:
+                yield item[1]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncFrameSubscriber(FrameSubscriber):
+    """FrameSubscriber for asyncio code: readers await frames instead of holding a thread.
+
+    The pump thread still does the pushing; each push wakes the reader on `loop`.
+    """
+
+    def __init__(self, broadcaster, max_pending=2, loop=None):
+        super().__init__(broadcaster, max_pending)
+        self._loop = loop or asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+
+    def _wake(self):
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            pass  # Loop already closed
+
+    def push(self, seq, frame):
+        super().push(seq, frame)
+        self._wake()
+
+    def close(self):
+        super().close()
+        self._wake()
+
+    async def next(self, timeout=None):
+        """Await the next pending frame. Returns (seq, frame) or None on timeout/close."""
+        if not self._frames and not self.closed:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.get(timeout=0)
+
+    async def __aiter__(self):
+        """Yield frame bytes until the subscriber is closed."""
+        while not self.closed:
+            item = await self.next(timeout=1.0)
+            if item is not None:
+                yield item[1]
+
+
+class FrameBroadcaster:
+    """Fans each new frame out to every subscriber exactly once.
+
+    `wait_for_frame(last_seq, timeout)` must block until a frame newer than
+    `last_seq` exists and return `(seq, frame)`, or None on timeout. A single
+    pump thread waits on it while at least one subscriber is attached, so the
+    capture side never blocks on slow clients.
+    """
+
+    def __init__(self, wait_for_frame, max_pending=2):
+        self._wait_for_frame = wait_for_frame
+        self.max_pending = max_pending
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.frames_published = 0
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def subscribe(self, loop=None):
+        """Attach a new client and start the pump thread if it isn't running.
+
+        With an event `loop`, returns an AsyncFrameSubscriber to be read from that loop.
+        """
+        if loop is not None:
+            subscriber = AsyncFrameSubscriber(self, self.max_pending, loop)
+        else:
+            subscriber = FrameSubscriber(self, self.max_pending)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._pump, daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _pump(self):
+        """Forward frames to subscribers until the last one leaves."""
+        seq = 0
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            item = self._wait_for_frame(seq, timeout=1.0)
+            if item is None:
+                continue
+            seq, frame = item
+            with self._lock:
+                subscribers = list(self._subscribers)
+            for subscriber in subscribers:
+                subscriber.push(seq, frame)
+            self.frames_published += 1
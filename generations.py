@@ -0,0 +1,109 @@
+import collections
+import threading
+
+STATS_WINDOW = 100  # Completed generations kept for the average-length estimate
+
+
+class Generation:
+    """Handle for one in-flight LLM generation that can be cancelled from any thread."""
+
+    def __init__(self, registry, user_id):
+        self._registry = registry
+        self.user_id = user_id
+        self.reason = None
+        self.tokens = 0
+        self._closers = []
+        self._finished = False
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self.reason is not None
+
+    def on_cancel(self, closer):
+        """Call `closer` (e.g. the upstream stream's close) when cancelled, or now if already cancelled."""
+        with self._lock:
+            if self.reason is None:
+                self._closers.append(closer)
+                return
+        self._close(closer)
+
+    def cancel(self, reason="disconnect"):
+        """Stop the generation and close its upstream stream. Later calls are no-ops."""
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            closers, self._closers = self._closers, []
+        for closer in closers:
+            self._close(closer)
+
+    @staticmethod
+    def _close(closer):
+        try:
+            closer()
+        except Exception as e:
+            print(f"[WARN] Closing upstream stream failed: {e}")
+
+    def finish(self, completed):
+        """Record the outcome. A generation that didn't complete and wasn't cancelled counts as a disconnect.
+
+        Only the first call counts, e.g. a response closing after its reply already finished is a no-op.
+        """
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+        if not completed:
+            self.cancel("disconnect")
+        self._registry._finish(self)
+
+
+class GenerationRegistry:
+    """Tracks in-flight generations per user, for supersede mode and cancellation counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = collections.defaultdict(set)
+        self._completed_tokens = collections.deque(maxlen=STATS_WINDOW)
+        self.stats = {"started": 0, "completed": 0, "cancelled_disconnect": 0, "cancelled_superseded": 0,
+                      "tokens_before_cancel": 0, "tokens_saved_est": 0}
+
+    def start(self, user_id, supersede=False):
+        """Register a new generation; with `supersede`, cancel the user's other in-flight generations first."""
+        generation = Generation(self, user_id)
+        with self._lock:
+            previous = list(self._active[user_id]) if supersede else []
+            self._active[user_id].add(generation)
+            self.stats["started"] += 1
+        for other in previous:
+            other.cancel("superseded")
+        return generation
+
+    def _finish(self, generation):
+        with self._lock:
+            active = self._active.get(generation.user_id)
+            if active is None or generation not in active:
+                return
+            active.discard(generation)
+            if not active:
+                del self._active[generation.user_id]
+            if generation.cancelled:
+                self.stats[f"cancelled_{generation.reason}"] += 1
+                self.stats["tokens_before_cancel"] += generation.tokens
+                # Estimated from how long completed answers have been running
+                if self._completed_tokens:
+                    typical = sum(self._completed_tokens) / len(self._completed_tokens)
+                    self.stats["tokens_saved_est"] += max(0, round(typical - generation.tokens))
+            else:
+                self.stats["completed"] += 1
+                self._completed_tokens.append(generation.tokens)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = sum(len(active) for active in self._active.values())
+        return stats
+
+
+generations = GenerationRegistry()
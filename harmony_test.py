@@ -1,8 +1,9 @@
 import httpx
 import asyncio
 import json
+from config import LLM_API_BASE
 
-STREAM_URL = "http://10.0.0.86:1234/v1/chat/completions"
+STREAM_URL = f"{LLM_API_BASE}/chat/completions"
 
 async def stream_chat():
     payload = {
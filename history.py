@@ -0,0 +1,170 @@
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    next_seq INTEGER NOT NULL DEFAULT 1,
+    message_count INTEGER NOT NULL DEFAULT 0,  -- Non-summary messages
+    summary_seq INTEGER                        -- Latest summary, if any
+);
+CREATE TABLE IF NOT EXISTS messages (
+    user_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    chroma_id TEXT,
+    PRIMARY KEY (user_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS messages_summaries ON messages (user_id, seq) WHERE role = 'summary';
+"""
+
+
+class HistoryStore:
+    """Ordered per-user conversation history in SQLite.
+
+    Every message gets a per-user sequence number, and the users row keeps the
+    message count and a pointer to the latest summary, so counting, finding the
+    summary and reading the last N turns are index lookups no matter how long
+    the history is. Chroma is only used for similarity search.
+
+    `backfill(user_id)` is called once for users the store hasn't seen yet and
+    should return their existing messages as (created_at, role, content, chroma_id).
+    """
+
+    def __init__(self, path, backfill=None):
+        self.path = path
+        self.backfill = backfill
+        self._lock = threading.Lock()
+        self._known = set()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def _ensure_user(self, user_id):
+        """Create the user's row, importing any history they already have. Call with the lock held."""
+        if user_id in self._known:
+            return
+        if not self._conn.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone():
+            existing = sorted(self.backfill(user_id)) if self.backfill else []
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("INSERT INTO users (user_id) VALUES (?)", (user_id,))
+                self._insert(user_id, existing)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self._known.add(user_id)
+
+    def _insert(self, user_id, messages):
+        next_seq, count, summary_seq = self._conn.execute(
+            "SELECT next_seq, message_count, summary_seq FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        seqs = list(range(next_seq, next_seq + len(messages)))
+        self._conn.executemany(
+            "INSERT INTO messages (user_id, seq, role, content, created_at, chroma_id) VALUES (?, ?, ?, ?, ?, ?)",
+            [(user_id, seq, role, content, created_at, chroma_id)
+             for seq, (created_at, role, content, chroma_id) in zip(seqs, messages)],
+        )
+        for seq, (_, role, _, _) in zip(seqs, messages):
+            if role == "summary":
+                summary_seq = seq
+            else:
+                count += 1
+        self._conn.execute(
+            "UPDATE users SET next_seq = ?, message_count = ?, summary_seq = ? WHERE user_id = ?",
+            (next_seq + len(messages), count, summary_seq, user_id),
+        )
+        return seqs
+
+    def append(self, user_id, messages):
+        """Append (role, content, chroma_id) messages in order. Returns their sequence numbers."""
+        now = time.time()
+        with self._lock:
+            self._ensure_user(user_id)
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                seqs = self._insert(user_id, [(now, role, content, chroma_id) for role, content, chroma_id in messages])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return seqs
+
+    def count(self, user_id):
+        """Number of non-summary messages stored for the user."""
+        with self._lock:
+            self._ensure_user(user_id)
+            return self._conn.execute("SELECT message_count FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def latest_summary(self, user_id):
+        """(seq, content, chroma_id) of the user's latest summary, or None."""
+        with self._lock:
+            self._ensure_user(user_id)
+            return self._conn.execute(
+                "SELECT m.seq, m.content, m.chroma_id FROM users u JOIN messages m ON m.user_id = u.user_id AND m.seq = u.summary_seq "
+                "WHERE u.user_id = ?", (user_id,)
+            ).fetchone()
+
+    def tail(self, user_id, limit, after_seq=0):
+        """The last `limit` non-summary messages after `after_seq`, oldest first, as (seq, role, content)."""
+        with self._lock:
+            self._ensure_user(user_id)
+            rows = self._conn.execute(
+                "SELECT seq, role, content FROM messages WHERE user_id = ? AND seq > ? AND role != 'summary' "
+                "ORDER BY seq DESC LIMIT ?", (user_id, after_seq or 0, limit)
+            ).fetchall()
+        return rows[::-1]
+
+    def unsummarized(self, user_id, after_seq=0, limit=-1):
+        """Non-summary messages after `after_seq`, oldest first, as (seq, role, content, chroma_id)."""
+        with self._lock:
+            self._ensure_user(user_id)
+            return self._conn.execute(
+                "SELECT seq, role, content, chroma_id FROM messages WHERE user_id = ? AND seq > ? AND role != 'summary' "
+                "ORDER BY seq LIMIT ?", (user_id, after_seq or 0, limit)
+            ).fetchall()
+
+    def unsummarized_chars(self, user_id, after_seq=0):
+        """Total length of the non-summary messages after `after_seq`."""
+        with self._lock:
+            self._ensure_user(user_id)
+            return self._conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(content)), 0) FROM messages WHERE user_id = ? AND seq > ? AND role != 'summary'",
+                (user_id, after_seq or 0)
+            ).fetchone()[0]
+
+    def replace_with_summary(self, user_id, seqs, content, chroma_id=None):
+        """Atomically delete `seqs` and store `content` as the latest summary in the last one's place.
+
+        Messages after the replaced range stay "recent"; readers see either the old
+        summary and messages or the new summary, never a mix. Returns the summary's seq.
+        """
+        seqs = sorted(seqs)
+        summary_seq = seqs[-1]
+        with self._lock:
+            self._ensure_user(user_id)
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                removed = self._conn.execute(
+                    f"SELECT COUNT(*) FROM messages WHERE user_id = ? AND role != 'summary' AND seq IN ({','.join('?' * len(seqs))})",
+                    (user_id, *seqs)
+                ).fetchone()[0]
+                self._conn.executemany("DELETE FROM messages WHERE user_id = ? AND seq = ?", [(user_id, seq) for seq in seqs])
+                self._conn.execute(
+                    "INSERT INTO messages (user_id, seq, role, content, created_at, chroma_id) VALUES (?, ?, 'summary', ?, ?, ?)",
+                    (user_id, summary_seq, content, time.time(), chroma_id),
+                )
+                self._conn.execute(
+                    "UPDATE users SET message_count = message_count - ?, summary_seq = MAX(COALESCE(summary_seq, 0), ?) "
+                    "WHERE user_id = ?", (removed, summary_seq, user_id),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return summary_seq
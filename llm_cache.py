@@ -0,0 +1,302 @@
+import asyncio
+import collections
+import concurrent.futures
+import hashlib
+import json
+import threading
+import time
+from config import LLM_CACHE_SIZE, LLM_CACHE_TTL, LLM_COALESCE_STREAMS
+
+
+def normalize_messages(messages):
+    """Messages with content whitespace collapsed, so trivially different prompts share a key."""
+    normalized = []
+    for message in messages:
+        message = dict(message)
+        if isinstance(message.get("content"), str):
+            message["content"] = " ".join(message["content"].split())
+        normalized.append(message)
+    return normalized
+
+
+def request_key(params):
+    """Key for a chat request: model, normalized messages and every sampling parameter.
+
+    `user` only picks the LLM backend, so it is left out.
+    """
+    params = dict(params)
+    params.pop("user", None)
+    params["messages"] = normalize_messages(params.get("messages", []))
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def close_stream(stream):
+    """Close an upstream stream (or a follower of one). Safe to call from another thread."""
+    close = getattr(stream, "close", None)
+    if close is not None:
+        close()
+
+
+class _Flight:
+    """One upstream stream, buffered so that followers who join late still get every chunk.
+
+    When every follower has left before the stream ends, the upstream is closed.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.followers = 0
+        self.abandoned = False
+        self.upstream = None
+        self.cond = threading.Condition()
+
+    def join(self):
+        with self.cond:
+            self.followers += 1
+        return _Follower(self)
+
+
+class _Follower:
+    def __init__(self, flight):
+        self._flight = flight
+        self._left = False
+
+    def __iter__(self):
+        flight = self._flight
+        index = 0
+        try:
+            while True:
+                with flight.cond:
+                    flight.cond.wait_for(lambda: index < len(flight.chunks) or flight.done or self._left)
+                    if self._left:
+                        return
+                    chunks = flight.chunks[index:]
+                    done = flight.done
+                index += len(chunks)
+                yield from chunks
+                if done and index >= len(flight.chunks):
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop following; closes the upstream if this was the last follower."""
+        flight = self._flight
+        upstream = None
+        with flight.cond:
+            if self._left:
+                return
+            self._left = True
+            flight.followers -= 1
+            if flight.followers == 0 and not flight.done:
+                flight.abandoned = True
+                upstream = flight.upstream
+            flight.cond.notify_all()
+        if upstream is not None:
+            close_stream(upstream)
+
+
+class _AsyncFlight:
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.followers = 0
+        self.abandoned = False
+        self.changed = asyncio.Event()
+        self.task = None  # Held so the pump task isn't garbage collected mid-stream
+
+    def publish(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    async def follow(self):
+        index = 0
+        while True:
+            changed = self.changed
+            chunks = self.chunks[index:]
+            index += len(chunks)
+            for chunk in chunks:
+                yield chunk
+            if self.done and index >= len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                return
+            if index >= len(self.chunks):
+                await changed.wait()
+
+
+class LLMCache:
+    """Single-flight coalescing for chat streams and a TTL cache for deterministic calls.
+
+    stream()/astream(): concurrent requests with the same key share one upstream
+    stream; each caller gets every chunk from the start. Opt-in via LLM_COALESCE_STREAMS.
+    call(): temperature-0 calls are memoized for LLM_CACHE_TTL seconds, and identical
+    calls already in flight wait for that result instead of going upstream again.
+    """
+
+    def __init__(self, coalesce_streams=LLM_COALESCE_STREAMS, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_SIZE):
+        self.coalesce_streams = coalesce_streams
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._async_flights = {}
+        self._calls = {}  # key -> Future for deterministic calls in flight
+        self._cache = collections.OrderedDict()  # key -> (expires_at, result)
+        self.stats = {"streams": 0, "upstream_streams": 0, "coalesced_streams": 0,
+                      "calls": 0, "upstream_calls": 0, "cache_hits": 0, "coalesced_calls": 0}
+
+    def stream(self, params, create):
+        """Iterate the chunks of `create()`, sharing one upstream stream among identical concurrent requests.
+
+        The result has a thread-safe close() (see close_stream) that stops the upstream
+        stream, or with coalescing, stops it once no other request is following it.
+        """
+        if not self.coalesce_streams:
+            return create()
+        key = request_key(params)
+        with self._lock:
+            self.stats["streams"] += 1
+            flight = self._flights.get(key)
+            leader = flight is None or flight.abandoned
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.stats["upstream_streams"] += 1
+            else:
+                self.stats["coalesced_streams"] += 1
+            follower = flight.join()
+        if leader:
+            threading.Thread(target=self._pump, args=(key, flight, create), name="llm-stream", daemon=True).start()
+        return follower
+
+    def _pump(self, key, flight, create):
+        """Read the upstream stream into the flight buffer, independently of how fast followers read."""
+        try:
+            upstream = create()
+            with flight.cond:
+                flight.upstream = upstream
+                abandoned = flight.abandoned
+            if abandoned:
+                close_stream(upstream)
+                return
+            for chunk in upstream:
+                with flight.cond:
+                    if flight.abandoned:
+                        break
+                    flight.chunks.append(chunk)
+                    flight.cond.notify_all()
+        except Exception as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]  # Requests arriving from now on start a fresh stream
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+
+    async def astream(self, params, create):
+        """stream() for asyncio callers; `create` is a coroutine function returning an async chunk iterator.
+
+        Closing or cancelling the consumer closes the upstream stream (once no other request follows it).
+        """
+        if not self.coalesce_streams:
+            upstream = await create()
+            try:
+                async for chunk in upstream:
+                    yield chunk
+            finally:
+                await upstream.close()
+            return
+        key = request_key(params)
+        with self._lock:
+            self.stats["streams"] += 1
+            flight = self._async_flights.get(key)
+            if flight is None or flight.abandoned:
+                flight = self._async_flights[key] = _AsyncFlight()
+                self.stats["upstream_streams"] += 1
+                flight.task = asyncio.get_running_loop().create_task(self._apump(key, flight, create))
+            else:
+                self.stats["coalesced_streams"] += 1
+            flight.followers += 1
+        try:
+            async for chunk in flight.follow():
+                yield chunk
+        finally:
+            flight.followers -= 1
+            if flight.followers == 0 and not flight.done:
+                flight.abandoned = True
+                flight.task.cancel()
+
+    async def _apump(self, key, flight, create):
+        upstream = None
+        try:
+            upstream = await create()
+            async for chunk in upstream:
+                flight.chunks.append(chunk)
+                flight.publish()
+        except asyncio.CancelledError:
+            pass  # Every follower left
+        except Exception as e:
+            flight.error = e
+        finally:
+            if upstream is not None and flight.abandoned:
+                await upstream.close()
+            with self._lock:
+                if self._async_flights.get(key) is flight:
+                    del self._async_flights[key]
+            flight.done = True
+            flight.publish()
+
+    def call(self, params, fn):
+        """Return fn(), cached for `ttl` seconds when params["temperature"] is 0."""
+        if params.get("temperature") != 0 or self.ttl <= 0:
+            return fn()
+        key = request_key(params)
+        with self._lock:
+            self.stats["calls"] += 1
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                return cached[1]
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = concurrent.futures.Future()
+                self.stats["upstream_calls"] += 1
+            else:
+                self.stats["coalesced_calls"] += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except Exception as e:
+            with self._lock:
+                del self._calls[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._calls[key]
+            self._cache[key] = (time.monotonic() + self.ttl, result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        future.set_result(result)
+        return result
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["cached_entries"] = len(self._cache)
+            stats["streams_in_flight"] = len(self._flights) + len(self._async_flights)
+        stats["call_hit_ratio"] = round((stats["cache_hits"] + stats["coalesced_calls"]) / stats["calls"], 3) if stats["calls"] else 0.0
+        return stats
+
+
+llm_cache = LLMCache()
@@ -0,0 +1,386 @@
+import asyncio
+import threading
+import time
+import types
+from config import (
+    LLM_AFFINITY_TTL,
+    LLM_API_KEY,
+    LLM_BACKEND_COOLDOWN,
+    LLM_BACKENDS,
+    LLM_CONNECT_TIMEOUT,
+    LLM_QUEUE_TIMEOUT,
+    LLM_READ_TIMEOUT,
+)
+
+DEFAULT_MAX_TOKENS = 512  # Assumed completion length for requests that don't set max_tokens
+AFFINITY_PRUNE_SIZE = 4096  # Pinned users kept before expired pins are dropped
+_END = object()
+
+
+class NoBackendAvailable(Exception):
+    """Every backend is busy or has already failed this request."""
+
+
+def estimate_tokens(params):
+    """Rough cost of a request: prompt characters / 4 for prefill, plus the completion budget."""
+    prompt = sum(len(str(message.get("content") or "")) for message in params.get("messages", []))
+    return prompt // 4, params.get("max_tokens") or DEFAULT_MAX_TOKENS
+
+
+def _retryable(error):
+    """Connection errors, timeouts, 429s and 5xx are worth another backend; other 4xx would fail anywhere."""
+    status = getattr(error, "status_code", None)
+    return status is None or status == 429 or status >= 500
+
+
+def _close_quietly(close):
+    try:
+        close()
+    except Exception as e:
+        print(f"[WARN] Closing LLM stream failed: {e}")
+
+
+async def _aclose_quietly(upstream):
+    try:
+        await upstream.close()
+    except Exception as e:
+        print(f"[WARN] Closing LLM stream failed: {e}")
+
+
+class Backend:
+    """One OpenAI-compatible server in the pool and its current load."""
+
+    def __init__(self, url, limit, multiple):
+        self.url = url
+        self.limit = limit
+        self.in_flight = 0
+        self.outstanding = 0  # Estimated tokens still to be processed by requests in flight
+        self.unhealthy_until = 0.0
+        self.stats = {"requests": 0, "failures": 0, "tokens": 0}
+        # With other backends to fail over to, don't retry the same one
+        self._max_retries = 0 if multiple else 2
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    def _timeout(self):
+        import httpx
+        return httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                from openai import OpenAI
+                self._client = OpenAI(base_url=self.url, api_key=LLM_API_KEY, timeout=self._timeout(),
+                                      max_retries=self._max_retries)
+            return self._client
+
+    def async_client(self):
+        with self._lock:
+            if self._async_client is None:
+                from openai import AsyncOpenAI
+                self._async_client = AsyncOpenAI(base_url=self.url, api_key=LLM_API_KEY, timeout=self._timeout(),
+                                                 max_retries=self._max_retries)
+            return self._async_client
+
+
+class _Lease:
+    """A request's slot on a backend. Streamed tokens count down its outstanding estimate."""
+
+    def __init__(self, router, backend, prefill, completion):
+        self.router = router
+        self.backend = backend
+        self.prefill = prefill
+        self.remaining = prefill + completion
+        self.released = False
+
+    def token(self, first=False):
+        done = (self.prefill if first else 0) + 1
+        with self.router._cond:
+            if self.released:
+                return
+            done = min(done, self.remaining)
+            self.remaining -= done
+            self.backend.outstanding -= done
+            self.backend.stats["tokens"] += 1
+
+    def release(self, failed=False):
+        self.router._release(self, failed)
+
+
+class _RoutedStream:
+    """A backend's chat stream whose first chunk has already arrived; releases its slot when done or closed."""
+
+    def __init__(self, upstream, iterator, first, lease):
+        self.upstream = upstream
+        self._iterator = iterator
+        self._first = first
+        self.lease = lease
+
+    def __iter__(self):
+        try:
+            if self._first is not _END:
+                self.lease.token(first=True)
+                yield self._first
+            for chunk in self._iterator:
+                self.lease.token()
+                yield chunk
+        except Exception:
+            self.lease.release(failed=True)
+            raise
+        finally:
+            self.lease.release()
+
+    def close(self):
+        self.lease.release()  # First, so the read this interrupts isn't counted as a backend failure
+        self.upstream.close()
+
+
+class _AsyncRoutedStream:
+    def __init__(self, upstream, iterator, first, lease):
+        self.upstream = upstream
+        self._iterator = iterator
+        self._first = first
+        self.lease = lease
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        try:
+            if self._first is not _END:
+                self.lease.token(first=True)
+                yield self._first
+            async for chunk in self._iterator:
+                self.lease.token()
+                yield chunk
+        except Exception:
+            self.lease.release(failed=True)
+            raise
+        finally:
+            self.lease.release()
+
+    async def close(self):
+        self.lease.release()
+        await self.upstream.close()
+
+
+class LLMRouter:
+    """Spreads LLM requests over a pool of OpenAI-compatible backends.
+
+    A request goes to the backend with the fewest estimated outstanding tokens,
+    among those under their concurrency limit; when all are full it waits for a
+    slot. A user's requests stick to the backend that served them last (for
+    LLM_AFFINITY_TTL), so the server's prefix cache still holds their prompt.
+    Connection errors, timeouts, 429s and 5xx before the first token move the
+    request to another backend, and the failed one is skipped for
+    LLM_BACKEND_COOLDOWN seconds.
+    """
+
+    def __init__(self, backends=LLM_BACKENDS, cooldown=LLM_BACKEND_COOLDOWN, affinity_ttl=LLM_AFFINITY_TTL,
+                 queue_timeout=LLM_QUEUE_TIMEOUT):
+        self.backends = [Backend(url, limit, len(backends) > 1) for url, limit in backends]
+        self.cooldown = cooldown
+        self.affinity_ttl = affinity_ttl
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._affinity = {}  # user_id -> (backend, expires_at)
+        self.stats = {"requests": 0, "failovers": 0, "affinity_hits": 0, "queued": 0}
+
+    def _pick(self, user_id, exclude, in_order):
+        now = time.monotonic()
+        untried = [backend for backend in self.backends if backend not in exclude]
+        healthy = [backend for backend in untried if backend.unhealthy_until <= now]
+        # When everything left has failed recently, try it anyway rather than fail the request
+        free = [backend for backend in healthy or untried if backend.in_flight < backend.limit]
+        if not free:
+            return None
+        pinned = self._affinity.get(user_id) if user_id else None
+        if pinned is not None and pinned[1] > now and pinned[0] in free:
+            self.stats["affinity_hits"] += 1
+            return pinned[0]
+        if in_order:
+            return free[0]
+        return min(free, key=lambda backend: (backend.outstanding, backend.in_flight))
+
+    def _lease(self, user_id, prefill, completion, exclude, block=True, in_order=False):
+        """Reserve a slot on the best backend not in `exclude`, waiting for one if all are full.
+
+        Returns None without blocking when `block` is false and nothing is free.
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        with self._cond:
+            queued = False
+            while True:
+                if len(exclude) >= len(self.backends):
+                    raise NoBackendAvailable("Every LLM backend failed this request.")
+                backend = self._pick(user_id, exclude, in_order)
+                if backend is not None:
+                    break
+                remaining = deadline - time.monotonic()
+                if not block:
+                    return None
+                if remaining <= 0:
+                    raise NoBackendAvailable(f"No LLM backend slot freed up within {self.queue_timeout:.0f}s.")
+                if not queued:
+                    self.stats["queued"] += 1
+                    queued = True
+                self._cond.wait(remaining)
+            backend.in_flight += 1
+            backend.outstanding += prefill + completion
+            backend.stats["requests"] += 1
+            self.stats["requests"] += 1
+            if user_id:
+                now = time.monotonic()
+                self._affinity[user_id] = (backend, now + self.affinity_ttl)
+                if len(self._affinity) > AFFINITY_PRUNE_SIZE:
+                    self._affinity = {user: pin for user, pin in self._affinity.items() if pin[1] > now}
+        return _Lease(self, backend, prefill, completion)
+
+    def _release(self, lease, failed):
+        with self._cond:
+            if lease.released:
+                return
+            lease.released = True
+            backend = lease.backend
+            backend.in_flight -= 1
+            backend.outstanding -= lease.remaining
+            if failed:
+                backend.stats["failures"] += 1
+                backend.unhealthy_until = time.monotonic() + self.cooldown
+            self._cond.notify_all()
+
+    def _failed_over(self, lease, error):
+        with self._cond:
+            self.stats["failovers"] += 1
+        print(f"[WARN] LLM backend {lease.backend.url} failed, trying another: {error}")
+
+    def create(self, params):
+        """chat.completions.create(**params) on a pooled backend. `user` selects affinity and isn't sent."""
+        params = dict(params)
+        user_id = params.pop("user", None)
+        prefill, completion = estimate_tokens(params)
+        tried = []
+        while True:
+            lease = self._lease(user_id, prefill, completion, tried)
+            tried.append(lease.backend)
+            upstream = None
+            try:
+                completions = lease.backend.client().chat.completions
+                if not params.get("stream"):
+                    result = completions.create(**params)
+                    lease.release()
+                    return result
+                upstream = completions.create(**params)
+                iterator = iter(upstream)
+                first = next(iterator, _END)  # Fail over only while nothing has been sent on
+            except BaseException as e:
+                if upstream is not None:
+                    _close_quietly(upstream.close)
+                if not isinstance(e, Exception) or not _retryable(e) or len(tried) >= len(self.backends):
+                    lease.release(failed=isinstance(e, Exception) and _retryable(e))
+                    raise
+                lease.release(failed=True)
+                self._failed_over(lease, e)
+                continue
+            return _RoutedStream(upstream, iterator, first, lease)
+
+    def embed(self, params):
+        """embeddings.create(**params), on the first healthy backend in pool order.
+
+        Embeddings have to come from one model to be comparable, so these aren't balanced.
+        """
+        tried = []
+        while True:
+            lease = self._lease(None, 0, 0, tried, in_order=True)
+            tried.append(lease.backend)
+            try:
+                result = lease.backend.client().embeddings.create(**params)
+            except Exception as e:
+                lease.release(failed=_retryable(e))
+                if not _retryable(e) or len(tried) >= len(self.backends):
+                    raise
+                self._failed_over(lease, e)
+                continue
+            lease.release()
+            return result
+
+    async def _alease(self, user_id, prefill, completion, exclude):
+        """_lease() without blocking the event loop. If the caller is cancelled while
+        waiting, the slot the worker thread still goes on to take is given back."""
+        lease = self._lease(user_id, prefill, completion, exclude, block=False)
+        if lease is not None:
+            return lease
+        waiter = asyncio.ensure_future(asyncio.to_thread(self._lease, user_id, prefill, completion, list(exclude)))
+        try:
+            return await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            waiter.add_done_callback(
+                lambda done: done.result().release() if not done.cancelled() and done.exception() is None else None
+            )
+            raise
+
+    async def acreate(self, params):
+        """create() for asyncio callers. Cancelling it at any point gives the backend slot back."""
+        params = dict(params)
+        user_id = params.pop("user", None)
+        prefill, completion = estimate_tokens(params)
+        tried = []
+        while True:
+            lease = await self._alease(user_id, prefill, completion, tried)
+            tried.append(lease.backend)
+            upstream = None
+            try:
+                completions = lease.backend.async_client().chat.completions
+                if not params.get("stream"):
+                    result = await completions.create(**params)
+                    lease.release()
+                    return result
+                upstream = await completions.create(**params)
+                iterator = upstream.__aiter__()
+                try:
+                    first = await iterator.__anext__()
+                except StopAsyncIteration:
+                    first = _END
+            except BaseException as e:  # Including CancelledError, e.g. the client disconnected
+                if upstream is not None:
+                    await _aclose_quietly(upstream)
+                if not isinstance(e, Exception) or not _retryable(e) or len(tried) >= len(self.backends):
+                    lease.release(failed=isinstance(e, Exception) and _retryable(e))
+                    raise
+                lease.release(failed=True)
+                self._failed_over(lease, e)
+                continue
+            return _AsyncRoutedStream(upstream, iterator, first, lease)
+
+    def get_stats(self):
+        now = time.monotonic()
+        with self._cond:
+            stats = dict(self.stats)
+            stats["pinned_users"] = sum(1 for _, expires in self._affinity.values() if expires > now)
+            stats["backends"] = [
+                {"url": backend.url, "limit": backend.limit, "in_flight": backend.in_flight,
+                 "outstanding_tokens": backend.outstanding, "healthy": backend.unhealthy_until <= now, **backend.stats}
+                for backend in self.backends
+            ]
+        return stats
+
+
+class RoutedClient:
+    """The parts of the OpenAI client this project uses, served by an LLMRouter."""
+
+    def __init__(self, router):
+        self.router = router
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=lambda **params: router.create(params)))
+        self.embeddings = types.SimpleNamespace(create=lambda **params: router.embed(params))
+
+
+class AsyncRoutedClient:
+    """RoutedClient for asyncio callers."""
+
+    def __init__(self, router):
+        self.router = router
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=lambda **params: router.acreate(params)))
+
+
+llm_router = LLMRouter()
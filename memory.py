@@ -0,0 +1,232 @@
+import atexit
+import collections
+import threading
+import time
+from datetime import datetime
+from config import HISTORY_DB_PATH, MEMORY_FLUSH_MS, MEMORY_FLUSH_SIZE, MEMORY_MAX_ATTEMPTS
+from embeddings import get_embeddings
+from history import HistoryStore
+from resources import get_chat_collection, registry
+
+STATS_WINDOW = 100  # Flushes kept for the rolling latency stats
+DEAD_LETTER_SIZE = 1000  # Messages kept after giving up on writing them
+
+
+class MemoryWriter:
+    """Write-behind queue for chat memory.
+
+    add() returns immediately; a background thread writes queued messages to Chroma
+    in batches (one embedding call and one `add` per batch) once MEMORY_FLUSH_SIZE
+    messages are waiting or the oldest has waited MEMORY_FLUSH_MS. Readers call
+    flush(user_id) first, so a user's next turn always sees their previous one.
+    A message whose batch has failed `max_attempts` times is moved to `dead_letters`
+    so it can't hold up everyone else's writes.
+    """
+
+    def __init__(self, flush_size=MEMORY_FLUSH_SIZE, flush_interval=MEMORY_FLUSH_MS / 1000, max_attempts=MEMORY_MAX_ATTEMPTS):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._queue = []  # (id, user_id, role, content, enqueued_at, seq, failed_attempts)
+        self.dead_letters = collections.deque(maxlen=DEAD_LETTER_SIZE)
+        self._pending = collections.Counter()  # Per-user messages queued or being written
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # One batch in flight at a time
+        self._thread = None
+        self._last_timestamp = 0.0
+        self._flush_latencies = collections.deque(maxlen=STATS_WINDOW)
+        self.stats = {"enqueued": 0, "written": 0, "flushes": 0, "failed_flushes": 0, "dead_lettered": 0, "max_depth": 0}
+
+    def new_id(self, user_id):
+        """Chroma IDs keep the existing `<user_id>_<timestamp>` shape, made strictly increasing."""
+        with self._cond:
+            timestamp = max(datetime.now().timestamp(), self._last_timestamp + 1e-6)
+            self._last_timestamp = timestamp
+        return f"{user_id}_{timestamp}"
+
+    def add(self, _id, user_id, role, content, seq):
+        """Queue a message for Chroma and return without waiting for the write."""
+        with self._cond:
+            self._queue.append((_id, user_id, role, content, time.monotonic(), seq, 0))
+            self._pending[user_id] += 1
+            self.stats["enqueued"] += 1
+            self.stats["max_depth"] = max(self.stats["max_depth"], len(self._queue))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="memory-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _due(self):
+        if not self._queue:
+            return False
+        return len(self._queue) >= self.flush_size or time.monotonic() - self._queue[0][4] >= self.flush_interval
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue)
+                # add() notifies on every message; keep waiting until a threshold is actually met
+                while self._queue and not self._due():
+                    self._cond.wait(self.flush_interval - (time.monotonic() - self._queue[0][4]))
+            try:
+                self._write_pending()
+            except Exception as e:
+                print(f"[WARN] Memory flush failed, will retry: {e}")
+                time.sleep(self.flush_interval)
+
+    def _write_pending(self, extra_texts=()):
+        """Write everything queued as one batch. Returns embeddings for `extra_texts`, computed in the same call."""
+        with self._flush_lock:
+            with self._cond:
+                if self._queue and self._queue[0][6]:
+                    # Failed messages sit at the head; retry them one at a time so one bad one can't sink the rest
+                    batch, self._queue = self._queue[:1], self._queue[1:]
+                else:
+                    batch, self._queue = self._queue, []
+            if not batch:
+                return get_embeddings(list(extra_texts)) if extra_texts else []
+            started = time.perf_counter()
+            try:
+                vectors = get_embeddings([item[3] for item in batch] + list(extra_texts))
+                get_chat_collection().add(
+                    documents=[item[3] for item in batch],
+                    metadatas=[{"user_id": user_id, "role": role, "seq": seq} for _, user_id, role, _, _, seq, _ in batch],
+                    embeddings=vectors[:len(batch)],
+                    ids=[item[0] for item in batch],
+                )
+            except Exception as e:
+                self._requeue_failed(batch, e)
+                raise
+            with self._cond:
+                self._done(batch)
+                self.stats["written"] += len(batch)
+                self.stats["flushes"] += 1
+                self._flush_latencies.append(time.perf_counter() - started)
+            return vectors[len(batch):]
+
+    def _done(self, items):
+        for item in items:
+            self._pending[item[1]] -= 1
+            if not self._pending[item[1]]:
+                del self._pending[item[1]]
+
+    def _requeue_failed(self, batch, error):
+        """Put a failed batch back at the head of the queue, dead-lettering messages out of attempts."""
+        retry, dead = [], []
+        for item in batch:
+            item = item[:6] + (item[6] + 1,)
+            (dead if item[6] >= self.max_attempts else retry).append(item)
+        with self._cond:
+            self._queue = retry + self._queue  # Keep order; the writer thread retries
+            self.stats["failed_flushes"] += 1
+            if dead:
+                self.dead_letters.extend(dead)
+                self._done(dead)
+                self.stats["dead_lettered"] += len(dead)
+        if dead:
+            print(f"[WARN] Gave up writing {len(dead)} message(s) to chat memory after {self.max_attempts} attempts: {error}")
+
+    def flush(self, user_id=None, extra_texts=()):
+        """Make queued writes visible before a read.
+
+        With a user_id, only waits if that user has something queued or in flight.
+        Any `extra_texts` (e.g. the question about to be searched for) are embedded in
+        the same upstream call as the flushed messages, and their vectors returned.
+        If the writes keep failing, this returns once they are dead-lettered instead of raising.
+        """
+        with self._cond:
+            needed = self._pending.get(user_id) if user_id is not None else bool(self._queue)
+        if not needed:
+            return get_embeddings(list(extra_texts)) if extra_texts else []
+        while True:
+            try:
+                vectors = self._write_pending(extra_texts)
+            except Exception:
+                vectors = None  # Retried until it succeeds or the messages are dead-lettered
+            with self._cond:
+                done = not (self._pending.get(user_id) if user_id is not None else self._queue)
+            if done:
+                if vectors is None:
+                    return get_embeddings(list(extra_texts)) if extra_texts else []
+                return vectors
+
+    def get_stats(self):
+        with self._cond:
+            stats = dict(self.stats)
+            stats["queue_depth"] = len(self._queue)
+            stats["dead_letters"] = len(self.dead_letters)
+            latencies = list(self._flush_latencies)
+        stats["flush_ms_avg"] = round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0
+        stats["flush_ms_max"] = round(max(latencies) * 1000, 2) if latencies else 0.0
+        return stats
+
+
+def _history_from_chroma(user_id):
+    """One-time import of a user's messages stored before the history store existed."""
+    results = get_chat_collection().get(where={"user_id": user_id}, include=["documents", "metadatas"])
+    history = []
+    for doc, meta, _id in zip(results["documents"], results["metadatas"], results["ids"]):
+        try:
+            timestamp = float(_id.split("_")[-1])
+        except Exception:
+            timestamp = 0
+        msg = doc[0] if isinstance(doc, list) and doc else doc
+        history.append((timestamp, meta.get("role", "user"), msg, _id))
+    return history
+
+
+memory_writer = MemoryWriter()
+# Opened (and its schema created) on first use or during warm-up, not at import
+registry.register("history_store", lambda: HistoryStore(HISTORY_DB_PATH, backfill=_history_from_chroma))
+
+
+def get_history_store():
+    """Shared SQLite store of each user's ordered chat history."""
+    return registry.get("history_store")
+
+
+@atexit.register
+def _flush_on_shutdown():
+    try:
+        memory_writer.flush()
+    except Exception as e:
+        print(f"[WARN] Could not flush chat memory on shutdown: {e}")
+
+
+def store_message(user_id, role, content):
+    """Store a message in the history store and, written behind the request, in ChromaDB."""
+    store_messages(user_id, [(role, content)])
+
+
+def store_messages(user_id, messages):
+    """Store several (role, content) messages, in order. Returns their history sequence numbers."""
+    ids = [memory_writer.new_id(user_id) for _ in messages]
+    seqs = get_history_store().append(user_id, [(role, content, _id) for (role, content), _id in zip(messages, ids)])
+    for (role, content), _id, seq in zip(messages, ids, seqs):
+        memory_writer.add(_id, user_id, role, content, seq)
+    return seqs
+
+
+def replace_with_summary(user_id, rows, summary):
+    """Swap (seq, chroma_id) rows for a summary in one history transaction, then mirror it in ChromaDB."""
+    _id = memory_writer.new_id(user_id)
+    seq = get_history_store().replace_with_summary(user_id, [seq for seq, _ in rows], summary, _id)
+    chroma_ids = [chroma_id for _, chroma_id in rows if chroma_id]
+    if chroma_ids:
+        memory_writer.flush(user_id)  # A still-queued message would otherwise be added back after the delete
+        get_chat_collection().delete(ids=chroma_ids)
+    memory_writer.add(_id, user_id, "summary", summary, seq)
+    return seq
+
+
+def recall(user_id, question, num_matches=3):
+    """Past messages most similar to `question`, best match first."""
+    # Land this user's queued turns first; the question is embedded in the same call
+    question_embedding, = memory_writer.flush(user_id, extra_texts=[question])
+    results = get_chat_collection().query(
+        query_embeddings=[question_embedding],
+        n_results=num_matches,
+        where={"user_id": user_id}
+    )
+    documents = results.get("documents") or [[]]
+    return [doc for doc in documents[0] if doc]
@@ -0,0 +1,136 @@
+import threading
+import time
+from config import CHROMA_COLLECTION, CHROMA_DB_PATH, WARM_UP_RESOURCES
+
+
+class LazyResource:
+    """A shared object (model, client, collection...) built on first use and then cached."""
+
+    def __init__(self, name, factory):
+        self.name = name
+        self._factory = factory
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.load_seconds = None
+        self.error = None
+
+    @property
+    def warm(self):
+        return self._loaded
+
+    def get(self):
+        """Return the resource, building it if this is the first call. Concurrent callers wait for one build."""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    started = time.perf_counter()
+                    try:
+                        self._value = self._factory()
+                    except Exception as e:
+                        self.error = f"{type(e).__name__}: {e}"
+                        raise
+                    self.load_seconds = time.perf_counter() - started
+                    self.error = None
+                    self._loaded = True
+        return self._value
+
+    def reset(self):
+        """Forget the built object so the next get() builds a new one."""
+        with self._lock:
+            self._value = None
+            self._loaded = False
+
+
+class ResourceRegistry:
+    """Named lazy resources, so importing a module never pays for models or network clients."""
+
+    def __init__(self):
+        self._resources = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory):
+        """Register a factory under `name`. Re-registering an existing name keeps the first one."""
+        with self._lock:
+            if name not in self._resources:
+                self._resources[name] = LazyResource(name, factory)
+            return self._resources[name]
+
+    def get(self, name):
+        return self._resources[name].get()
+
+    def reset(self, name):
+        """Drop a resource that has gone bad (e.g. a broken worker pool); it is rebuilt on next use."""
+        self._resources[name].reset()
+
+    def warm_up(self, names=None, background=True):
+        """Build resources ahead of the first request. Failures are recorded in status(), not raised."""
+        names = [name for name in (names if names is not None else WARM_UP_RESOURCES) if name in self._resources]
+
+        def run():
+            for name in names:
+                try:
+                    self._resources[name].get()
+                except Exception as e:
+                    print(f"[WARN] Warm-up of {name} failed: {e}")
+
+        if not background:
+            run()
+            return None
+        thread = threading.Thread(target=run, name="resource-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self):
+        """Report which resources are warm, how long they took to load, and any load error."""
+        return {
+            name: {
+                "warm": resource.warm,
+                "load_seconds": round(resource.load_seconds, 3) if resource.load_seconds is not None else None,
+                "error": resource.error,
+            }
+            for name, resource in self._resources.items()
+        }
+
+
+registry = ResourceRegistry()
+
+
+def _create_llm_client():
+    from llm_router import RoutedClient, llm_router
+    for backend in llm_router.backends:
+        backend.client()
+    return RoutedClient(llm_router)
+
+
+def _create_async_llm_client():
+    from llm_router import AsyncRoutedClient, llm_router
+    for backend in llm_router.backends:
+        backend.async_client()
+    return AsyncRoutedClient(llm_router)
+
+
+def _create_chat_collection():
+    import chromadb
+    chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
+    return chroma_client.get_or_create_collection(CHROMA_COLLECTION)
+
+
+registry.register("llm_client", _create_llm_client)
+registry.register("async_llm_client", _create_async_llm_client)
+registry.register("chat_collection", _create_chat_collection)
+
+
+def get_llm_client():
+    """Shared OpenAI-compatible client, balanced over the LLM_BACKENDS pool."""
+    return registry.get("llm_client")
+
+
+def get_async_llm_client():
+    """Shared AsyncOpenAI client, for the ASGI server's event loop."""
+    return registry.get("async_llm_client")
+
+
+def get_chat_collection():
+    """Shared Chroma collection holding chat memory."""
+    return registry.get("chat_collection")
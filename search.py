@@ -0,0 +1,184 @@
+import collections
+import os
+import re
+import threading
+import time
+from config import (
+    SEARCH_API_URL,
+    SEARCH_CACHE_SIZE,
+    SEARCH_POOL_SIZE,
+    SEARCH_STALE_SECONDS,
+    SEARCH_TIMEOUT,
+    SEARCH_TTL_FRESH,
+    SEARCH_TTL_NEGATIVE,
+    SEARCH_TTL_STABLE,
+)
+from resources import registry
+
+STATS_WINDOW = 100  # Upstream fetches kept for the rolling latency average
+NO_RESULTS = "No relevant search results found."
+# Queries mentioning any of these go stale quickly (news, scores, weather, prices)
+FRESH_WORDS = {"latest", "news", "today", "tonight", "yesterday", "now", "current", "live", "breaking",
+               "score", "scores", "weather", "forecast", "price", "prices", "stock", "stocks", "week", "recent"}
+
+
+class SearchError(Exception):
+    """The search backend failed or refused the request."""
+
+
+def _create_search_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=SEARCH_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Accept": "application/json", "X-Subscription-Token": os.getenv("BRAVE_API_KEY") or ""})
+    return session
+
+
+registry.register("search_session", _create_search_session)
+
+
+def normalize_query(query):
+    """Cache key for a query: lowercased, whitespace collapsed, surrounding quotes and punctuation dropped."""
+    return " ".join(query.lower().split()).strip(" \"'.,!?")
+
+
+def freshness_ttl(query):
+    """Seconds a result stays fresh: short for news-like queries, long for stable facts."""
+    return SEARCH_TTL_FRESH if FRESH_WORDS & set(re.findall(r"[a-z]+", query.lower())) else SEARCH_TTL_STABLE
+
+
+def fetch_results(query):
+    """Query the search API and format the top five results. Raises SearchError on failure."""
+    import requests
+    try:
+        response = registry.get("search_session").get(
+            SEARCH_API_URL, params={"q": query, "count": 5}, timeout=SEARCH_TIMEOUT
+        )
+    except requests.RequestException as e:
+        raise SearchError(str(e)) from e
+    if response.status_code != 200:
+        raise SearchError(f"Unable to fetch results ({response.status_code})")
+
+    try:
+        data = response.json()
+    except ValueError as e:
+        raise SearchError(f"Unreadable search response: {e}") from e
+    # ✅ Ensure the "web" field exists and contains valid search results
+    if "web" not in data or "results" not in data["web"]:
+        return NO_RESULTS
+
+    parsed_results = []
+    for result in data["web"]["results"][:5]:  # Limit to top 5 results
+        title = result.get("title", "No Title")
+        url = result.get("url", "No URL")
+        description = result.get("description", "No Description")
+        parsed_results.append(f"Title: {title}\nURL: {url}\nSummary: {description}\n")
+
+    return "\n".join(parsed_results) if parsed_results else NO_RESULTS
+
+
+class SearchCache:
+    """TTL cache of formatted search results, keyed by normalized query.
+
+    Fresh entries are returned as-is. Past their TTL an entry is still served for
+    `stale_seconds` while one background refresh replaces it (stale-while-revalidate);
+    after that the lookup blocks on a new fetch. Queries with no results are cached
+    for the shorter `negative_ttl`. Errors are never cached, but an old entry is
+    served instead of the error when there is one.
+    """
+
+    def __init__(self, fetch=fetch_results, max_entries=SEARCH_CACHE_SIZE, stale_seconds=SEARCH_STALE_SECONDS,
+                 negative_ttl=SEARCH_TTL_NEGATIVE):
+        self.fetch = fetch
+        self.max_entries = max_entries
+        self.stale_seconds = stale_seconds
+        self.negative_ttl = negative_ttl
+        self._entries = collections.OrderedDict()  # key -> (fresh_until, results)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._fetch_seconds = collections.deque(maxlen=STATS_WINDOW)
+        self.stats = {"hits": 0, "stale_hits": 0, "negative_hits": 0, "misses": 0,
+                      "refreshes": 0, "refresh_errors": 0, "errors": 0, "saved_ms": 0.0}
+
+    def search(self, query):
+        """Formatted results for `query`, from the cache when possible."""
+        key = normalize_query(query)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry[0] + self.stale_seconds:
+                self._entries.move_to_end(key)
+                fresh = now < entry[0]
+                self.stats["hits" if fresh else "stale_hits"] += 1
+                if entry[1] == NO_RESULTS:
+                    self.stats["negative_hits"] += 1
+                if self._fetch_seconds:
+                    self.stats["saved_ms"] += sum(self._fetch_seconds) / len(self._fetch_seconds) * 1000
+                refresh = not fresh and key not in self._refreshing
+                if refresh:
+                    self._refreshing.add(key)
+            else:
+                self.stats["misses"] += 1
+                refresh = None
+        if refresh is None:
+            try:
+                return self._fetch_and_store(key, query)
+            except SearchError as e:
+                with self._lock:
+                    self.stats["errors"] += 1
+                if entry is not None:
+                    return entry[1]  # Too old to serve normally, but better than nothing
+                return f"Error: {e}"
+        if refresh:
+            threading.Thread(target=self._refresh, args=(key, query), name="search-refresh", daemon=True).start()
+        return entry[1]
+
+    def _fetch_and_store(self, key, query):
+        started = time.perf_counter()
+        results = self.fetch(query)
+        ttl = self.negative_ttl if results == NO_RESULTS else freshness_ttl(query)
+        with self._lock:
+            self._fetch_seconds.append(time.perf_counter() - started)
+            self._entries[key] = (time.monotonic() + ttl, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return results
+
+    def _refresh(self, key, query):
+        try:
+            self._fetch_and_store(key, query)
+            outcome = "refreshes"
+        except Exception as e:
+            print(f"[WARN] Background search refresh failed for {query!r}: {e}")
+            outcome = "refresh_errors"
+        with self._lock:
+            self._refreshing.discard(key)
+            self.stats[outcome] += 1
+
+    def get_stats(self):
+        """Report hit ratio, how much upstream latency hits saved, and the average fetch time."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+            fetches = list(self._fetch_seconds)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["stale_hits"]) / lookups, 3) if lookups else 0.0
+        stats["saved_ms"] = round(stats["saved_ms"], 1)
+        stats["fetch_ms_avg"] = round(sum(fetches) / len(fetches) * 1000, 1) if fetches else 0.0
+        return stats
+
+
+search_cache = SearchCache()
+
+
+def web_search(query):
+    """Perform a web search using Brave Search API and return structured results."""
+    return search_cache.search(query)
+
+
+def get_stats():
+    return search_cache.get_stats()
@@ -1,19 +1,24 @@
 from flask import Flask, request, jsonify, Response, stream_with_context
-from CameraManager import camera_manager
-from tasks import process_chat_task 
-from animation_controller import start_thinking_animation, stop_thinking_animation
-from ai_processor import ask_t800
-from ai import DEFAULT_AGENT_NAME, ask_ai, ask_open_gpt
+from camera_routes import camera_bp
+from config import CHAT_FLUSH_BYTES, CHAT_FLUSH_MS, CHAT_SUPERSEDE
+from context_builder import context_builder
+from event_stream import FRAMINGS, EventBatcher
+from generations import generations
+from llm_cache import llm_cache
+from llm_router import llm_router
+from ai import DEFAULT_AGENT_NAME, ask_open_gpt, summarizer
+from memory import memory_writer
+from resources import registry
 import json
 import os
-import requests
+import search
+import tts
+from tasks import enqueue_chat, read_chat_events
+from voice import stream_voice_reply
 
 from dotenv import load_dotenv
-from vosk import Model, KaldiRecognizer
-import wave, json, io
-
-# Load once on startup
-asr_model = Model("/home/gh0st/t-800-server/vosk_model/vosk-model-small-en-us-0.15")
+from asr import recognizer_pool, read_wav_header, stream_transcribe, transcribe_wav_in_worker, STREAM_READ_SIZE
+import wave, json
 
 # Load environment variables from .env
 load_dotenv()
@@ -23,45 +28,73 @@ cert_path = os.path.join(BASE_DIR, "cert.pem")
 key_path = os.path.join(BASE_DIR, "key.pem")
 
 app = Flask(__name__)
+app.register_blueprint(camera_bp)
+
+
+def chat_batcher(framing=None):
+    """Event batcher for a chat stream. `?framing=binary` selects length-prefixed frames instead of NDJSON."""
+    return EventBatcher(CHAT_FLUSH_MS, CHAT_FLUSH_BYTES, framing if framing in FRAMINGS else "ndjson")
+
+
+def streamed_generation(body, mimetype, generation):
+    """Stream `body`; if the client goes away first, cancel the generation so the LLM stops right away."""
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    # Runs once the response is closed; after a complete reply the generation is already finished and this is a no-op
+    response.call_on_close(lambda: generation.finish(completed=False))
+    return response
+
 
-def generate_frames():
-    """Yield the latest frame from the singleton camera instance."""
-    while True:
-        frame = camera_manager.get_frame()
-        if frame is None:
-            continue
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+@app.route("/healthz")
+def healthz():
+    """Report liveness and which lazily loaded resources are warm."""
+    return jsonify({"status": "ok", "resources": registry.status()})
 
-@app.route('/stream')
-def stream():
-    """Serve the MJPEG camera stream."""
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route("/asr", methods=["POST"])
 def asr_transcribe_raw():
-    print("P")
     # read raw body bytes
     audio_data = request.get_data()
 
     # validate or open as WAV
-    import io, wave, json
     try:
-        wf = wave.open(io.BytesIO(audio_data), "rb")
-    except Exception as e:
+        text, stats = transcribe_wav_in_worker(audio_data)
+    except (wave.Error, EOFError) as e:
         return jsonify({"error": str(e)}), 400
 
-    rec = KaldiRecognizer(asr_model, wf.getframerate())
-    text = ""
-    while True:
-        data = wf.readframes(4000)
-        if len(data) == 0:
-            break
-        if rec.AcceptWaveform(data):
-            text += json.loads(rec.Result()).get("text", "") + " "
-    text += json.loads(rec.FinalResult()).get("text", "")
-    print("ASR Result:", text.strip())
-    return jsonify({"text": text.strip()})
+    print("ASR Result:", text, stats)
+    return jsonify({"text": text, "stats": stats})
+
+
+@app.route("/asr/stats")
+def asr_stats():
+    """Report recognizer pool hit rate, queue wait and real-time factor."""
+    return jsonify(recognizer_pool.get_stats())
+
+
+@app.route("/asr/stream", methods=["POST"])
+def asr_transcribe_stream():
+    """Transcribe audio while it is still uploading, replying with NDJSON partial/final events.
+
+    The body is a WAV stream (header first), or raw 16-bit mono PCM when `?rate=` is given.
+    Send it with chunked transfer encoding so recognition starts on the first chunk.
+    """
+    stream = request.stream
+    rate = request.args.get("rate", type=int)
+    if rate is None:
+        try:
+            rate, channels, sample_width = read_wav_header(stream)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if channels != 1 or sample_width != 2:
+            return jsonify({"error": "Audio must be 16-bit mono PCM"}), 400
+
+    def generate():
+        chunks = iter(lambda: stream.read(STREAM_READ_SIZE), b"")
+        for event in stream_transcribe(chunks, rate):
+            if event["type"] == "done":
+                print("ASR Result:", event["text"])
+            yield json.dumps(event) + "\n"
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
 
 @app.route("/speak", methods=["POST"])
@@ -72,27 +105,47 @@ def speak_proxy():
         return jsonify({"error": "No text provided"}), 400
 
     try:
-        tts_response = requests.post(
-            "http://10.0.0.145:5004/speak",  # Windows TTS server
-            json={"text": text},
-            timeout=120,
-            stream=True
-        )
+        chunks, cache_status = tts.speak(text, data.get("voice"))
+    except tts.TTSError as e:
+        return jsonify({"error": str(e)}), 502
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        if tts_response.status_code != 200:
-            return jsonify({"error": "TTS server error"}), 502
+    response = Response(chunks, content_type="audio/wav")
+    response.headers["X-Cache"] = cache_status
+    return response
 
-        def generate():
-            for chunk in tts_response.iter_content(chunk_size=4096):
-                yield chunk
 
-        return Response(
-            generate(),
-            content_type="audio/wav"
-        )
+@app.route("/speak/stats")
+def speak_stats():
+    """Report TTS cache hit ratio and time to first audio byte."""
+    return jsonify(tts.get_stats())
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+
+@app.route("/memory/stats")
+def memory_stats():
+    """Report chat memory write-behind queue depth, flush latency and background summarization."""
+    return jsonify({**memory_writer.get_stats(), "summarizer": summarizer.get_stats()})
+
+@app.route("/llm/stats")
+def llm_stats():
+    """Report coalesced chat streams, cached deterministic LLM calls and load per LLM backend."""
+    return jsonify({**llm_cache.get_stats(), "router": llm_router.get_stats()})
+
+@app.route("/chat/generations/stats")
+def generation_stats():
+    """Report in-flight, completed and cancelled generations and the tokens cancelling saved."""
+    return jsonify(generations.get_stats())
+
+@app.route("/chat/context/stats")
+def chat_context_stats():
+    """Report prompt tokens per section and how much of each prompt matched the previous one."""
+    return jsonify(context_builder.get_stats())
+
+@app.route("/search/stats")
+def search_stats():
+    """Report web search cache hit ratio and the upstream latency hits saved."""
+    return jsonify(search.get_stats())
 
 @app.route("/chat", methods=["POST"])
 def chat():
@@ -106,12 +159,52 @@ def chat():
     agent_name = agent_data.get("name", DEFAULT_AGENT_NAME)
     system_prompt = agent_data.get("systemPrompt", None)
 
-    def generate():
-        for event in ask_open_gpt(user_id, message, agent_name, system_prompt, fromVoice=fromVoice):
-            yield json.dumps(event) + "\n"
-    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+    generation = generations.start(user_id, supersede=data.get("supersede", CHAT_SUPERSEDE))
+    batcher = chat_batcher(request.args.get("framing"))
+    events = ask_open_gpt(user_id, message, agent_name, system_prompt, fromVoice=fromVoice, generation=generation)
+    return streamed_generation(batcher.batch(events), batcher.mimetype, generation)
+
+
+@app.route("/chat/voice", methods=["POST"])
+def chat_voice():
+    """Like /chat for voice turns, but also streams synthesized audio for each sentence as it is generated."""
+    data = request.get_json()
+    user_id = data.get("userId", "default_user")
+    message = data.get("message", "")
+
+    agent_data = data.get("agent", {})
+    agent_name = agent_data.get("name", DEFAULT_AGENT_NAME)
+    system_prompt = agent_data.get("systemPrompt", None)
+
+    generation = generations.start(user_id, supersede=data.get("supersede", CHAT_SUPERSEDE))
+    batcher = chat_batcher(request.args.get("framing"))
+    events = stream_voice_reply(user_id, message, agent_name, system_prompt, voice=data.get("voice"), generation=generation)
+    return streamed_generation(batcher.batch(events), batcher.mimetype, generation)
+
+
+
+@app.route("/chat/task", methods=["POST"])
+def chat_task():
+    """Run a T-800 turn on a Celery worker and relay its events as they are published.
+
+    The task id is returned in X-Task-Id; GET /chat/task/<id> replays the stream from the start.
+    """
+    data = request.get_json()
+    user_id = data.get("userId", "default_user")
+    message = data.get("message", "")
+    task_id = enqueue_chat(user_id, message, voice=data.get("isFromVoice", False))
+    return relay_chat_task(task_id)
+
 
+@app.route("/chat/task/<task_id>")
+def relay_chat_task(task_id):
+    """Relay the events of a queued chat task, from the first one to its "done" event."""
+    batcher = chat_batcher(request.args.get("framing"))
+    response = Response(stream_with_context(batcher.batch(read_chat_events(task_id))), mimetype=batcher.mimetype)
+    response.headers["X-Task-Id"] = task_id
+    return response
 
 
 if __name__ == "__main__":
+    registry.warm_up()
     app.run(host="0.0.0.0", port=5000, debug=False, threaded=True)
@@ -0,0 +1,58 @@
+import collections
+import concurrent.futures
+import threading
+import time
+
+STATS_WINDOW = 100  # Runs kept for the rolling latency stats
+
+
+class BackgroundSummarizer:
+    """Runs `fold(user_id, **kwargs)` off the request path.
+
+    At most one fold runs per user; scheduling a user who is already being
+    summarized marks them for one more pass afterwards instead of queueing a
+    duplicate, so a burst of turns costs at most one extra run.
+    """
+
+    def __init__(self, fold, workers=1):
+        self.fold = fold
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summarizer")
+        self._lock = threading.Lock()
+        self._scheduled = {}  # user_id -> kwargs for a rerun, or None
+        self._durations = collections.deque(maxlen=STATS_WINDOW)
+        self.stats = {"scheduled": 0, "runs": 0, "folds": 0, "failures": 0}
+
+    def schedule(self, user_id, **kwargs):
+        """Ask for `user_id` to be summarized if needed. Returns immediately."""
+        with self._lock:
+            self.stats["scheduled"] += 1
+            if user_id in self._scheduled:
+                self._scheduled[user_id] = kwargs
+                return
+            self._scheduled[user_id] = None
+        self._executor.submit(self._run, user_id, kwargs)
+
+    def _run(self, user_id, kwargs):
+        while True:
+            started = time.perf_counter()
+            try:
+                if self.fold(user_id, **kwargs) is not None:
+                    self.stats["folds"] += 1
+            except Exception as e:
+                self.stats["failures"] += 1
+                print(f"[WARN] Summarizing history for {user_id} failed: {e}")
+            with self._lock:
+                self.stats["runs"] += 1
+                self._durations.append(time.perf_counter() - started)
+                kwargs = self._scheduled.pop(user_id)
+                if kwargs is None:
+                    return
+                self._scheduled[user_id] = None
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["running"] = len(self._scheduled)
+            durations = list(self._durations)
+        stats["run_ms_avg"] = round(sum(durations) / len(durations) * 1000, 1) if durations else 0.0
+        return stats
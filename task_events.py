@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+from config import TASK_EVENTS_MAXLEN, TASK_EVENTS_TIMEOUT, TASK_EVENTS_TTL, TASK_EVENTS_URL
+from resources import registry
+
+
+def _stream_key(task_id):
+    return f"chat:events:{task_id}"
+
+
+class RedisEventBus:
+    """Chat task events on a Redis Stream per task id.
+
+    Readers start from the beginning of the stream, so a client that connects
+    after the worker has started (or reconnects) still gets every event.
+    """
+
+    def __init__(self, url, ttl=TASK_EVENTS_TTL, maxlen=TASK_EVENTS_MAXLEN):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.maxlen = maxlen
+
+    def publish(self, task_id, event):
+        key = _stream_key(task_id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.xadd(key, {"event": json.dumps(event)}, maxlen=self.maxlen, approximate=True)
+        pipe.expire(key, self.ttl)  # Streams nobody reads still go away
+        pipe.execute()
+
+    def lock(self, name, timeout):
+        """A lock shared by every worker on this Redis; it expires after `timeout` seconds if its holder dies."""
+        return self.client.lock(f"chat:lock:{name}", timeout=timeout)
+
+    def read(self, task_id, timeout=TASK_EVENTS_TIMEOUT):
+        """Yield the task's events in order until its "done" event, or an error event after `timeout` idle seconds."""
+        key = _stream_key(task_id)
+        last_id = "0-0"
+        while True:
+            response = self.client.xread({key: last_id}, count=256, block=int(timeout * 1000))
+            if not response:
+                yield {"type": "error", "message": "Timed out waiting for the chat task."}
+                return
+            for entry_id, fields in response[0][1]:
+                last_id = entry_id
+                event = json.loads(fields[b"event"])
+                yield event
+                if event.get("type") == "done":
+                    return
+
+
+class MemoryEventBus:
+    """In-process stand-in for RedisEventBus (TASK_EVENTS_URL=memory://), for a single
+    process running tasks eagerly, e.g. development without Redis."""
+
+    def __init__(self, ttl=TASK_EVENTS_TTL):
+        self.ttl = ttl
+        self._streams = {}  # task_id -> (events, last update)
+        self._locks = {}
+        self._cond = threading.Condition()
+
+    def publish(self, task_id, event):
+        now = time.monotonic()
+        with self._cond:
+            events = self._streams.get(task_id, ([], now))[0]
+            events.append(event)
+            self._streams[task_id] = (events, now)
+            for stale in [key for key, (_, updated) in self._streams.items() if now - updated > self.ttl]:
+                del self._streams[stale]
+            self._cond.notify_all()
+
+    def lock(self, name, timeout):
+        with self._cond:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def read(self, task_id, timeout=TASK_EVENTS_TIMEOUT):
+        index = 0
+        while True:
+            with self._cond:
+                ready = self._cond.wait_for(lambda: len(self._streams.get(task_id, ([], 0))[0]) > index, timeout)
+                events = self._streams.get(task_id, ([], 0))[0][index:]
+            if not ready:
+                yield {"type": "error", "message": "Timed out waiting for the chat task."}
+                return
+            index += len(events)
+            for event in events:
+                yield event
+                if event.get("type") == "done":
+                    return
+
+
+def _create_task_event_bus():
+    if TASK_EVENTS_URL.startswith("memory://"):
+        return MemoryEventBus()
+    return RedisEventBus(TASK_EVENTS_URL)
+
+
+registry.register("task_event_bus", _create_task_event_bus)
+
+
+def get_event_bus():
+    """Shared event bus between Celery chat tasks and the server relaying them."""
+    return registry.get("task_event_bus")
@@ -1,13 +1,73 @@
-import time
+import threading
+import uuid
 from celery import Celery
-from ai_processor import ask_t800  # Import your AI processing function
+from config import CELERY_BROKER_URL, CELERY_RESULT_BACKEND
+from task_events import get_event_bus
+
+# Configure Celery with Redis. With a memory:// broker tasks run eagerly in this process.
+celery = Celery("tasks", broker=CELERY_BROKER_URL, backend=CELERY_RESULT_BACKEND)
+
+SUMMARY_LOCK_TIMEOUT = 300  # Seconds before a crashed worker's per-user summary lock expires
+
+# Queues, most urgent first. Run voice on its own worker so it never waits behind the others:
+#   celery -A tasks worker -Q voice -c 2
+#   celery -A tasks worker -Q chat,background
+QUEUE_PRIORITIES = {"voice": 0, "chat": 3, "background": 9}  # Redis transport: lower numbers are taken first
+
+celery.conf.update(
+    task_default_queue="chat",
+    task_routes={"tasks.summarize_history_task": {"queue": "background", "priority": QUEUE_PRIORITIES["background"]}},
+    broker_transport_options={"queue_order_strategy": "priority", "priority_steps": list(range(10)), "sep": ":"},
+    task_always_eager=CELERY_BROKER_URL.startswith("memory://"),
+)
 
-# Configure Celery with Redis
-celery = Celery("tasks", broker="redis://localhost:6379", backend="redis://localhost:6379")
 
 @celery.task(bind=True)
 def process_chat_task(self, user_id, question):
     """Run AI chat processing as a background task."""
-    time.sleep(1)  # Simulate slight delay
+    from ai_processor import ask_t800  # Imported here so loading the task module doesn't build the agent
     response = ask_t800(user_id, question)
     return response
+
+
+@celery.task(bind=True, ignore_result=True)
+def stream_chat_task(self, user_id, question):
+    """Run a T-800 turn, publishing its events to the task's event stream as they are generated."""
+    from ai_processor import stream_t800
+    bus = get_event_bus()
+    try:
+        for event in stream_t800(user_id, question):
+            bus.publish(self.request.id, event)
+    except Exception as e:
+        bus.publish(self.request.id, {"type": "error", "message": str(e)})
+        bus.publish(self.request.id, {"type": "done"})
+        raise
+
+
+@celery.task(ignore_result=True)
+def summarize_history_task(user_id, **kwargs):
+    """Fold a user's older history into the rolling summary, on the background queue.
+
+    Folds for one user are serialized across workers; a fold that waited re-reads
+    the history, so it only summarizes what the previous one left.
+    """
+    from ai import summarize_chat_history
+    with get_event_bus().lock(f"summarize:{user_id}", timeout=SUMMARY_LOCK_TIMEOUT):
+        summarize_chat_history(user_id, **kwargs)
+
+
+def enqueue_chat(user_id, question, voice=False):
+    """Queue a streamed T-800 turn and return its task id. Voice turns go ahead of everything else."""
+    queue = "voice" if voice else "chat"
+    if celery.conf.task_always_eager:
+        # Eager tasks run inline; give this one a thread so its events can be relayed as they come
+        task_id = str(uuid.uuid4())
+        threading.Thread(target=stream_chat_task.apply, kwargs={"args": (user_id, question), "task_id": task_id},
+                         name="chat-task", daemon=True).start()
+        return task_id
+    return stream_chat_task.apply_async(args=(user_id, question), queue=queue, priority=QUEUE_PRIORITIES[queue]).id
+
+
+def read_chat_events(task_id):
+    """Events published by the chat task `task_id`, from the first, ending with its "done" event."""
+    return get_event_bus().read(task_id)
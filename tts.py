@@ -0,0 +1,255 @@
+import asyncio
+import collections
+import hashlib
+import os
+import threading
+import time
+import unicodedata
+from config import (
+    TTS_CACHE_DIR,
+    TTS_CACHE_DISK_BYTES,
+    TTS_CACHE_MEMORY_BYTES,
+    TTS_CHUNK_SIZE,
+    TTS_POOL_SIZE,
+    TTS_URL,
+    TTS_VOICE,
+)
+from resources import registry
+
+STATS_WINDOW = 100  # Requests kept for the rolling time-to-first-byte averages
+
+
+class TTSError(Exception):
+    """The TTS backend refused or failed the request before any audio was sent."""
+
+
+def _create_tts_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=TTS_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _create_tts_async_client():
+    import httpx
+    return httpx.AsyncClient(timeout=httpx.Timeout(120, connect=5),
+                             limits=httpx.Limits(max_keepalive_connections=TTS_POOL_SIZE))
+
+
+registry.register("tts_session", _create_tts_session)
+registry.register("tts_async_client", _create_tts_async_client)
+
+
+def normalize_text(text):
+    """Canonical form used for cache keys: NFC, trimmed, internal whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(text, voice=None):
+    return hashlib.sha256(f"{voice or ''}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """Content-addressed WAV cache: a byte-bounded in-memory LRU in front of a byte-bounded disk directory."""
+
+    def __init__(self, directory=TTS_CACHE_DIR, memory_bytes=TTS_CACHE_MEMORY_BYTES, disk_bytes=TTS_CACHE_DISK_BYTES):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = collections.OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.wav")
+
+    def get(self, key, disk=True):
+        """Return (audio, tier) where tier is "memory" or "disk", or (None, None) on a miss.
+
+        With disk=False only the in-memory tier is checked, which never blocks on I/O.
+        """
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                return audio, "memory"
+        if not disk:
+            return None, None
+        try:
+            with open(self._path(key), "rb") as f:
+                audio = f.read()
+        except OSError:
+            return None, None
+        os.utime(self._path(key))  # Disk eviction is least-recently-used by mtime
+        self._remember(key, audio)
+        return audio, "disk"
+
+    def put(self, key, audio):
+        self._remember(key, audio)
+        if self.disk_bytes <= 0:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, self._path(key))
+            self._evict_disk()
+        except OSError as e:
+            print(f"[WARN] TTS cache write failed: {e}")
+
+    def _remember(self, key, audio):
+        if len(audio) > self.memory_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_size -= len(self._memory.pop(key))
+            self._memory[key] = audio
+            self._memory_size += len(audio)
+            while self._memory_size > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
+
+    def _evict_disk(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".wav"):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.disk_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+
+audio_cache = AudioCache()
+
+_stats_lock = threading.Lock()
+_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+_ttfb = {"hit": collections.deque(maxlen=STATS_WINDOW), "miss": collections.deque(maxlen=STATS_WINDOW)}
+
+
+def _record(outcome, ttfb):
+    with _stats_lock:
+        _stats[outcome] += 1
+        _ttfb["miss" if outcome == "misses" else "hit"].append(ttfb)
+
+
+def speak(text, voice=None):
+    """Synthesize `text`, serving repeats from the cache.
+
+    Returns (chunks, cache_status). On a miss the backend response is relayed as it
+    arrives and stored once it completes. Raises TTSError if the backend fails
+    before audio starts.
+    """
+    import requests
+    started = time.perf_counter()
+    voice = voice or TTS_VOICE
+    key = cache_key(text, voice)
+    audio, tier = audio_cache.get(key)
+    if audio is not None:
+        _record(f"{tier}_hits", time.perf_counter() - started)
+        return iter([audio]), tier
+
+    payload = {"text": text}
+    if voice:
+        payload["voice"] = voice
+    try:
+        tts_response = registry.get("tts_session").post(TTS_URL, json=payload, timeout=(5, 120), stream=True)
+    except requests.RequestException as e:
+        raise TTSError(str(e)) from e
+    if tts_response.status_code != 200:
+        tts_response.close()
+        raise TTSError(f"TTS server error ({tts_response.status_code})")
+
+    def relay():
+        parts = []
+        first = True
+        try:
+            for chunk in tts_response.iter_content(chunk_size=TTS_CHUNK_SIZE):
+                if first:
+                    _record("misses", time.perf_counter() - started)
+                    first = False
+                parts.append(chunk)
+                yield chunk
+            if first:
+                _record("misses", time.perf_counter() - started)
+        finally:
+            tts_response.close()
+        if parts:  # Only reached when the whole response was relayed
+            audio_cache.put(key, b"".join(parts))
+
+    return relay(), "miss"
+
+
+async def speak_async(text, voice=None):
+    """speak() for asyncio callers: same cache and stats, but the relay is an async iterator over httpx."""
+    import httpx
+    started = time.perf_counter()
+    voice = voice or TTS_VOICE
+    key = cache_key(text, voice)
+    audio, tier = audio_cache.get(key, disk=False)
+    if audio is None:
+        # The disk tier reads a file; keep that off the event loop
+        audio, tier = await asyncio.to_thread(audio_cache.get, key)
+    if audio is not None:
+        _record(f"{tier}_hits", time.perf_counter() - started)
+
+        async def cached():
+            yield audio
+        return cached(), tier
+
+    payload = {"text": text}
+    if voice:
+        payload["voice"] = voice
+    client = registry.get("tts_async_client")
+    try:
+        tts_response = await client.send(client.build_request("POST", TTS_URL, json=payload), stream=True)
+    except httpx.HTTPError as e:
+        raise TTSError(str(e)) from e
+    if tts_response.status_code != 200:
+        await tts_response.aclose()
+        raise TTSError(f"TTS server error ({tts_response.status_code})")
+
+    async def relay():
+        parts = []
+        first = True
+        try:
+            async for chunk in tts_response.aiter_bytes(TTS_CHUNK_SIZE):
+                if first:
+                    _record("misses", time.perf_counter() - started)
+                    first = False
+                parts.append(chunk)
+                yield chunk
+            if first:
+                _record("misses", time.perf_counter() - started)
+        finally:
+            await tts_response.aclose()
+        if parts:  # Only reached when the whole response was relayed
+            await asyncio.to_thread(audio_cache.put, key, b"".join(parts))
+
+    return relay(), "miss"
+
+
+def synthesize(text, voice=None):
+    """Return the complete WAV for `text` as bytes."""
+    chunks, _ = speak(text, voice)
+    return b"".join(chunks)
+
+
+def get_stats():
+    """Report cache hit ratio and average time to first audio byte for hits and misses."""
+    with _stats_lock:
+        stats = dict(_stats)
+        hit_ttfb = list(_ttfb["hit"])
+        miss_ttfb = list(_ttfb["miss"])
+    lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+    stats["hit_ratio"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+    stats["ttfb_ms_hit_avg"] = round(sum(hit_ttfb) / len(hit_ttfb) * 1000, 2) if hit_ttfb else 0.0
+    stats["ttfb_ms_miss_avg"] = round(sum(miss_ttfb) / len(miss_ttfb) * 1000, 2) if miss_ttfb else 0.0
+    return stats
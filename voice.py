@@ -0,0 +1,86 @@
+import base64
+import collections
+import concurrent.futures
+import re
+import tts
+from ai import DEFAULT_AGENT_NAME, ask_open_gpt
+from config import VOICE_MIN_SENTENCE_CHARS, VOICE_TTS_PARALLEL
+
+# A sentence ends at . ! or ? (plus any closing quotes/brackets) followed by whitespace, or at a newline
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n+")
+
+
+class SentenceSegmenter:
+    """Splits streamed text into speakable sentences as soon as each one is complete."""
+
+    def __init__(self, min_chars=VOICE_MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, text):
+        """Add streamed text and return any sentences it completed."""
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_BOUNDARY.finditer(self._buffer):
+            sentence = self._buffer[start:match.end()].strip()
+            if len(sentence) >= self.min_chars:
+                sentences.append(sentence)
+                start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self):
+        """Return whatever text is left once the stream ends."""
+        sentence, self._buffer = self._buffer.strip(), ""
+        return [sentence] if sentence else []
+
+
+def _audio_event(index, sentence, future):
+    try:
+        audio = future.result()
+    except Exception as e:
+        return {"type": "audio_error", "index": index, "text": sentence, "error": str(e)}
+    return {"type": "audio", "index": index, "text": sentence, "audio": base64.b64encode(audio).decode("ascii")}
+
+
+def stream_voice_reply(user_id, message, agent_name=DEFAULT_AGENT_NAME, system_prompt=None, voice=None, generation=None):
+    """Stream an LLM reply and its speech together.
+
+    Text events from ask_open_gpt are passed through unchanged. Each completed sentence
+    of the response is sent to the TTS backend while generation continues, with at most
+    VOICE_TTS_PARALLEL syntheses in flight, and "audio" events (base64 WAV) are yielded
+    strictly in sentence order as soon as each is ready. If the generation is cancelled,
+    queued syntheses are dropped rather than finished.
+    """
+    segmenter = SentenceSegmenter()
+    pending = collections.deque()  # (index, sentence, future) in sentence order
+    dispatched = 0
+
+    def ready_audio(block=False):
+        while pending and (block or pending[0][2].done()):
+            yield _audio_event(*pending.popleft())
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=VOICE_TTS_PARALLEL)
+
+    def dispatch(sentences):
+        nonlocal dispatched
+        for sentence in sentences:
+            pending.append((dispatched, sentence, executor.submit(tts.synthesize, sentence, voice)))
+            dispatched += 1
+
+    try:
+        for event in ask_open_gpt(user_id, message, agent_name, system_prompt, fromVoice=True, generation=generation):
+            yield event
+            if event["type"] == "response":
+                dispatch(segmenter.feed(event["content"]))
+            yield from ready_audio()
+        if generation is not None and generation.cancelled:
+            return  # Disconnected or superseded: nobody is listening for the rest of the audio
+        dispatch(segmenter.flush())
+        yield from ready_audio(block=True)
+    finally:
+        for _, _, future in pending:
+            future.cancel()
+        # Don't wait on syntheses still running for a client that has gone away
+        executor.shutdown(wait=False, cancel_futures=True)